@@ -0,0 +1,536 @@
+"""
+async_rag_system.py - Async Unified RAG Systems (vector and hybrid search)
+Coroutine counterparts of UnifiedRAGSystem and UnifiedRAGHybridSystem on
+azure.cosmos.aio and AsyncAzureOpenAI. Every search is awaited on the shared
+event loop (async_runtime.py), so one process keeps many analysts' queries in
+flight at once instead of parking a thread on each Cosmos DB / OpenAI call.
+Ranking, fusion, routing and formatting are inherited from the sync systems
+
+    from async_runtime import run_async
+    rag = AsyncUnifiedRAGHybridSystem()
+    results = run_async(rag.unified_search("active auto insurance", top_k=5))
+"""
+
+import asyncio
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+from client_registry import get_container, get_async_cosmos_client, get_async_openai_client
+from embedding_batcher import get_async_embedding_batcher
+from parallel_search import gather_searches
+from cosmos_lookup import AsyncPartitionKeyLookup
+from projections import CUSTOMER_FIELDS, POLICY_FIELDS, CUSTOMER_SEARCH_FIELDS, POLICY_SEARCH_FIELDS
+from vector_index import load_vector_index, vector_search_query, ranked_documents_query, order_ranked_documents
+from keyword_index import (
+    get_keyword_index, keyword_candidates_query, missing_keyword_ids,
+    customer_keyword_text, policy_keyword_text, CUSTOMER_KEYWORD_FIELDS, POLICY_KEYWORD_FIELDS
+)
+from change_feed_sync import start_change_feed_sync
+from fusion import HYBRID_CANDIDATE_MULTIPLIER, HYBRID_MAX_CANDIDATES, HYBRID_FUSION_STRATEGY
+from async_runtime import async_query
+import unified_rag_system as vector_config
+import unified_rag_hybrid_system as hybrid_config
+from unified_rag_system import UnifiedRAGSystem
+from unified_rag_hybrid_system import UnifiedRAGHybridSystem
+
+
+async def _vector_results(
+    container,
+    index,
+    fields: List[str],
+    query_embedding: List[float],
+    top_k: int,
+    score_field: str
+) -> List[Dict[str, Any]]:
+    """
+    Top_k documents by vector similarity, best first
+
+    Ranks with the local index when one is loaded (off the event loop, it is
+    CPU work) and reads only those documents; otherwise a VectorDistance query.
+    """
+    if index is not None:
+        hits = await asyncio.to_thread(index.search, query_embedding, top_k)
+        if not hits:
+            return []
+        query, parameters = ranked_documents_query(index.id_field, hits, fields)
+        return order_ranked_documents(await async_query(container, query, parameters), index.id_field, hits, score_field)
+
+    query, parameters = vector_search_query(fields, query_embedding, top_k, score_field)
+    return await async_query(container, query, parameters)
+
+
+async def _add_keyword_candidates(
+    results: List[Dict[str, Any]],
+    index,
+    query: str,
+    container,
+    fields: List[str],
+    query_embedding: List[float],
+    candidate_count: int,
+    score_field: str = 'vector_score'
+) -> List[Dict[str, Any]]:
+    """keyword_index.add_keyword_candidates on an azure.cosmos.aio container"""
+    missing = missing_keyword_ids(results, index, query, candidate_count)
+    if not missing:
+        return results
+
+    try:
+        keyword_query, parameters = keyword_candidates_query(
+            index.id_field, missing, fields, query_embedding, score_field
+        )
+        extra = await async_query(container, keyword_query, parameters)
+    except Exception as e:
+        print(f"⚠️  Could not fetch keyword candidates, using vector candidates only: {e}")
+        return results
+
+    return results + extra
+
+
+# ============================================================================
+# VECTOR SEARCH
+# ============================================================================
+
+class AsyncUnifiedRAGSystem(UnifiedRAGSystem):
+    """
+    UnifiedRAGSystem whose searches are coroutines
+
+    Result shapes, unified ranking and query routing are the sync system's.
+    Local vector indexes are shared with it and kept current by the same
+    change feed sync.
+    """
+
+    def __init__(self):
+        """Initialize async clients (shared per process) and local indexes"""
+        print("\n" + "=" * 80)
+        print("Initializing Async Unified RAG System...")
+        print("=" * 80)
+
+        self.openai_client = get_async_openai_client(
+            vector_config.AZURE_OPENAI_ENDPOINT,
+            vector_config.AZURE_OPENAI_KEY,
+            vector_config.AZURE_OPENAI_API_VERSION
+        )
+        self.embedder = get_async_embedding_batcher(
+            self.openai_client, vector_config.AZURE_OPENAI_DEPLOYMENT, vector_config.AZURE_OPENAI_ENDPOINT
+        )
+        print("✓ Azure OpenAI client initialized")
+
+        self.customer_cosmos_client = get_async_cosmos_client(vector_config.COSMOS_ret_ENDPOINT, vector_config.COSMOS_ret_KEY)
+        self.customer_database = self.customer_cosmos_client.get_database_client(vector_config.COSMOS_ret_DATABASE_NAME)
+        self.customer_container = self.customer_database.get_container_client(vector_config.COSMOS_ret_CONTAINER_NAME)
+        self.customer_lookup = AsyncPartitionKeyLookup(self.customer_container, CUSTOMER_FIELDS)
+        self.customer_index = load_vector_index(vector_config.COSMOS_ret_VECTOR_INDEX_PATH)
+        if self.customer_index is not None:
+            # The change feed sync polls on its own thread with the sync client
+            start_change_feed_sync("COSMOS_ret", get_container("COSMOS_ret"), self.customer_index)
+        print("✓ Customer database connected")
+
+        self.policy_cosmos_client = get_async_cosmos_client(vector_config.COSMOS_pol_ENDPOINT, vector_config.COSMOS_pol_KEY)
+        self.policy_database = self.policy_cosmos_client.get_database_client(vector_config.COSMOS_pol_DATABASE_NAME)
+        self.policy_container = self.policy_database.get_container_client(vector_config.COSMOS_pol_CONTAINER_NAME)
+        self.policy_lookup = AsyncPartitionKeyLookup(self.policy_container, POLICY_FIELDS)
+        self.policy_index = load_vector_index(vector_config.COSMOS_pol_VECTOR_INDEX_PATH)
+        if self.policy_index is not None:
+            start_change_feed_sync("COSMOS_pol", get_container("COSMOS_pol"), self.policy_index)
+        print("✓ Policy database connected")
+
+        print("\n" + "=" * 80)
+        print("✓ Async Unified RAG System Ready!")
+        print("=" * 80 + "\n")
+
+    # ========================================================================
+    # EMBEDDING GENERATION
+    # ========================================================================
+
+    async def generate_embedding(self, text: str) -> List[float]:
+        """Generate embedding vector for any text query"""
+        try:
+            return await self.embedder.embed(text)
+        except Exception as e:
+            print(f"❌ Error generating embedding: {e}")
+            raise
+
+    async def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embedding vectors for many texts in as few requests as possible"""
+        try:
+            return await self.embedder.embed_many(texts)
+        except Exception as e:
+            print(f"❌ Error generating embeddings: {e}")
+            raise
+
+    # ========================================================================
+    # SEARCH
+    # ========================================================================
+
+    async def search_customers(
+        self,
+        query: str,
+        top_k: int = 5,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[Dict[str, Any]]:
+        """Semantic search over customer data (see UnifiedRAGSystem.search_customers)"""
+        try:
+            print(f"\n🔍 Searching customers for: '{query}'")
+
+            if query_embedding is None:
+                query_embedding = await self.generate_embedding(query)
+
+            results = await _vector_results(
+                self.customer_container, self.customer_index, CUSTOMER_SEARCH_FIELDS,
+                query_embedding, top_k, 'similarity_score'
+            )
+            print(f"✓ Found {len(results)} customers")
+            return results
+
+        except Exception as e:
+            print(f"❌ Error in customer vector search: {e}")
+            return []
+
+    async def search_policies(
+        self,
+        query: str,
+        top_k: int = 5,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[Dict[str, Any]]:
+        """Semantic search over policy data (see UnifiedRAGSystem.search_policies)"""
+        try:
+            print(f"\n🔍 Searching policies for: '{query}'")
+
+            if query_embedding is None:
+                query_embedding = await self.generate_embedding(query)
+
+            results = await _vector_results(
+                self.policy_container, self.policy_index, POLICY_SEARCH_FIELDS,
+                query_embedding, top_k, 'similarity_score'
+            )
+            print(f"✓ Found {len(results)} policies")
+            return results
+
+        except Exception as e:
+            print(f"❌ Error in policy vector search: {e}")
+            return []
+
+    async def unified_search(
+        self,
+        query: str,
+        top_k: int = 5,
+        query_embedding: Optional[List[float]] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Combined top_k over customers and policies (see UnifiedRAGSystem.unified_search)"""
+        print(f"\n🔍 Unified Search: '{query}'")
+        print(f"   Retrieving combined top {top_k} results")
+        print("-" * 80)
+
+        if query_embedding is None:
+            try:
+                query_embedding = await self.generate_embedding(query)
+            except Exception:
+                return {'customers': [], 'policies': []}
+
+        candidate_multiplier = 3
+        source_results = await gather_searches({
+            'customers': self.search_customers(query, top_k * candidate_multiplier, query_embedding),
+            'policies': self.search_policies(query, top_k * candidate_multiplier, query_embedding)
+        })
+
+        results = self._merge_results(source_results['customers'], source_results['policies'], top_k)
+        print(f"✓ Combined results: {len(results['customers'])} customers + {len(results['policies'])} policies = "
+              f"{len(results['customers']) + len(results['policies'])} total")
+
+        return results
+
+    async def intelligent_search(
+        self,
+        query: str,
+        top_k: int = 5,
+        query_embedding: Optional[List[float]] = None
+    ) -> Dict[str, Any]:
+        """Route the query by its keywords (see UnifiedRAGSystem.intelligent_search)"""
+        result = {
+            'query': query,
+            'search_type': self._route_query(query),
+            'customers': [],
+            'policies': []
+        }
+
+        if result['search_type'] == 'customer':
+            result['customers'] = await self.search_customers(query, top_k, query_embedding)
+        elif result['search_type'] == 'policy':
+            result['policies'] = await self.search_policies(query, top_k, query_embedding)
+        else:
+            unified_results = await self.unified_search(query, top_k, query_embedding)
+            result['customers'] = unified_results['customers']
+            result['policies'] = unified_results['policies']
+
+        return result
+
+    async def get_customer_with_policies(self, customer_id: str) -> Dict[str, Any]:
+        """Customer information with all their policies, both read concurrently"""
+        try:
+            print(f"\n🔍 Retrieving customer and policies for: {customer_id}")
+
+            customer, policies = await asyncio.gather(
+                self.customer_lookup.get_one('customer_id', customer_id),
+                self.policy_lookup.get_all('customer_id', customer_id)
+            )
+
+            if not customer:
+                print(f"❌ Customer {customer_id} not found")
+                return None
+
+            print(f"✓ Found customer with {len(policies)} policies")
+            return {
+                'customer': customer,
+                'policies': policies,
+                'policy_count': len(policies)
+            }
+
+        except Exception as e:
+            print(f"❌ Error retrieving customer with policies: {e}")
+            return None
+
+    async def rag_query(self, query: str, max_results: int = 5) -> Dict[str, Any]:
+        """Complete RAG retrieval pipeline (see UnifiedRAGSystem.rag_query)"""
+        print("\n" + "=" * 80)
+        print("RAG QUERY PIPELINE")
+        print("=" * 80)
+        print(f"Query: {query}")
+        print("-" * 80)
+
+        try:
+            query_embedding = await self.generate_embedding(query)
+        except Exception:
+            query_embedding = None
+        results = await self.intelligent_search(query, max_results, query_embedding)
+
+        return {
+            'query': query,
+            'search_type': results['search_type'],
+            'context': self._format_context(results),
+            'customers_found': len(results['customers']),
+            'policies_found': len(results['policies']),
+            'customers': results['customers'],
+            'policies': results['policies'],
+            'timestamp': datetime.now().isoformat()
+        }
+
+
+# ============================================================================
+# HYBRID SEARCH
+# ============================================================================
+
+class AsyncUnifiedRAGHybridSystem(UnifiedRAGHybridSystem):
+    """
+    UnifiedRAGHybridSystem whose searches are coroutines
+
+    Keyword indexes are the process-wide ones of the sync system: they are
+    built (once) and kept current with the sync client on worker threads,
+    while candidate reads go through azure.cosmos.aio.
+    """
+
+    def __init__(self):
+        """Initialize async clients (shared per process) and local indexes"""
+        print("\n" + "=" * 80)
+        print("Initializing Async Unified RAG System with HYBRID SEARCH...")
+        print("=" * 80)
+
+        self.openai_client = get_async_openai_client(
+            hybrid_config.AZURE_OPENAI_ENDPOINT,
+            hybrid_config.AZURE_OPENAI_KEY,
+            hybrid_config.AZURE_OPENAI_API_VERSION
+        )
+        self.embedder = get_async_embedding_batcher(
+            self.openai_client, hybrid_config.AZURE_OPENAI_DEPLOYMENT, hybrid_config.AZURE_OPENAI_ENDPOINT
+        )
+        print("✓ Azure OpenAI client initialized")
+
+        # Fusion of vector and keyword rankings: 'rrf', 'weighted' or an object with fuse()
+        self.fusion_strategy = HYBRID_FUSION_STRATEGY
+
+        self.customer_cosmos_client = get_async_cosmos_client(
+            hybrid_config.COSMOS_hybrid_ENDPOINT, hybrid_config.COSMOS_hybrid_KEY
+        )
+        self.customer_database = self.customer_cosmos_client.get_database_client(hybrid_config.COSMOS_hybrid_DATABASE_NAME)
+        self.customer_container = self.customer_database.get_container_client(hybrid_config.COSMOS_hybrid_CONTAINER_NAME)
+        # Sync handle for the keyword index build and the change feed threads
+        self.customer_sync_container = get_container("COSMOS_hybrid")
+        self.customer_index = load_vector_index(hybrid_config.COSMOS_hybrid_VECTOR_INDEX_PATH)
+        if self.customer_index is not None:
+            start_change_feed_sync("COSMOS_hybrid", self.customer_sync_container, self.customer_index)
+        # Start building the corpus-wide keyword index in the background
+        self.get_customer_keyword_index()
+        print("✓ Customer database connected")
+
+        self.policy_cosmos_client = get_async_cosmos_client(
+            hybrid_config.COSMOS_pol_hybrid_ENDPOINT, hybrid_config.COSMOS_pol_hybrid_KEY
+        )
+        self.policy_database = self.policy_cosmos_client.get_database_client(hybrid_config.COSMOS_pol_hybrid_DATABASE_NAME)
+        self.policy_container = self.policy_database.get_container_client(hybrid_config.COSMOS_pol_hybrid_CONTAINER_NAME)
+        self.policy_sync_container = get_container("COSMOS_pol_hybrid")
+        self.policy_index = load_vector_index(hybrid_config.COSMOS_pol_hybrid_VECTOR_INDEX_PATH)
+        if self.policy_index is not None:
+            start_change_feed_sync("COSMOS_pol_hybrid", self.policy_sync_container, self.policy_index)
+        self.get_policy_keyword_index()
+        print("✓ Policy database connected")
+
+        print("\n" + "=" * 80)
+        print("✓ Async Unified RAG System with Hybrid Search Ready!")
+        print("=" * 80 + "\n")
+
+    # ========================================================================
+    # EMBEDDING GENERATION
+    # ========================================================================
+
+    async def generate_embedding(self, text: str) -> List[float]:
+        """Generate embedding vector for any text query"""
+        try:
+            return await self.embedder.embed(text)
+        except Exception as e:
+            print(f"❌ Error generating embedding: {e}")
+            raise
+
+    async def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embedding vectors for many texts in as few requests as possible"""
+        try:
+            return await self.embedder.embed_many(texts)
+        except Exception as e:
+            print(f"❌ Error generating embeddings: {e}")
+            raise
+
+    # ========================================================================
+    # KEYWORD INDEXES
+    # ========================================================================
+
+    def get_customer_keyword_index(self):
+        """Corpus-wide BM25 index over the customer container (None until its background build is done)"""
+        return get_keyword_index(
+            "COSMOS_hybrid", self.customer_sync_container, 'customer_id',
+            customer_keyword_text, CUSTOMER_KEYWORD_FIELDS
+        )
+
+    def get_policy_keyword_index(self):
+        """Corpus-wide BM25 index over the policy container (None until its background build is done)"""
+        return get_keyword_index(
+            "COSMOS_pol_hybrid", self.policy_sync_container, 'policy_id',
+            policy_keyword_text, POLICY_KEYWORD_FIELDS
+        )
+
+    # ========================================================================
+    # SEARCH
+    # ========================================================================
+
+    async def _hybrid_search(
+        self,
+        query: str,
+        top_k: int,
+        vector_weight: float,
+        keyword_weight: float,
+        query_embedding: Optional[List[float]],
+        container,
+        index,
+        get_keyword_index_fn,
+        fields: List[str],
+        id_field: str,
+        keyword_text
+    ) -> List[Dict[str, Any]]:
+        """Vector candidates, container-wide keyword candidates, then fusion"""
+        candidate_count = min(top_k * HYBRID_CANDIDATE_MULTIPLIER, HYBRID_MAX_CANDIDATES)
+
+        if query_embedding is None:
+            query_embedding = await self.generate_embedding(query)
+
+        results = await _vector_results(container, index, fields, query_embedding, candidate_count, 'vector_score')
+        keyword_index = get_keyword_index_fn()
+        candidates = await _add_keyword_candidates(
+            results, keyword_index, query, container, fields, query_embedding, candidate_count
+        )
+        if not candidates:
+            return []
+
+        return self._fuse_candidates(
+            query, results, candidates, id_field, keyword_text, keyword_index,
+            top_k, vector_weight, keyword_weight
+        )
+
+    async def search_customers(
+        self,
+        query: str,
+        top_k: int = 5,
+        vector_weight: float = 0.6,
+        keyword_weight: float = 0.4,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[Dict[str, Any]]:
+        """HYBRID SEARCH over customer data (see UnifiedRAGHybridSystem.search_customers)"""
+        try:
+            print(f"\n🔍 Hybrid searching customers for: '{query}'")
+            print(f"   Weights: Vector={vector_weight:.0%}, Keyword={keyword_weight:.0%}")
+
+            results = await self._hybrid_search(
+                query, top_k, vector_weight, keyword_weight, query_embedding,
+                self.customer_container, self.customer_index, self.get_customer_keyword_index,
+                CUSTOMER_SEARCH_FIELDS, 'customer_id', customer_keyword_text
+            )
+            print(f"✓ Found {len(results)} customers")
+            return results
+
+        except Exception as e:
+            print(f"❌ Error in customer hybrid search: {e}")
+            return []
+
+    async def search_policies(
+        self,
+        query: str,
+        top_k: int = 5,
+        vector_weight: float = 0.6,
+        keyword_weight: float = 0.4,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[Dict[str, Any]]:
+        """HYBRID SEARCH over policy data (see UnifiedRAGHybridSystem.search_policies)"""
+        try:
+            print(f"\n🔍 Hybrid searching policies for: '{query}'")
+            print(f"   Weights: Vector={vector_weight:.0%}, Keyword={keyword_weight:.0%}")
+
+            results = await self._hybrid_search(
+                query, top_k, vector_weight, keyword_weight, query_embedding,
+                self.policy_container, self.policy_index, self.get_policy_keyword_index,
+                POLICY_SEARCH_FIELDS, 'policy_id', policy_keyword_text
+            )
+            print(f"✓ Found {len(results)} policies")
+            return results
+
+        except Exception as e:
+            print(f"❌ Error in policy hybrid search: {e}")
+            return []
+
+    async def unified_search(
+        self,
+        query: str,
+        top_k: int = 5,
+        vector_weight: float = 0.6,
+        keyword_weight: float = 0.4,
+        query_embedding: Optional[List[float]] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Hybrid top_k ranked across customers and policies (see UnifiedRAGHybridSystem.unified_search)"""
+        print(f"\n🔍 Unified Hybrid Search: '{query}'")
+        print(f"   Searching all sources to find top {top_k} most relevant results")
+        print("-" * 80)
+
+        if query_embedding is None:
+            try:
+                query_embedding = await self.generate_embedding(query)
+            except Exception:
+                return {'customers': [], 'policies': []}
+
+        candidate_multiplier = 2
+        source_results = await gather_searches({
+            'customers': self.search_customers(
+                query, top_k * candidate_multiplier, vector_weight, keyword_weight, query_embedding
+            ),
+            'policies': self.search_policies(
+                query, top_k * candidate_multiplier, vector_weight, keyword_weight, query_embedding
+            )
+        })
+
+        return self._fuse_sources(
+            source_results['customers'], source_results['policies'], top_k, vector_weight, keyword_weight
+        )
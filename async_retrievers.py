@@ -0,0 +1,313 @@
+"""
+async_retrievers.py - Async customer and policy retrievers (azure.cosmos.aio + AsyncAzureOpenAI)
+Coroutine counterparts of CustomerRetriever and PolicyRetriever for the
+shared event loop in async_runtime.py; they reuse the sync classes' query
+builders and print helpers, so both return identical results
+
+    python async_retrievers.py "high income engineers" --top-k 5
+"""
+
+import asyncio
+import argparse
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+
+from client_registry import get_async_cosmos_client, get_async_openai_client, get_container
+from embedding_batcher import get_async_embedding_batcher
+from cosmos_lookup import AsyncPartitionKeyLookup
+from projections import CUSTOMER_FIELDS, POLICY_FIELDS, CUSTOMER_SEARCH_FIELDS, POLICY_SEARCH_FIELDS
+from vector_index import vector_search_query
+from async_runtime import async_query, run_async, shutdown
+from query_pages import aiter_query_pages, QUERY_PAGE_SIZE
+from statistics_engine import get_statistics_engine, CUSTOMER_STATISTICS, POLICY_STATISTICS
+from cust_ret import (
+    CustomerRetriever, COSMOS_ret_ENDPOINT, COSMOS_ret_KEY, COSMOS_ret_DATABASE_NAME, COSMOS_ret_CONTAINER_NAME
+)
+from policy_retrieval import (
+    PolicyRetriever, COSMOS_pol_ENDPOINT, COSMOS_pol_KEY, COSMOS_pol_DATABASE_NAME, COSMOS_pol_CONTAINER_NAME,
+    AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY, AZURE_OPENAI_DEPLOYMENT, AZURE_OPENAI_API_VERSION
+)
+
+
+async def _statistics(prefix: str, spec) -> Dict[str, Any]:
+    """
+    Read the shared statistics snapshot of a container (statistics_engine.py)
+
+    The engine scans and follows the change feed through the sync client,
+    so the same snapshot serves sync and async callers; a rescan runs on a
+    worker thread instead of blocking the event loop.
+    """
+    engine = get_statistics_engine(prefix, get_container(prefix), spec)
+    return await asyncio.to_thread(engine.statistics)
+
+
+class AsyncCustomerRetriever(CustomerRetriever):
+    """
+    CustomerRetriever whose lookups and searches are coroutines
+
+    Use from async code on the shared event loop, or from sync code with
+    async_runtime.run_async(retriever.vector_search(...)).
+    """
+
+    def __init__(self):
+        """Initialize async Cosmos DB and Azure OpenAI clients (shared per process)"""
+        print("Initializing async retrieval client...")
+
+        self.cosmos_client = get_async_cosmos_client(COSMOS_ret_ENDPOINT, COSMOS_ret_KEY)
+        self.database = self.cosmos_client.get_database_client(COSMOS_ret_DATABASE_NAME)
+        self.container = self.database.get_container_client(COSMOS_ret_CONTAINER_NAME)
+        self.lookup = AsyncPartitionKeyLookup(self.container, CUSTOMER_FIELDS)
+
+        self.openai_client = get_async_openai_client(
+            AZURE_OPENAI_ENDPOINT,
+            AZURE_OPENAI_KEY,
+            AZURE_OPENAI_API_VERSION
+        )
+        self.embedder = get_async_embedding_batcher(self.openai_client, AZURE_OPENAI_DEPLOYMENT, AZURE_OPENAI_ENDPOINT)
+
+        print("✓ Client initialized successfully\n")
+
+    async def get_customer_by_id(self, customer_id: str) -> Optional[Dict[str, Any]]:
+        """Retrieve complete customer details by customer_id"""
+
+        try:
+            return await self.lookup.get_one('customer_id', customer_id)
+        except Exception as e:
+            print(f"Error retrieving customer: {e}")
+            return None
+
+    async def generate_embedding(self, text: str) -> List[float]:
+        """Generate embedding vector for search query"""
+
+        try:
+            return await self.embedder.embed(text)
+        except Exception as e:
+            print(f"Error generating embedding: {e}")
+            raise
+
+    async def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embedding vectors for many texts in as few requests as possible"""
+
+        try:
+            return await self.embedder.embed_many(texts)
+        except Exception as e:
+            print(f"Error generating embeddings: {e}")
+            raise
+
+    async def vector_search(self, query_text: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """Search for similar customers using vector search"""
+
+        try:
+            query_embedding = await self.generate_embedding(query_text)
+            query, parameters = vector_search_query(CUSTOMER_SEARCH_FIELDS, query_embedding, top_k, 'similarity_score')
+            return await async_query(self.container, query, parameters)
+
+        except Exception as e:
+            print(f"Error in vector search: {e}")
+            return []
+
+    async def search_by_criteria(
+            self,
+            min_income: Optional[int] = None,
+            max_income: Optional[int] = None,
+            min_credit_score: Optional[int] = None,
+            customer_segment: Optional[str] = None,
+            state: Optional[str] = None,
+            occupation: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Search customers by various criteria"""
+
+        try:
+            query, parameters = self._criteria_query(
+                min_income, max_income, min_credit_score, customer_segment, state, occupation
+            )
+            return await async_query(self.container, query, parameters)
+
+        except Exception as e:
+            print(f"Error searching by criteria: {e}")
+            return []
+
+    async def search_by_criteria_pages(
+            self,
+            min_income: Optional[int] = None,
+            max_income: Optional[int] = None,
+            min_credit_score: Optional[int] = None,
+            customer_segment: Optional[str] = None,
+            state: Optional[str] = None,
+            occupation: Optional[str] = None,
+            page_size: int = QUERY_PAGE_SIZE,
+            continuation_token: Optional[str] = None
+    ) -> AsyncIterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """search_by_criteria one page at a time (see CustomerRetriever.search_by_criteria_pages)"""
+
+        query, parameters = self._criteria_query(
+            min_income, max_income, min_credit_score, customer_segment, state, occupation
+        )
+        async for page in aiter_query_pages(self.container, query, parameters, page_size, continuation_token):
+            yield page
+
+    async def get_customer_statistics(self) -> Dict[str, Any]:
+        """Get basic statistics about customers (plus percentiles and histograms)"""
+
+        try:
+            return await _statistics("COSMOS_ret", CUSTOMER_STATISTICS)
+        except Exception as e:
+            print(f"Error getting statistics: {e}")
+            return {}
+
+
+class AsyncPolicyRetriever(PolicyRetriever):
+    """
+    PolicyRetriever whose lookups and searches are coroutines
+
+    Use from async code on the shared event loop, or from sync code with
+    async_runtime.run_async(retriever.vector_search(...)).
+    """
+
+    def __init__(self):
+        """Initialize async Cosmos DB and Azure OpenAI clients (shared per process)"""
+        print("Initializing async policy retrieval client...")
+
+        self.cosmos_client = get_async_cosmos_client(COSMOS_pol_ENDPOINT, COSMOS_pol_KEY)
+        self.database = self.cosmos_client.get_database_client(COSMOS_pol_DATABASE_NAME)
+        self.container = self.database.get_container_client(COSMOS_pol_CONTAINER_NAME)
+        self.lookup = AsyncPartitionKeyLookup(self.container, POLICY_FIELDS)
+
+        self.openai_client = get_async_openai_client(
+            AZURE_OPENAI_ENDPOINT,
+            AZURE_OPENAI_KEY,
+            AZURE_OPENAI_API_VERSION
+        )
+        self.embedder = get_async_embedding_batcher(self.openai_client, AZURE_OPENAI_DEPLOYMENT, AZURE_OPENAI_ENDPOINT)
+
+        print("✓ Client initialized successfully\n")
+
+    async def get_policies_by_customer_id(self, customer_id: str) -> List[Dict[str, Any]]:
+        """Retrieve all policies for a specific customer by customer_id"""
+
+        try:
+            return await self.lookup.get_all('customer_id', customer_id)
+        except Exception as e:
+            print(f"Error retrieving policies: {e}")
+            return []
+
+    async def get_policy_by_id(self, policy_id: str) -> Optional[Dict[str, Any]]:
+        """Retrieve complete policy details by policy_id"""
+
+        try:
+            return await self.lookup.get_one('policy_id', policy_id)
+        except Exception as e:
+            print(f"Error retrieving policy: {e}")
+            return None
+
+    async def generate_embedding(self, text: str) -> List[float]:
+        """Generate embedding vector for search query"""
+
+        try:
+            return await self.embedder.embed(text)
+        except Exception as e:
+            print(f"Error generating embedding: {e}")
+            raise
+
+    async def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embedding vectors for many texts in as few requests as possible"""
+
+        try:
+            return await self.embedder.embed_many(texts)
+        except Exception as e:
+            print(f"Error generating embeddings: {e}")
+            raise
+
+    async def vector_search(self, query_text: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """Search for similar policies using vector search"""
+
+        try:
+            query_embedding = await self.generate_embedding(query_text)
+            query, parameters = vector_search_query(POLICY_SEARCH_FIELDS, query_embedding, top_k, 'similarity_score')
+            return await async_query(self.container, query, parameters)
+
+        except Exception as e:
+            print(f"Error in vector search: {e}")
+            return []
+
+    async def search_by_criteria(
+            self,
+            policy_type: Optional[str] = None,
+            status: Optional[str] = None,
+            min_premium: Optional[float] = None,
+            max_premium: Optional[float] = None,
+            min_coverage: Optional[int] = None,
+            payment_frequency: Optional[str] = None,
+            auto_renew: Optional[bool] = None
+    ) -> List[Dict[str, Any]]:
+        """Search policies by various criteria"""
+
+        try:
+            query, parameters = self._criteria_query(
+                policy_type, status, min_premium, max_premium, min_coverage, payment_frequency, auto_renew
+            )
+            return await async_query(self.container, query, parameters)
+
+        except Exception as e:
+            print(f"Error searching by criteria: {e}")
+            return []
+
+    async def search_by_criteria_pages(
+            self,
+            policy_type: Optional[str] = None,
+            status: Optional[str] = None,
+            min_premium: Optional[float] = None,
+            max_premium: Optional[float] = None,
+            min_coverage: Optional[int] = None,
+            payment_frequency: Optional[str] = None,
+            auto_renew: Optional[bool] = None,
+            page_size: int = QUERY_PAGE_SIZE,
+            continuation_token: Optional[str] = None
+    ) -> AsyncIterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """search_by_criteria one page at a time (see PolicyRetriever.search_by_criteria_pages)"""
+
+        query, parameters = self._criteria_query(
+            policy_type, status, min_premium, max_premium, min_coverage, payment_frequency, auto_renew
+        )
+        async for page in aiter_query_pages(self.container, query, parameters, page_size, continuation_token):
+            yield page
+
+    async def get_policy_statistics(self) -> Dict[str, Any]:
+        """Get basic statistics about policies (plus percentiles and histograms)"""
+
+        try:
+            return await _statistics("COSMOS_pol", POLICY_STATISTICS)
+        except Exception as e:
+            print(f"Error getting statistics: {e}")
+            return {}
+
+
+def main():
+    """Run a customer and a policy vector search concurrently"""
+    parser = argparse.ArgumentParser(description="Concurrent customer and policy vector search")
+    parser.add_argument("query", help="Natural language query")
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    async def search():
+        customers, policies = AsyncCustomerRetriever(), AsyncPolicyRetriever()
+        return await asyncio.gather(
+            customers.vector_search(args.query, args.top_k),
+            policies.vector_search(args.query, args.top_k)
+        )
+
+    try:
+        customer_results, policy_results = run_async(search())
+    finally:
+        shutdown()
+
+    print(f"\n✓ Found {len(customer_results)} customers and {len(policy_results)} policies:\n")
+    for customer in customer_results:
+        print(f"   {customer['customer_id']}  {customer['first_name']} {customer['last_name']}  "
+              f"({customer['similarity_score']:.4f})")
+    for policy in policy_results:
+        print(f"   {policy['policy_id']}  {policy['policy_type']} {policy['status']}  "
+              f"({policy['similarity_score']:.4f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+async_runtime.py - One shared asyncio event loop for the async retrievers and RAG systems
+The loop runs on a daemon thread for the life of the process. Async code
+awaits the retrievers directly on it; synchronous callers (Streamlit reruns,
+agent nodes, scripts) hand coroutines over with run_async() and block only
+their own thread, so many queries from many callers are in flight at once on
+one set of async Cosmos DB and OpenAI connections
+
+    from async_runtime import run_async
+    from async_rag_system import AsyncUnifiedRAGSystem
+
+    rag = AsyncUnifiedRAGSystem()
+    results = run_async(rag.unified_search("auto policies in Texas"))
+"""
+
+import os
+import asyncio
+import threading
+from typing import Any, Awaitable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuration
+# Default seconds run_async waits for a coroutine (0 = no limit)
+ASYNC_CALL_TIMEOUT = float(os.getenv("ASYNC_CALL_TIMEOUT", "0"))
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_thread: Optional[threading.Thread] = None
+_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Return the shared event loop, starting its thread on first use"""
+    global _loop, _thread
+
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def run(loop: asyncio.AbstractEventLoop):
+                asyncio.set_event_loop(loop)
+                loop.call_soon(started.set)
+                loop.run_forever()
+
+            _thread = threading.Thread(target=run, args=(_loop,), name="async-runtime", daemon=True)
+            _thread.start()
+            started.wait()
+
+        return _loop
+
+
+def in_event_loop() -> bool:
+    """True when called from the shared loop's own thread"""
+    return _thread is not None and threading.current_thread() is _thread
+
+
+def run_async(coroutine: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """
+    Run a coroutine on the shared loop from synchronous code and return its result
+
+    Args:
+        coroutine: Coroutine to run (e.g. rag.unified_search(query))
+        timeout: Seconds to wait (defaults to ASYNC_CALL_TIMEOUT; 0 = no limit)
+
+    Returns:
+        The coroutine's result; its exception is re-raised in the caller
+    """
+    if in_event_loop():
+        raise RuntimeError("run_async() would deadlock on the shared event loop; await the coroutine instead")
+
+    if timeout is None:
+        timeout = ASYNC_CALL_TIMEOUT
+
+    future = asyncio.run_coroutine_threadsafe(coroutine, get_event_loop())
+    try:
+        return future.result(timeout=timeout or None)
+    except Exception:
+        future.cancel()
+        raise
+
+
+def run_async_many(coroutines: List[Awaitable[Any]], timeout: Optional[float] = None) -> List[Any]:
+    """
+    Run several coroutines concurrently on the shared loop and return their
+    results in order (an exception is returned in place of its result)
+    """
+    async def gather():
+        return await asyncio.gather(*coroutines, return_exceptions=True)
+
+    return run_async(gather(), timeout)
+
+
+async def async_query(
+    container,
+    query: str,
+    parameters: Optional[List[Dict[str, Any]]] = None,
+    partition_key: Any = None
+) -> List[Dict[str, Any]]:
+    """
+    Read every result of a query on an azure.cosmos.aio container
+
+    Args:
+        container: azure.cosmos.aio container client
+        query: SQL query
+        parameters: Query parameters
+        partition_key: Scope the query to one partition (cross-partition when None)
+
+    Returns:
+        List of result items
+    """
+    kwargs = {"partition_key": partition_key} if partition_key is not None else {}
+    return [item async for item in container.query_items(query=query, parameters=parameters, **kwargs)]
+
+
+def shutdown():
+    """Close the shared async clients and stop the loop (for scripts and tests)"""
+    global _loop, _thread
+    from client_registry import close_async_clients
+
+    if in_event_loop():
+        raise RuntimeError("shutdown() must be called from outside the shared event loop")
+
+    with _lock:
+        loop, thread = _loop, _thread
+    if loop is None or loop.is_closed():
+        return
+
+    asyncio.run_coroutine_threadsafe(close_async_clients(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+    with _lock:
+        _loop = None
+        _thread = None
@@ -0,0 +1,224 @@
+"""
+bulk_churn_scoring.py - Nightly churn risk scoring of the whole book of business
+Scores every customer with ChurnPredictionAgent's deterministic factors and
+risk score, without the interactive graph or any LLM call. Customers and
+policies are each streamed once, ordered by customer_id, and merged so every
+customer's policies arrive together; chunks of customers are scored on a
+process pool (date parsing dominates the cost) and written to a risk table
+
+    python bulk_churn_scoring.py
+    python bulk_churn_scoring.py risk_table.jsonl --workers 8 --chunk-size 1000
+"""
+
+import os
+import csv
+import json
+import time
+import argparse
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from projections import select_fields
+from query_pages import iter_query_items, QUERY_PAGE_SIZE
+
+load_dotenv()
+
+# Configuration
+CHURN_SCORING_WORKERS = int(os.getenv("CHURN_SCORING_WORKERS", str(os.cpu_count() or 1)))
+# Customers per process pool task
+CHURN_SCORING_CHUNK_SIZE = int(os.getenv("CHURN_SCORING_CHUNK_SIZE", "500"))
+CHURN_RISK_TABLE_PATH = os.getenv(
+    "CHURN_RISK_TABLE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "churn_risk.csv")
+)
+
+# Only the policy fields _calculate_churn_factors reads
+SCORING_POLICY_FIELDS = [
+    "customer_id", "policy_type", "status", "annual_premium", "start_date", "end_date", "auto_renew"
+]
+
+RiskRow = Dict[str, Any]
+
+
+# ============================================================================
+# STREAMING
+# ============================================================================
+
+def iter_customer_policies(
+    customer_container,
+    policy_container,
+    page_size: int = QUERY_PAGE_SIZE
+) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Every customer with all of their policies, from one scan of each container
+
+    Both scans are ordered by customer_id and merged, so only a page of each
+    is held in memory. Customers without policies come with an empty list;
+    policies whose customer has no profile document are still yielded.
+
+    Yields:
+        (customer_id, policies) in customer_id order
+    """
+    customer_ids = (
+        str(document["customer_id"])
+        for document in iter_query_items(
+            customer_container, "SELECT c.customer_id FROM c ORDER BY c.customer_id", page_size=page_size
+        )
+    )
+    policies = iter_query_items(
+        policy_container,
+        f"SELECT {select_fields(SCORING_POLICY_FIELDS)} FROM c ORDER BY c.customer_id",
+        page_size=page_size
+    )
+    groups = ((customer_id, list(group)) for customer_id, group in groupby(policies, lambda p: str(p["customer_id"])))
+
+    group = next(groups, None)
+    for customer_id in customer_ids:
+        while group is not None and group[0] < customer_id:
+            yield group
+            group = next(groups, None)
+        if group is not None and group[0] == customer_id:
+            yield group
+            group = next(groups, None)
+        else:
+            yield customer_id, []
+
+    while group is not None:
+        yield group
+        group = next(groups, None)
+
+
+def _chunks(items: Iterator, size: int) -> Iterator[List]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ============================================================================
+# SCORING
+# ============================================================================
+
+def score_customer(customer_id: str, policies: List[Dict[str, Any]]) -> RiskRow:
+    """
+    Risk row of one customer: the agent's churn factors, score and level
+
+    Returns:
+        {'customer_id', 'risk_score', 'risk_level', <churn factors>}
+    """
+    from churn_prediction_agent import ChurnPredictionAgent
+
+    factors = ChurnPredictionAgent._calculate_churn_factors({"customer_id": customer_id}, policies)
+    score = ChurnPredictionAgent._calculate_risk_score(factors)
+    return {
+        "customer_id": customer_id,
+        "risk_score": score,
+        "risk_level": ChurnPredictionAgent._get_risk_level(score),
+        **factors
+    }
+
+
+def _score_chunk(chunk: List[Tuple[str, List[Dict[str, Any]]]]) -> List[RiskRow]:
+    """Process pool task: score a chunk of customers"""
+    return [score_customer(customer_id, policies) for customer_id, policies in chunk]
+
+
+def score_book(
+    customers: Iterator[Tuple[str, List[Dict[str, Any]]]],
+    workers: int = CHURN_SCORING_WORKERS,
+    chunk_size: int = CHURN_SCORING_CHUNK_SIZE
+) -> Iterator[RiskRow]:
+    """
+    Score (customer_id, policies) pairs on a process pool, in input order
+
+    At most two chunks per worker are in flight, so memory stays bounded
+    however large the book is.
+
+    Args:
+        customers: e.g. iter_customer_policies(...)
+        workers: Worker processes (1 scores in this process)
+        chunk_size: Customers per task
+    """
+    chunks = _chunks(customers, chunk_size)
+    if workers <= 1:
+        for chunk in chunks:
+            yield from _score_chunk(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(_score_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+# ============================================================================
+# RISK TABLE
+# ============================================================================
+
+def write_risk_table(rows: Iterator[RiskRow], output_path: str = CHURN_RISK_TABLE_PATH) -> Counter:
+    """
+    Write risk rows to CSV (one column per churn factor) or, for a .jsonl
+    path, JSON lines. The table is written to a temporary file and moved into
+    place, so readers never see a partial run.
+
+    Returns:
+        Number of customers per risk level
+    """
+    directory = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{output_path}.tmp"
+    levels = Counter()
+
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        writer: Optional[csv.DictWriter] = None
+        for row in rows:
+            if output_path.endswith(".jsonl"):
+                f.write(json.dumps(row) + "\n")
+            else:
+                if writer is None:
+                    writer = csv.DictWriter(f, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+
+            levels[row["risk_level"]] += 1
+            if sum(levels.values()) % 10000 == 0:
+                print(f"   {sum(levels.values()):,} customers scored...")
+
+    os.replace(tmp_path, output_path)
+    return levels
+
+
+def main():
+    """Score every customer and write the risk table"""
+    from client_registry import get_container
+
+    parser = argparse.ArgumentParser(description="Churn risk scoring of every customer (no LLM calls)")
+    parser.add_argument("output", nargs="?", default=CHURN_RISK_TABLE_PATH, help="Risk table (.csv or .jsonl)")
+    parser.add_argument("--workers", type=int, default=CHURN_SCORING_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=CHURN_SCORING_CHUNK_SIZE)
+    parser.add_argument("--page-size", type=int, default=QUERY_PAGE_SIZE)
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    customers = iter_customer_policies(get_container("COSMOS_ret"), get_container("COSMOS_pol"), args.page_size)
+    levels = write_risk_table(score_book(customers, args.workers, args.chunk_size), args.output)
+
+    print(f"\n✓ Scored {sum(levels.values()):,} customers in {time.monotonic() - started:.1f}s -> {args.output}")
+    for level in ["CRITICAL", "HIGH", "MEDIUM", "LOW"]:
+        print(f"   {level}: {levels.get(level, 0):,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+"""
+change_feed_sync.py - Incremental sync of local copies from the Cosmos DB change feed
+Reads each container's change feed and applies inserts and updates to
+registered local consumers (vector index, keyword index, statistics cache)
+instead of reloading them. Every consumer keeps its own continuation token:
+a persisted index checkpoints next to its own file, an in-memory consumer
+only for the life of the process
+"""
+
+import os
+import json
+import random
+import threading
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuration
+CHANGE_FEED_POLL_SECONDS = float(os.getenv("CHANGE_FEED_POLL_SECONDS", "30"))
+CHANGE_FEED_MAX_ITEM_COUNT = int(os.getenv("CHANGE_FEED_MAX_ITEM_COUNT", "1000"))
+# Without a checkpoint, start from the beginning of the feed instead of from now
+CHANGE_FEED_START_FROM_BEGINNING = os.getenv("CHANGE_FEED_START_FROM_BEGINNING", "false").lower() == "true"
+CHANGE_FEED_SYNC_ENABLED = os.getenv("CHANGE_FEED_SYNC_ENABLED", "true").lower() == "true"
+
+
+# ============================================================================
+# CHECKPOINTS
+# ============================================================================
+
+_checkpoint_lock = threading.Lock()
+
+
+def load_checkpoint(name: str, path: str) -> Optional[str]:
+    """Return the saved continuation token for a feed, or None"""
+    with _checkpoint_lock:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f).get(name)
+        except (OSError, ValueError):
+            return None
+
+
+def save_checkpoint(name: str, token: Optional[str], path: str):
+    """Persist a feed's continuation token (feeds written to the same path share one JSON file)"""
+    with _checkpoint_lock:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                checkpoints = json.load(f)
+        except (OSError, ValueError):
+            checkpoints = {}
+
+        checkpoints[name] = token
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoints, f, indent=2)
+        os.replace(tmp_path, path)
+
+
+def index_checkpoint_path(index_path: str) -> str:
+    """Checkpoint file of a persisted index, kept next to the index file it describes"""
+    return index_path + ".feed.json"
+
+
+# ============================================================================
+# CHANGE SOURCES
+# ============================================================================
+
+class CosmosChangeFeedSource:
+    """Change feed of one Cosmos DB container (latest-version mode)"""
+
+    def __init__(
+        self,
+        container,
+        max_item_count: int = CHANGE_FEED_MAX_ITEM_COUNT,
+        start_from_beginning: bool = CHANGE_FEED_START_FROM_BEGINNING
+    ):
+        """
+        Args:
+            container: Cosmos DB container client
+            max_item_count: Maximum changed documents per read
+            start_from_beginning: Where to start when there is no continuation token
+        """
+        self.container = container
+        self.max_item_count = max_item_count
+        self.start_from_beginning = start_from_beginning
+
+    def read_changes(self, continuation: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Read the next page of changed documents
+
+        Args:
+            continuation: Token returned by the previous read (None to start)
+
+        Returns:
+            (documents, continuation token to pass next time)
+        """
+        kwargs = {"max_item_count": self.max_item_count}
+        if continuation:
+            kwargs["continuation"] = continuation
+        else:
+            kwargs["is_start_from_beginning"] = self.start_from_beginning
+
+        documents, token = self._read_page(**kwargs)
+        return documents, token or continuation
+
+    def current_token(self) -> Optional[str]:
+        """Continuation token for "now" (record before a full scan of the container)"""
+        _, token = self._read_page(is_start_from_beginning=False)
+        return token
+
+    def _read_page(self, **kwargs) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        One page of the feed and the position after it
+
+        The position is taken from this call's pager, or from the etag header
+        handed to this call's response hook, never from the client's
+        last_response_headers, which other threads sharing the client overwrite.
+        """
+        headers: Dict[str, Any] = {}
+        pages = self.container.query_items_change_feed(
+            response_hook=lambda response_headers, _: headers.update(response_headers),
+            **kwargs
+        ).by_page()
+        documents = list(next(pages, []))
+        return documents, getattr(pages, "continuation_token", None) or headers.get("etag")
+
+
+class InMemoryChangeFeedSource:
+    """
+    Local stand-in for a container's change feed
+
+    Batches passed to emit() are returned one per read, with the batch
+    position as the continuation token, so syncs and consumers can be
+    exercised without a Cosmos DB account.
+    """
+
+    def __init__(self):
+        self.batches: List[List[Dict[str, Any]]] = []
+        self._lock = threading.Lock()
+
+    def emit(self, documents: List[Dict[str, Any]]):
+        """Queue one batch of changed documents"""
+        with self._lock:
+            self.batches.append(list(documents))
+
+    def read_changes(self, continuation: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Return the batch after continuation and the token for the one after it"""
+        position = int(continuation or 0)
+        with self._lock:
+            if position >= len(self.batches):
+                return [], str(position)
+            return self.batches[position], str(position + 1)
+
+    def current_token(self) -> Optional[str]:
+        with self._lock:
+            return str(len(self.batches))
+
+
+def make_synthetic_changes(
+    kind: str,
+    count: int = 10,
+    dimension: int = 3072,
+    start: int = 0,
+    seed: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Generate a batch of synthetic customer or policy changes
+
+    Args:
+        kind: 'customer' or 'policy'
+        count: Number of documents
+        dimension: Embedding dimension
+        start: First sequence number (reuse numbers to produce updates)
+        seed: Random seed
+
+    Returns:
+        Documents shaped like the containers' items, embeddings included
+    """
+    rng = random.Random(seed)
+    now = datetime.now().isoformat()
+    documents = []
+
+    for n in range(start, start + count):
+        embedding = [rng.uniform(-1, 1) for _ in range(dimension)]
+        if kind == "customer":
+            customer_id = f"CUST{n:06d}"
+            documents.append({
+                "id": customer_id,
+                "customer_id": customer_id,
+                "first_name": rng.choice(["James", "Maria", "Wei", "Aisha", "Lucas"]),
+                "last_name": rng.choice(["Smith", "Garcia", "Chen", "Khan", "Silva"]),
+                "email": f"customer{n}@example.com",
+                "occupation": rng.choice(["Engineer", "Teacher", "Nurse", "Accountant"]),
+                "annual_income": rng.randint(30000, 250000),
+                "credit_score": rng.randint(550, 850),
+                "marital_status": rng.choice(["Single", "Married", "Divorced"]),
+                "address": {"city": rng.choice(["Austin", "Denver", "Seattle"]), "state": rng.choice(["TX", "CO", "WA"])},
+                "created_date": now,
+                "embedding": embedding
+            })
+        else:
+            policy_id = f"POL{n:06d}"
+            documents.append({
+                "id": policy_id,
+                "policy_id": policy_id,
+                "customer_id": f"CUST{n:06d}",
+                "policy_number": f"PN-{n:08d}",
+                "policy_type": rng.choice(["Auto", "Home", "Life", "Health"]),
+                "status": rng.choice(["Active", "Active", "Active", "Cancelled", "Lapsed"]),
+                "annual_premium": round(rng.uniform(400, 5000), 2),
+                "coverage_amount": rng.choice([50000, 100000, 250000, 500000]),
+                "payment_frequency": rng.choice(["Monthly", "Quarterly", "Annual"]),
+                "auto_renew": rng.choice([True, False]),
+                "created_date": now,
+                "embedding": embedding
+            })
+
+    return documents
+
+
+# ============================================================================
+# SYNC
+# ============================================================================
+
+class _Subscription:
+    """One consumer's position in a feed"""
+
+    def __init__(self, consumer, token: Optional[str], checkpoint_path: Optional[str]):
+        self.consumer = consumer
+        self.token = token
+        self.checkpoint_path = checkpoint_path
+
+    def advance(self, name: str, token: Optional[str]):
+        self.token = token
+        if self.checkpoint_path:
+            save_checkpoint(name, token, self.checkpoint_path)
+
+
+class ChangeFeedSync:
+    """
+    Applies one container's change feed to registered local consumers
+
+    A consumer is any object with apply_changes(documents). Each consumer has
+    its own continuation token, so one that fails leaves its batch to be
+    retried without holding back the others. A consumer that persists its
+    state defines checkpoint_path (its token is saved there and survives
+    restarts) and may define flush(); flush is called before the token is
+    saved, so the checkpoint never runs ahead of what is on disk. Any other
+    consumer starts from the feed position at registration, so its state
+    must already cover everything before that (or be loaded by a scan that
+    starts after it). Applying a change twice must be harmless (upsert
+    semantics), since a crash between apply and checkpoint replays the batch.
+    """
+
+    def __init__(self, name: str, source, poll_seconds: float = CHANGE_FEED_POLL_SECONDS):
+        """
+        Args:
+            name: Name of the feed (e.g. 'COSMOS_ret')
+            source: CosmosChangeFeedSource or InMemoryChangeFeedSource
+            poll_seconds: Interval between reads in the background thread
+        """
+        self.name = name
+        self.source = source
+        self.poll_seconds = poll_seconds
+        self.subscriptions: List[_Subscription] = []
+
+        self.changes_applied = 0
+        self.last_sync: Optional[datetime] = None
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def consumers(self) -> List[Any]:
+        return [subscription.consumer for subscription in self.subscriptions]
+
+    def register(self, consumer, token: Optional[str] = None):
+        """
+        Add a consumer (registering the same object twice is a no-op)
+
+        Args:
+            consumer: Object with apply_changes(documents)
+            token: Feed position the consumer's state is current to, for a
+                consumer without checkpoint_path (default: now)
+        """
+        if any(existing is consumer for existing in self.consumers):
+            return
+
+        checkpoint_path = getattr(consumer, "checkpoint_path", None)
+        if checkpoint_path:
+            token = load_checkpoint(self.name, checkpoint_path)
+        elif token is None:
+            try:
+                token = self.source.current_token()
+            except Exception as e:
+                print(f"⚠️  Could not read the {self.name} feed position, starting from the default: {e}")
+
+        with self._lock:
+            if not any(existing is consumer for existing in self.consumers):
+                self.subscriptions.append(_Subscription(consumer, token, checkpoint_path))
+
+    def sync_once(self) -> int:
+        """
+        Drain the feed: read, apply and checkpoint until no changes remain
+
+        Consumers at the same position share each read. A consumer whose
+        apply or flush fails keeps its token and is skipped until the next
+        sync; the others carry on.
+
+        Returns:
+            Number of changed documents applied (to at least one consumer)
+        """
+        with self._lock:
+            active = list(self.subscriptions)
+            applied = 0
+
+            while active:
+                positions: Dict[Optional[str], List[_Subscription]] = {}
+                for subscription in active:
+                    positions.setdefault(subscription.token, []).append(subscription)
+
+                caught_up = []
+                for token, subscriptions in positions.items():
+                    documents, next_token = self.source.read_changes(token)
+                    if not documents:
+                        for subscription in subscriptions:
+                            if next_token != token:
+                                subscription.advance(self.name, next_token)
+                            caught_up.append(subscription)
+                        continue
+
+                    applied_here = False
+                    for subscription in subscriptions:
+                        consumer = subscription.consumer
+                        try:
+                            consumer.apply_changes(documents)
+                            flush = getattr(consumer, "flush", None)
+                            if flush is not None:
+                                flush()
+                        except Exception as e:
+                            # Leave this consumer's checkpoint where it was so the batch is retried
+                            print(f"❌ Error applying {self.name} changes to {type(consumer).__name__}: {e}")
+                            caught_up.append(subscription)
+                            continue
+                        subscription.advance(self.name, next_token)
+                        applied_here = True
+
+                    if applied_here:
+                        applied += len(documents)
+
+                active = [subscription for subscription in active if subscription not in caught_up]
+
+            self.changes_applied += applied
+            self.last_sync = datetime.now()
+            if applied:
+                print(f"✓ Applied {applied} {self.name} changes")
+            return applied
+
+    def start(self):
+        """Poll the feed in a background thread (idempotent)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"change-feed-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread after its current read"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_seconds)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sync_once()
+            except Exception as e:
+                print(f"⚠️  {self.name} change feed sync failed, retrying: {e}")
+            self._stop.wait(self.poll_seconds)
+
+
+_syncs: Dict[str, ChangeFeedSync] = {}
+_syncs_lock = threading.Lock()
+
+
+def get_change_feed_sync(name: str, container) -> ChangeFeedSync:
+    """Return the process-wide sync for a container (one feed reader per container)"""
+    with _syncs_lock:
+        sync = _syncs.get(name)
+        if sync is None:
+            sync = ChangeFeedSync(name, CosmosChangeFeedSource(container))
+            _syncs[name] = sync
+        return sync
+
+
+def start_change_feed_sync(name: str, container, consumer, token: Optional[str] = None) -> Optional[ChangeFeedSync]:
+    """
+    Register a consumer on a container's feed and start polling it
+
+    Args:
+        name: Feed name, the container's environment prefix (e.g. 'COSMOS_ret')
+        container: Cosmos DB container client
+        consumer: Object with apply_changes(documents)
+        token: Feed position an in-memory consumer is current to (default: now)
+
+    Returns:
+        The running sync, or None when CHANGE_FEED_SYNC_ENABLED is false
+    """
+    if not CHANGE_FEED_SYNC_ENABLED:
+        return None
+
+    sync = get_change_feed_sync(name, container)
+    sync.register(consumer, token)
+    sync.start()
+    return sync
@@ -6,8 +6,11 @@ churn_prediction_agent.py - Interactive LangGraph Agent for Insurance Churn Pred
 
 import os
 import json
-from typing import TypedDict, Annotated, List, Dict, Any, Optional
+import time
+import threading
+from typing import TypedDict, Annotated, Iterator, List, Dict, Any, Optional
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from dateutil import parser as date_parser
 import operator
 
@@ -22,6 +25,10 @@ load_dotenv()
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from narrative_cache import get_narrative_cache, fingerprint
+from llm_executor import get_llm_executor, LLM_CONCURRENCY, INTERACTIVE, BATCH
+from prompt_builder import narrative_inputs, build_churn_prompt, get_usage_recorder
+
 # Note: Assuming the retrieval files are in the same directory
 # from retrieval import CustomerRetriever
 # from policy_retrieval import PolicyRetriever
@@ -42,6 +49,10 @@ OPENAI_MODEL = "gpt-4o-mini"  # or "gpt-4", "gpt-3.5-turbo", etc.
 
 USE_MOCK_DATA = False
 
+# Customers scoring below this get a template narrative built from their churn
+# factors instead of an LLM call (50 = only HIGH and CRITICAL; 0 = always the LLM)
+LLM_ANALYSIS_MIN_RISK_SCORE = float(os.getenv("LLM_ANALYSIS_MIN_RISK_SCORE", "50"))
+
 
 class AgentState(TypedDict):
     """State for the churn prediction agent"""
@@ -50,16 +61,33 @@ class AgentState(TypedDict):
     customer_data: Optional[Dict[str, Any]]
     policy_data: Optional[List[Dict[str, Any]]]
     churn_analysis: Optional[Dict[str, Any]]
+    force_llm: Optional[bool]  # LLM narrative whatever the risk score
+    stream_analysis: Optional[bool]  # Leave the LLM narrative to stream_churn_analysis
+    llm_priority: Optional[int]  # llm_executor priority (INTERACTIVE by default)
+    pending_narrative: Optional[Dict[str, Any]]
     stage: str  # Stages: greeting, collect_id, retrieve_data, analyze, present_results
 
 
 class ChurnPredictionAgent:
     """Interactive insurance agent for churn prediction using LangGraph"""
 
-    def __init__(self):
-        """Initialize the agent with Azure OpenAI and retrievers"""
+    def __init__(self, llm_min_risk_score: float = LLM_ANALYSIS_MIN_RISK_SCORE):
+        """
+        Initialize the agent with Azure OpenAI and retrievers
+
+        Args:
+            llm_min_risk_score: Risk score from which the narrative comes from
+                the LLM; below it a template narrative is used
+        """
         print("🚀 Initializing Churn Prediction Agent...")
         
+        self.llm_min_risk_score = llm_min_risk_score
+        self.llm_calls = 0
+        self.llm_cache_hits = 0
+        self.llm_calls_skipped = 0
+        # analyze_customers updates the counters from several threads
+        self._usage_lock = threading.Lock()
+        
         # Initialize LLM based on configuration
         if USE_OPENAI:
             print("📡 Using OpenAI API...")
@@ -322,110 +350,133 @@ This customer currently has no policies in our system. This represents either:
             state["stage"] = "present"
             return state
         
-        # Use LLM to generate detailed analysis
-        system_prompt = """You are an expert insurance analyst specializing in customer retention. 
-        Your task is to analyze customer data and predict churn risk with actionable insights.
-        Be professional, empathetic, and provide specific recommendations.
-        
-        If customer profile data is limited, focus your analysis on policy behavior patterns."""
+        # Low-risk customers get a deterministic narrative; the LLM is kept for
+        # customers at or above the threshold, or when explicitly requested
+        risk_score = self._calculate_risk_score(analysis)
+        if not state.get("force_llm") and risk_score < self.llm_min_risk_score:
+            analysis['llm_analysis'] = self._template_narrative(
+                customer_data, analysis, risk_score, self._get_risk_level(risk_score)
+            )
+            analysis['narrative_source'] = 'template'
+            self._count("llm_calls_skipped")
+            state["churn_analysis"] = analysis
+            state["stage"] = "present"
+            return state
         
-        # Safe access to customer data with defaults
-        first_name = customer_data.get('first_name', 'Unknown')
-        last_name = customer_data.get('last_name', 'Customer')
-        age = self._calculate_age(customer_data.get('date_of_birth', ''))
-        occupation = customer_data.get('occupation', 'Not specified')
-        annual_income = customer_data.get('annual_income', 0)
-        credit_score = customer_data.get('credit_score', 0)
-        metadata = customer_data.get('metadata', {})
-        if metadata is None:
-            metadata = {}
-        customer_segment = metadata.get('customer_segment', 'Not classified')
-        
-        # Build analysis context
-        if has_customer_profile:
-            customer_context = f"""
-CUSTOMER PROFILE:
-- Name: {first_name} {last_name}
-- Age: {age} years
-- Occupation: {occupation}
-- Annual Income: ${annual_income:,}
-- Credit Score: {credit_score}
-- Customer Segment: {customer_segment}
-"""
-        else:
-            customer_context = f"""
-CUSTOMER PROFILE:
-⚠️  Limited customer profile data available. Analysis based primarily on policy behavior.
-- Customer ID: {customer_data.get('customer_id', 'Unknown')}
-"""
+        # Use LLM to generate detailed analysis, from a compact prompt kept within
+        # PROMPT_TOKEN_BUDGET (large portfolios are summarized into a table)
+        model = getattr(self.llm, 'model_name', None) or getattr(self.llm, 'deployment_name', None) or OPENAI_MODEL
+        inputs = narrative_inputs(
+            customer_data,
+            policy_data,
+            analysis,
+            self._calculate_age(customer_data.get('date_of_birth', '')),
+            has_customer_profile
+        )
+        system_prompt, analysis_prompt, prompt_tokens = build_churn_prompt(inputs, model=model)
+        analysis['prompt_tokens'] = prompt_tokens
         
-        analysis_prompt = f"""
-Based on the following data, provide a comprehensive churn risk analysis:
-
-{customer_context}
-
-POLICY SUMMARY:
-- Total Policies: {analysis['total_policies']}
-- Active Policies: {analysis['active_policies']}
-- Cancelled Policies: {analysis['cancelled_policies']}
-- Expired Policies: {analysis['expired_policies']}
-- Total Annual Premium: ${analysis['total_premium']:,.2f}
-- Average Policy Duration: {analysis['avg_policy_duration']:.1f} months
-
-CHURN INDICATORS:
-- Cancellation Rate: {analysis['cancellation_rate']:.1%}
-- Recent Cancellations: {analysis['recent_cancellations']}
-- Payment Issues: {analysis['payment_issues']}
-- Policy Diversity: {analysis['policy_diversity']} different policy types
-- Customer Tenure: {analysis['customer_tenure_months']:.1f} months
-
-POLICY DETAILS:
-"""
+        # Unchanged customers get their earlier narrative back instead of a new completion
+        cache = get_narrative_cache()
+        cache_key = fingerprint(model, getattr(self.llm, 'temperature', None), inputs)
         
-        # Add policy type breakdown
-        if policy_data:
-            policy_types = {}
-            for policy in policy_data:
-                ptype = policy.get('policy_type', 'Unknown')
-                status = policy.get('status', 'Unknown')
-                if ptype not in policy_types:
-                    policy_types[ptype] = {'active': 0, 'cancelled': 0, 'expired': 0}
-                policy_types[ptype][status.lower()] = policy_types[ptype].get(status.lower(), 0) + 1
+        try:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                analysis['llm_analysis'] = cached
+                analysis['narrative_source'] = 'cache'
+                self._count("llm_cache_hits")
+            elif state.get("stream_analysis"):
+                # Leave the LLM call to stream_churn_analysis, so the caller can show
+                # the deterministic results first and the narrative as it is generated
+                state["pending_narrative"] = {
+                    'system_prompt': system_prompt,
+                    'analysis_prompt': analysis_prompt,
+                    'model': model,
+                    'cache_key': cache_key,
+                    'prompt_tokens': prompt_tokens
+                }
+                analysis['narrative_source'] = 'stream'
+            else:
+                messages = [
+                    SystemMessage(content=system_prompt),
+                    HumanMessage(content=analysis_prompt)
+                ]
+                
+                self._count("llm_calls")
+                started = time.monotonic()
+                # Throttled to the deployment's quotas; batch runs queue behind analysts
+                response = get_llm_executor().invoke(
+                    self.llm, messages, priority=state.get("llm_priority") or INTERACTIVE
+                )
+                get_usage_recorder().record_response(
+                    model, prompt_tokens, response.content, started,
+                    getattr(response, 'usage_metadata', None), state.get("customer_id")
+                )
+                analysis['llm_analysis'] = response.content
+                analysis['narrative_source'] = 'llm'
+                cache.put(cache_key, model, response.content)
             
-            analysis_prompt += "\n"
-            for ptype, counts in policy_types.items():
-                analysis_prompt += f"- {ptype}: {counts.get('active', 0)} active, {counts.get('cancelled', 0)} cancelled, {counts.get('expired', 0)} expired\n"
+        except Exception as e:
+            analysis['llm_analysis'] = self._llm_error(e)
         
-        analysis_prompt += f"""
-
-Please provide:
-1. Overall Churn Risk Score (Low/Medium/High/Critical) with confidence level
-2. Key risk factors identified from policy behavior
-3. Protective factors (reasons they might stay)
-4. Specific actionable recommendations to reduce churn risk
-5. Suggested next steps for customer outreach
+        state["churn_analysis"] = analysis
+        state["stage"] = "present"
+        
+        return state
 
-{"Note: Customer profile data is limited, so focus on policy behavior patterns and observable trends." if not has_customer_profile else ""}
+    def stream_churn_analysis(self, state: AgentState) -> Iterator[str]:
+        """
+        Generate the narrative left pending by analyze_churn_node in streaming
+        mode, yielding text chunks as the chat model produces them
 
-Format your response in a professional yet conversational tone, as if speaking to an insurance manager.
+        Once the stream is exhausted the full narrative is stored in
+        state["churn_analysis"]["llm_analysis"] (and in the narrative cache);
+        a stream abandoned part way stays pending and starts over next time.
+        Without a pending narrative, the existing one is yielded whole.
         """
         
+        analysis = state.get("churn_analysis") or {}
+        pending = state.get("pending_narrative")
+        if not pending:
+            yield analysis.get('llm_analysis', '')
+            return
+        
+        messages = [
+            SystemMessage(content=pending['system_prompt']),
+            HumanMessage(content=pending['analysis_prompt'])
+        ]
+        
+        chunks = []
         try:
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=analysis_prompt)
-            ]
+            self._count("llm_calls")
+            started = time.monotonic()
+            usage = None
+            for chunk in get_llm_executor().stream(self.llm, messages):
+                # The final chunk carries the token usage when the model reports it
+                usage = getattr(chunk, 'usage_metadata', None) or usage
+                if chunk.content:
+                    chunks.append(chunk.content)
+                    yield chunk.content
             
-            response = self.llm.invoke(messages)
-            analysis['llm_analysis'] = response.content
+            get_usage_recorder().record_response(
+                pending['model'], pending['prompt_tokens'], "".join(chunks), started,
+                usage, state.get("customer_id"), streamed=True
+            )
+            analysis['llm_analysis'] = "".join(chunks)
+            analysis['narrative_source'] = 'llm'
+            state.pop("pending_narrative", None)
+            get_narrative_cache().put(pending['cache_key'], pending['model'], analysis['llm_analysis'])
             
         except Exception as e:
-            analysis['llm_analysis'] = f"Error generating detailed analysis: {str(e)}\n\nPlease check your Azure OpenAI configuration.\n\nMake sure you're using a CHAT model (gpt-4 or gpt-35-turbo), not an embedding model."
-        
-        state["churn_analysis"] = analysis
-        state["stage"] = "present"
-        
-        return state
+            error = self._llm_error(e)
+            analysis['llm_analysis'] = "".join(chunks) + ("\n\n" if chunks else "") + error
+            state.pop("pending_narrative", None)
+            yield ("\n\n" if chunks else "") + error
+
+    @staticmethod
+    def _llm_error(e: Exception) -> str:
+        return f"Error generating detailed analysis: {str(e)}\n\nPlease check your Azure OpenAI configuration.\n\nMake sure you're using a CHAT model (gpt-4 or gpt-35-turbo), not an embedding model."
 
     def present_results_node(self, state: AgentState) -> AgentState:
         """Present churn analysis results to user"""
@@ -525,7 +576,8 @@ Please let me know how I can help you further.
 
     # Helper Methods
     
-    def _calculate_churn_factors(self, customer_data: Dict, policy_data: List[Dict]) -> Dict[str, Any]:
+    @staticmethod
+    def _calculate_churn_factors(customer_data: Dict, policy_data: List[Dict]) -> Dict[str, Any]:
         """Calculate various churn risk factors"""
         
         # Handle None or empty policy data
@@ -605,7 +657,8 @@ Please let me know how I can help you further.
             'payment_issues': payment_issues
         }
     
-    def _calculate_risk_score(self, analysis: Dict[str, Any]) -> float:
+    @staticmethod
+    def _calculate_risk_score(analysis: Dict[str, Any]) -> float:
         """
         Production-grade churn risk scoring
         Score range: 0 (no risk) → 100 (maximum churn risk)
@@ -734,7 +787,8 @@ Please let me know how I can help you further.
     #     return min(score, 100)
 
 
-    def _get_risk_level(self, score: float) -> str:
+    @staticmethod
+    def _get_risk_level(score: float) -> str:
         if score < 25:
             return "LOW"
         elif score < 50:
@@ -753,6 +807,101 @@ Please let me know how I can help you further.
     #     else:
     #         return "HIGH"
 
+    @staticmethod
+    def _template_narrative(customer_data: Dict, analysis: Dict[str, Any], risk_score: float, risk_level: str) -> str:
+        """Narrative in the LLM analysis' structure, built from the computed churn factors"""
+        
+        name = f"{customer_data.get('first_name', 'Unknown')} {customer_data.get('last_name', 'Customer')}"
+        active = analysis.get('active_policies', 0)
+        diversity = analysis.get('policy_diversity', 0)
+        tenure = analysis.get('customer_tenure_months', 0)
+        premium = analysis.get('total_premium', 0)
+        cancellation_rate = analysis.get('cancellation_rate', 0)
+        recent = analysis.get('recent_cancellations', 0)
+        payment_issues = analysis.get('payment_issues', 0)
+        
+        risk_factors = []
+        if cancellation_rate > 0:
+            risk_factors.append(f"{cancellation_rate:.0%} of policies have been cancelled")
+        if recent:
+            risk_factors.append(f"{recent} cancellation(s) in the last 12 months")
+        if payment_issues:
+            risk_factors.append(f"{payment_issues} policy(ies) not set to auto-renew")
+        if active <= 1:
+            risk_factors.append("No active policies" if active <= 0 else "Only one active policy")
+        if diversity <= 1:
+            risk_factors.append("Coverage concentrated in a single policy type")
+        if tenure <= 12:
+            risk_factors.append(f"Short relationship ({tenure:.1f} months)")
+        if premium <= 500:
+            risk_factors.append(f"Low total annual premium (${premium:,.2f})")
+        
+        protective_factors = []
+        if active >= 3:
+            protective_factors.append(f"{active} active policies")
+        if diversity >= 2:
+            protective_factors.append(f"{diversity} different policy types")
+        if tenure > 36:
+            protective_factors.append(f"Long-standing customer ({tenure:.1f} months)")
+        if premium > 1500:
+            protective_factors.append(f"Significant premium commitment (${premium:,.2f} per year)")
+        if not analysis.get('cancelled_policies'):
+            protective_factors.append("No cancelled policies")
+        if not payment_issues and analysis.get('total_policies'):
+            protective_factors.append("All policies set to auto-renew")
+        
+        recommendations = ["Keep the customer on the standard renewal and service schedule"]
+        if diversity <= 1:
+            recommendations.append("Offer a complementary policy type (bundling discount)")
+        if payment_issues:
+            recommendations.append("Encourage enabling auto-renew on the remaining policies")
+        if recent or cancellation_rate > 0:
+            recommendations.append("Review the reasons behind past cancellations")
+        if risk_level != "LOW":
+            recommendations.append("Schedule a proactive coverage review before the next renewal")
+        
+        next_steps = "Routine follow-up at the next renewal." if risk_level == "LOW" else \
+            "Agent check-in within the next 30 days to review coverage and pricing."
+        
+        def bullets(items: List[str], empty: str) -> str:
+            return "\n".join(f"- {item}" for item in items) if items else f"- {empty}"
+        
+        return f"""**Churn Risk: {risk_level}** ({risk_score:.1f}/100, rule-based assessment)
+
+{name}'s risk score is below the threshold for a detailed AI analysis, so this summary is generated from the computed churn factors.
+
+**Key Risk Factors**
+{bullets(risk_factors, "No significant risk factors identified")}
+
+**Protective Factors**
+{bullets(protective_factors, "No notable protective factors identified")}
+
+**Recommendations**
+{bullets(recommendations, "")}
+
+**Next Steps:** {next_steps}
+"""
+
+    def llm_usage(self) -> Dict[str, int]:
+        """
+        Narratives generated by the LLM, served from the cache, or templated
+        instead of an LLM call, and the process' prompt / completion tokens
+        """
+        tokens = get_usage_recorder().totals()
+        with self._usage_lock:
+            return {
+                'llm_calls': self.llm_calls,
+                'cache_hits': self.llm_cache_hits,
+                'llm_calls_skipped': self.llm_calls_skipped,
+                'prompt_tokens': tokens['prompt_tokens'],
+                'completion_tokens': tokens['completion_tokens']
+            }
+
+    def _count(self, counter: str):
+        """Increment a usage counter (called from analyze_customers' worker threads)"""
+        with self._usage_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
     def _calculate_age(self, dob: str) -> int:
         """Calculate age from date of birth"""
         if not dob:
@@ -828,6 +977,41 @@ Please let me know how I can help you further.
             }
         ]
 
+    def analyze_customers(self, customer_ids: List[str], force_llm: bool = False) -> Dict[str, Dict[str, Any]]:
+        """
+        Analyze many customers concurrently at BATCH priority
+
+        LLM calls go through the shared llm_executor, which keeps them within
+        the deployment's request and token quotas, retries 429s and lets
+        interactive analyses overtake the batch.
+
+        Returns:
+            {customer_id: churn analysis (with 'risk_score' and 'risk_level')}
+        """
+        
+        def analyze(customer_id: str) -> Dict[str, Any]:
+            state = {
+                "messages": [],
+                "customer_id": customer_id,
+                "customer_data": None,
+                "policy_data": None,
+                "churn_analysis": None,
+                "force_llm": force_llm,
+                "llm_priority": BATCH,
+                "stage": "retrieve"
+            }
+            state = self.retrieve_data_node(state)
+            if not state.get("customer_data") and not state.get("policy_data"):
+                return {}
+            
+            analysis = self.analyze_churn_node(state).get("churn_analysis") or {}
+            analysis['risk_score'] = self._calculate_risk_score(analysis)
+            analysis['risk_level'] = self._get_risk_level(analysis['risk_score'])
+            return analysis
+        
+        with ThreadPoolExecutor(max_workers=LLM_CONCURRENCY) as pool:
+            return dict(zip(customer_ids, pool.map(analyze, customer_ids)))
+
     def run_interactive(self):
         """Run the agent in interactive mode"""
         
@@ -922,6 +1106,11 @@ Please let me know how I can help you further.
             else:
                 break
         
+        usage = self.llm_usage()
+        print(f"\n📈 Narratives: {usage['llm_calls']} from the LLM, {usage['cache_hits']} cached, "
+              f"{usage['llm_calls_skipped']} LLM calls skipped (risk below {self.llm_min_risk_score:g}); "
+              f"{usage['prompt_tokens']:,} prompt / {usage['completion_tokens']:,} completion tokens")
+        
         print("\n" + "="*80)
         print("Thank you for using the Churn Prediction Agent! Goodbye! 👋")
         print("="*80 + "\n")
@@ -0,0 +1,170 @@
+"""
+client_registry.py - Process-wide shared Cosmos DB and Azure OpenAI clients
+Hands out one thread-safe client per endpoint and credential, each with a
+sized, keep-alive HTTP connection pool, instead of a new pool per retriever
+"""
+
+import os
+import hashlib
+import threading
+from typing import Any, Dict, Tuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from azure.core.pipeline.transport import RequestsTransport
+from azure.cosmos import CosmosClient
+from openai import AzureOpenAI
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuration
+COSMOS_CONNECTION_POOL_SIZE = int(os.getenv("COSMOS_CONNECTION_POOL_SIZE", "32"))
+OPENAI_CONNECTION_POOL_SIZE = int(os.getenv("OPENAI_CONNECTION_POOL_SIZE", "32"))
+# How long idle OpenAI connections are kept open for reuse
+OPENAI_KEEPALIVE_SECONDS = float(os.getenv("OPENAI_KEEPALIVE_SECONDS", "60"))
+
+_cosmos_clients: Dict[Tuple[str, str], CosmosClient] = {}
+_openai_clients: Dict[Tuple[str, str, str], AzureOpenAI] = {}
+# azure.cosmos.aio / AsyncAzureOpenAI clients, used on the shared event loop (async_runtime.py)
+_async_cosmos_clients: Dict[Tuple[str, str], Any] = {}
+_async_openai_clients: Dict[Tuple[str, str, str], Any] = {}
+_lock = threading.Lock()
+
+
+def _credential_id(credential: str) -> str:
+    """Fingerprint a credential so raw keys are not used as dictionary keys"""
+    return hashlib.sha256((credential or "").encode("utf-8")).hexdigest()
+
+
+def get_cosmos_client(endpoint: str, key: str) -> CosmosClient:
+    """
+    Return the shared CosmosClient for an account endpoint and key
+
+    CosmosClient is thread-safe, so every retriever, RAG system and the churn
+    agent in the process can use the same instance and its connection pool.
+    """
+    registry_key = (endpoint or "", _credential_id(key))
+
+    with _lock:
+        client = _cosmos_clients.get(registry_key)
+        if client is None:
+            # requests keeps connections alive by default; size the pool so
+            # concurrent searches don't queue for a socket
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=COSMOS_CONNECTION_POOL_SIZE,
+                pool_maxsize=COSMOS_CONNECTION_POOL_SIZE
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+
+            client = CosmosClient(
+                endpoint,
+                key,
+                transport=RequestsTransport(session=session, session_owner=False)
+            )
+            _cosmos_clients[registry_key] = client
+
+        return client
+
+
+def get_openai_client(endpoint: str, key: str, api_version: str) -> AzureOpenAI:
+    """Return the shared AzureOpenAI client for an endpoint, key and API version"""
+    registry_key = (endpoint or "", _credential_id(key), api_version or "")
+
+    with _lock:
+        client = _openai_clients.get(registry_key)
+        if client is None:
+            http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_CONNECTION_POOL_SIZE,
+                    max_keepalive_connections=OPENAI_CONNECTION_POOL_SIZE,
+                    keepalive_expiry=OPENAI_KEEPALIVE_SECONDS
+                )
+            )
+            client = AzureOpenAI(
+                azure_endpoint=endpoint,
+                api_key=key,
+                api_version=api_version,
+                http_client=http_client
+            )
+            _openai_clients[registry_key] = client
+
+        return client
+
+
+def get_container(prefix: str):
+    """
+    Return the container configured by <prefix>_ENDPOINT, _KEY, _DATABASE_NAME
+    and _CONTAINER_NAME (e.g. prefix 'COSMOS_ret'), on the shared client
+    """
+    client = get_cosmos_client(os.getenv(f"{prefix}_ENDPOINT"), os.getenv(f"{prefix}_KEY"))
+    database = client.get_database_client(os.getenv(f"{prefix}_DATABASE_NAME"))
+    return database.get_container_client(os.getenv(f"{prefix}_CONTAINER_NAME"))
+
+
+# ============================================================================
+# ASYNC CLIENTS
+# ============================================================================
+
+def get_async_cosmos_client(endpoint: str, key: str):
+    """
+    Return the shared azure.cosmos.aio CosmosClient for an account endpoint and key
+
+    Its aiohttp connection pool is bound to the event loop it is first used
+    on, so async code should only use it on the shared loop (async_runtime.py).
+    """
+    from azure.cosmos.aio import CosmosClient as AsyncCosmosClient
+
+    registry_key = (endpoint or "", _credential_id(key))
+
+    with _lock:
+        client = _async_cosmos_clients.get(registry_key)
+        if client is None:
+            client = AsyncCosmosClient(endpoint, key)
+            _async_cosmos_clients[registry_key] = client
+
+        return client
+
+
+def get_async_openai_client(endpoint: str, key: str, api_version: str):
+    """Return the shared AsyncAzureOpenAI client for an endpoint, key and API version"""
+    from openai import AsyncAzureOpenAI
+
+    registry_key = (endpoint or "", _credential_id(key), api_version or "")
+
+    with _lock:
+        client = _async_openai_clients.get(registry_key)
+        if client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=OPENAI_CONNECTION_POOL_SIZE,
+                    max_keepalive_connections=OPENAI_CONNECTION_POOL_SIZE,
+                    keepalive_expiry=OPENAI_KEEPALIVE_SECONDS
+                )
+            )
+            client = AsyncAzureOpenAI(
+                azure_endpoint=endpoint,
+                api_key=key,
+                api_version=api_version,
+                http_client=http_client
+            )
+            _async_openai_clients[registry_key] = client
+
+        return client
+
+
+async def close_async_clients():
+    """Close every async client and its connections (run on the shared event loop)"""
+    with _lock:
+        clients = list(_async_cosmos_clients.values()) + list(_async_openai_clients.values())
+        _async_cosmos_clients.clear()
+        _async_openai_clients.clear()
+
+    for client in clients:
+        try:
+            await client.close()
+        except Exception as e:
+            print(f"⚠️  Error closing async client: {e}")
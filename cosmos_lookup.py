@@ -0,0 +1,206 @@
+"""
+cosmos_lookup.py - Partition-key-aware ID lookups for Cosmos DB containers
+Uses point reads when the looked-up ID is the partition key, single-partition
+queries when it is the partition key but not the document id, and falls back
+to cross-partition queries only when the key layout is unknown
+"""
+
+import threading
+from typing import List, Dict, Any, Optional
+
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
+
+from projections import select_fields
+
+
+def _lookup_query(fields: Optional[List[str]], field: str, value: Any, limit_one: bool):
+    """Equality query (and its parameters) shared by the sync and async lookups"""
+    top = "TOP 1 " if limit_one else ""
+    projection = select_fields(fields) if fields else "*"
+    query = f"SELECT {top}{projection} FROM c WHERE c.{field} = @value"
+    return query, [{"name": "@value", "value": value}]
+
+
+def _project(document: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """Client-side equivalent of the query projection, for point-read documents"""
+    if not fields:
+        return document
+    return {field: document[field] for field in fields if field in document}
+
+
+def _single_key_path(properties: Dict[str, Any]) -> Optional[str]:
+    """Partition key path from container properties (hierarchical keys count as unknown)"""
+    paths = properties.get('partitionKey', {}).get('paths', [])
+    return paths[0] if len(paths) == 1 else None
+
+
+class PartitionKeyLookup:
+    """
+    ID lookups for one container that avoid fanning out to every partition
+
+    The container's partition key path is read once (lazily) from its
+    properties. For a lookup on `field` = value:
+
+    - partition key is /<field> or /id: try read_item(value, partition_key=value),
+      which costs ~1 RU when the document id equals the value
+    - partition key is /<field>: otherwise run the query scoped to that one
+      partition
+    - anything else (other key, hierarchical key, properties unreadable):
+      the original cross-partition query
+
+    read_item always returns the whole document (embedding included), so with
+    a projection the point-read document is cut down to the projected fields
+    client-side: the read is still far cheaper than a query, and callers get
+    the same shape either way.
+    """
+
+    def __init__(self, container, fields: Optional[List[str]] = None):
+        """
+        Args:
+            container: Cosmos DB container client
+            fields: Fields to return (server-side projection); None for whole documents
+        """
+        self.container = container
+        self.fields = fields
+        self._partition_key_path: Optional[str] = None
+        self._resolved = False
+        # Fields whose values turned out not to be document ids; skip point reads for them
+        self._point_read_disabled = set()
+        self._lock = threading.Lock()
+
+    @property
+    def partition_key_path(self) -> Optional[str]:
+        """Single-level partition key path (e.g. '/customer_id'), or None if unknown"""
+        if not self._resolved:
+            with self._lock:
+                if not self._resolved:
+                    try:
+                        # Hierarchical keys need every level, so treat them as unknown
+                        self._partition_key_path = _single_key_path(self.container.read())
+                    except Exception as e:
+                        print(f"⚠️  Could not read partition key layout, using cross-partition queries: {e}")
+                        self._partition_key_path = None
+                    self._resolved = True
+        return self._partition_key_path
+
+    def get_one(self, field: str, value: Any) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve the first document whose `field` equals value
+
+        Args:
+            field: Top-level document field (e.g. 'customer_id')
+            value: Value to look up
+
+        Returns:
+            The document, or None if not found
+        """
+        pk_path = self.partition_key_path
+        field_is_key = pk_path == f"/{field}"
+
+        can_point_read = (field_is_key or pk_path == "/id") and field not in self._point_read_disabled
+        if can_point_read:
+            try:
+                return _project(self.container.read_item(item=value, partition_key=value), self.fields)
+            except CosmosResourceNotFoundError:
+                pass
+
+        items = self._query(field, value, partition_key=value if field_is_key else None, limit_one=True)
+        if can_point_read and items and field != "id":
+            # The point read missed a document the query found, so its id is not
+            # this field's value: point reads on this field will never hit
+            self._point_read_disabled.add(field)
+
+        return items[0] if items else None
+
+    def get_all(self, field: str, value: Any) -> List[Dict[str, Any]]:
+        """
+        Retrieve every document whose `field` equals value
+
+        Args:
+            field: Top-level document field (e.g. 'customer_id')
+            value: Value to look up
+
+        Returns:
+            List of matching documents
+        """
+        field_is_key = self.partition_key_path == f"/{field}"
+        return self._query(field, value, partition_key=value if field_is_key else None)
+
+    def _query(self, field: str, value: Any, partition_key: Any = None,
+               limit_one: bool = False) -> List[Dict[str, Any]]:
+        """Run the equality query, scoped to one partition when the key is known"""
+        query, parameters = _lookup_query(self.fields, field, value, limit_one)
+
+        if partition_key is not None:
+            return list(self.container.query_items(
+                query=query,
+                parameters=parameters,
+                partition_key=partition_key
+            ))
+
+        return list(self.container.query_items(
+            query=query,
+            parameters=parameters,
+            enable_cross_partition_query=True
+        ))
+
+
+class AsyncPartitionKeyLookup:
+    """
+    PartitionKeyLookup for azure.cosmos.aio containers
+
+    Same strategy (point read, single-partition query, cross-partition
+    fallback); every method is a coroutine.
+    """
+
+    def __init__(self, container, fields: Optional[List[str]] = None):
+        """
+        Args:
+            container: azure.cosmos.aio container client
+            fields: Fields to return (server-side projection); None for whole documents
+        """
+        self.container = container
+        self.fields = fields
+        self._partition_key_path: Optional[str] = None
+        self._resolved = False
+        self._point_read_disabled = set()
+
+    async def partition_key_path(self) -> Optional[str]:
+        """Single-level partition key path (e.g. '/customer_id'), or None if unknown"""
+        if not self._resolved:
+            try:
+                self._partition_key_path = _single_key_path(await self.container.read())
+            except Exception as e:
+                print(f"⚠️  Could not read partition key layout, using cross-partition queries: {e}")
+                self._partition_key_path = None
+            self._resolved = True
+        return self._partition_key_path
+
+    async def get_one(self, field: str, value: Any) -> Optional[Dict[str, Any]]:
+        """Retrieve the first document whose `field` equals value"""
+        pk_path = await self.partition_key_path()
+        field_is_key = pk_path == f"/{field}"
+
+        can_point_read = (field_is_key or pk_path == "/id") and field not in self._point_read_disabled
+        if can_point_read:
+            try:
+                return _project(await self.container.read_item(item=value, partition_key=value), self.fields)
+            except CosmosResourceNotFoundError:
+                pass
+
+        items = await self._query(field, value, partition_key=value if field_is_key else None, limit_one=True)
+        if can_point_read and items and field != "id":
+            self._point_read_disabled.add(field)
+
+        return items[0] if items else None
+
+    async def get_all(self, field: str, value: Any) -> List[Dict[str, Any]]:
+        """Retrieve every document whose `field` equals value"""
+        field_is_key = await self.partition_key_path() == f"/{field}"
+        return await self._query(field, value, partition_key=value if field_is_key else None)
+
+    async def _query(self, field: str, value: Any, partition_key: Any = None,
+                     limit_one: bool = False) -> List[Dict[str, Any]]:
+        query, parameters = _lookup_query(self.fields, field, value, limit_one)
+        kwargs = {"partition_key": partition_key} if partition_key is not None else {}
+        return [item async for item in self.container.query_items(query=query, parameters=parameters, **kwargs)]
@@ -5,9 +5,24 @@ Combines vector search (semantic) + full-text search (keyword) for optimal resul
 
 import os
 import json
-from azure.cosmos import CosmosClient
-from openai import AzureOpenAI
-from typing import List, Dict, Any, Optional
+from client_registry import get_cosmos_client, get_openai_client
+from embedding_batcher import get_embedding_batcher
+from cosmos_lookup import PartitionKeyLookup
+import cust_ret
+from projections import CUSTOMER_FIELDS, CUSTOMER_SEARCH_FIELDS
+from query_pages import iter_query_pages, QUERY_PAGE_SIZE
+from vector_index import load_vector_index
+from keyword_index import (
+    get_keyword_index, keyword_scores, add_keyword_candidates,
+    customer_keyword_text, CUSTOMER_KEYWORD_FIELDS
+)
+from change_feed_sync import start_change_feed_sync
+from statistics_engine import get_statistics_engine, CUSTOMER_STATISTICS
+from fusion import (
+    get_fusion_strategy, rank_by_scores,
+    HYBRID_CANDIDATE_MULTIPLIER, HYBRID_MAX_CANDIDATES, HYBRID_FUSION_STRATEGY
+)
+from typing import Iterator, List, Dict, Any, Optional, Tuple
 
 from dotenv import load_dotenv
 import os
@@ -19,6 +34,8 @@ COSMOS_hybrid_ENDPOINT = os.getenv("COSMOS_hybrid_ENDPOINT")
 COSMOS_hybrid_KEY = os.getenv("COSMOS_hybrid_KEY")
 COSMOS_hybrid_DATABASE_NAME = os.getenv("COSMOS_hybrid_DATABASE_NAME")
 COSMOS_hybrid_CONTAINER_NAME = os.getenv("COSMOS_hybrid_CONTAINER_NAME")
+# Optional local ANN index built with vector_index.py
+COSMOS_hybrid_VECTOR_INDEX_PATH = os.getenv("COSMOS_hybrid_VECTOR_INDEX_PATH")
 
 
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
@@ -32,16 +49,27 @@ class CustomerRetriever:
         print("Initializing retrieval client with HYBRID SEARCH...")
 
         # Initialize Cosmos DB client
-        self.cosmos_client = CosmosClient(COSMOS_hybrid_ENDPOINT, COSMOS_hybrid_KEY)
+        self.cosmos_client = get_cosmos_client(COSMOS_hybrid_ENDPOINT, COSMOS_hybrid_KEY)
         self.database = self.cosmos_client.get_database_client(COSMOS_hybrid_DATABASE_NAME)
         self.container = self.database.get_container_client(COSMOS_hybrid_CONTAINER_NAME)
+        self.lookup = PartitionKeyLookup(self.container, CUSTOMER_FIELDS)
+        self.index = load_vector_index(COSMOS_hybrid_VECTOR_INDEX_PATH)
+        if self.index is not None:
+            # Keep the index current with inserts and updates from the change feed
+            start_change_feed_sync("COSMOS_hybrid", self.container, self.index)
+        # Start building the corpus-wide keyword index in the background
+        self.get_keyword_index()
 
         # Initialize Azure OpenAI client for vector search
-        self.openai_client = AzureOpenAI(
-            azure_endpoint=AZURE_OPENAI_ENDPOINT,
-            api_key=AZURE_OPENAI_KEY,
-            api_version=AZURE_OPENAI_API_VERSION
+        self.openai_client = get_openai_client(
+            AZURE_OPENAI_ENDPOINT,
+            AZURE_OPENAI_KEY,
+            AZURE_OPENAI_API_VERSION
         )
+        self.embedder = get_embedding_batcher(self.openai_client, AZURE_OPENAI_DEPLOYMENT, AZURE_OPENAI_ENDPOINT)
+
+        # Fusion of vector and keyword rankings: 'rrf', 'weighted' or an object with fuse()
+        self.fusion_strategy = HYBRID_FUSION_STRATEGY
 
         print("✓ Client initialized successfully")
         print("✓ Hybrid Search enabled (Vector + Full-Text)\n")
@@ -50,20 +78,10 @@ class CustomerRetriever:
         """Retrieve complete customer details by customer_id"""
 
         try:
-            query = "SELECT * FROM c WHERE c.customer_id = @customer_id"
-            parameters = [{"name": "@customer_id", "value": customer_id}]
+            # Single-partition projected query when customer_id is the partition key
+            customer = self.lookup.get_one('customer_id', customer_id)
 
-            items = list(self.container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
-
-            if items:
-                customer = items[0]
-                # Remove embedding from response (too large and not needed for display)
-                if 'embedding' in customer:
-                    del customer['embedding']
+            if customer:
                 return customer
             else:
                 return None
@@ -75,16 +93,29 @@ class CustomerRetriever:
     def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding vector for search query"""
 
+        # Cached queries return immediately; concurrent calls share one request
         try:
-            response = self.openai_client.embeddings.create(
-                input=text,
-                model=AZURE_OPENAI_DEPLOYMENT
-            )
-            return response.data[0].embedding
+            return self.embedder.embed(text)
         except Exception as e:
             print(f"Error generating embedding: {e}")
             raise
 
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embedding vectors for many texts in as few requests as possible"""
+
+        try:
+            return self.embedder.embed_many(texts)
+        except Exception as e:
+            print(f"Error generating embeddings: {e}")
+            raise
+
+    def get_keyword_index(self):
+        """Corpus-wide BM25 index over the customer container (None until its background build is done)"""
+        return get_keyword_index(
+            "COSMOS_hybrid", self.container, 'customer_id',
+            customer_keyword_text, CUSTOMER_KEYWORD_FIELDS
+        )
+
     def hybrid_search(
         self, 
         query_text: str, 
@@ -98,7 +129,7 @@ class CustomerRetriever:
         Implementation: Uses post-processing approach for maximum compatibility
         1. Performs vector search to get candidates
         2. Calculates keyword match scores
-        3. Combines scores with weights
+        3. Fuses the vector and keyword rankings (RRF or weighted sum, see fusion.py)
         
         Args:
             query_text: Search query
@@ -114,76 +145,71 @@ class CustomerRetriever:
             print(f"🔍 Running HYBRID SEARCH (Vector: {vector_weight:.0%}, Keyword: {fulltext_weight:.0%})")
             
             # Step 1: Get more candidates using vector search
-            # We fetch 3x the requested results to have a good pool for re-ranking
-            candidate_count = min(top_k * 3, 50)
+            # Rank fusion needs only a small pool per source (HYBRID_CANDIDATE_MULTIPLIER x top_k)
+            candidate_count = min(top_k * HYBRID_CANDIDATE_MULTIPLIER, HYBRID_MAX_CANDIDATES)
             
             # Generate embedding for query
             query_embedding = self.generate_embedding(query_text)
 
-            # Vector search query
-            query = """
-            SELECT TOP @top_k 
-                c.customer_id, 
-                c.first_name, 
-                c.last_name, 
-                c.email, 
-                c.phone,
-                c.occupation, 
-                c.annual_income, 
-                c.credit_score,
-                c.marital_status,
-                c.address,
-                c.metadata,
-                VectorDistance(c.embedding, @embedding) AS vector_score
-            FROM c
-            ORDER BY VectorDistance(c.embedding, @embedding)
-            """
-
-            parameters = [
-                {"name": "@top_k", "value": candidate_count},
-                {"name": "@embedding", "value": query_embedding}
-            ]
-
-            results = list(self.container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
+            # Rank candidates with the local index when one is loaded; only
+            # those documents are then read from Cosmos DB
+            if self.index is not None:
+                results = self.index.search_documents(
+                    self.container, query_embedding, candidate_count,
+                    CUSTOMER_SEARCH_FIELDS, 'vector_score'
+                )
+            else:
+                # Vector search query
+                query = """
+                SELECT TOP @top_k 
+                    c.customer_id, 
+                    c.first_name, 
+                    c.last_name, 
+                    c.email, 
+                    c.phone,
+                    c.occupation, 
+                    c.annual_income, 
+                    c.credit_score,
+                    c.marital_status,
+                    c.address,
+                    c.metadata,
+                    VectorDistance(c.embedding, @embedding) AS vector_score
+                FROM c
+                ORDER BY VectorDistance(c.embedding, @embedding)
+                """
+
+                parameters = [
+                    {"name": "@top_k", "value": candidate_count},
+                    {"name": "@embedding", "value": query_embedding}
+                ]
+
+                results = list(self.container.query_items(
+                    query=query,
+                    parameters=parameters,
+                    enable_cross_partition_query=True
+                ))
+
+            # Add the best keyword matches from the whole container, not just the
+            # vector candidates
+            keyword_index = self.get_keyword_index()
+            candidates = add_keyword_candidates(
+                results, keyword_index, query_text, self.container,
+                CUSTOMER_SEARCH_FIELDS, query_embedding, candidate_count
+            )
 
-            if not results:
+            if not candidates:
                 return []
             
-            # Step 2: Calculate keyword match scores for each result
-            query_terms = query_text.lower().split()
+            # Step 2: BM25 keyword scores over whole tokens (IDF from the whole container when indexed)
+            query_scores = keyword_scores(query_text, candidates, 'customer_id', customer_keyword_text, keyword_index)
             
-            for result in results:
-                # Create searchable text from customer fields
-                searchable_text = " ".join([
-                    str(result.get('first_name', '')),
-                    str(result.get('last_name', '')),
-                    str(result.get('occupation', '')),
-                    str(result.get('email', '')),
-                    str(result.get('address', {}).get('city', '')),
-                    str(result.get('address', {}).get('state', ''))
-                ]).lower()
-                
-                # Calculate keyword match score (0-1)
-                matches = sum(1 for term in query_terms if term in searchable_text)
-                keyword_score = matches / len(query_terms) if query_terms else 0
-                
-                # Normalize vector score to 0-1 range (vector_score is already 0-1)
-                vector_score_normalized = result['vector_score']
-                
-                # Calculate hybrid score
-                hybrid_score = (vector_weight * vector_score_normalized) + (fulltext_weight * keyword_score)
-                
-                # Add scores to result
-                result['fulltext_score'] = keyword_score
-                result['hybrid_score'] = hybrid_score
-            
-            # Step 3: Re-rank by hybrid score and return top_k
-            results.sort(key=lambda x: x['hybrid_score'], reverse=False)  # Lower is better for distance
-            results = results[:top_k]
+            # Step 3: Fuse the vector and keyword rankings and keep the top_k
+            fusion = get_fusion_strategy(self.fusion_strategy, vector_weight, fulltext_weight)
+            keyword_ranked, keyword_ranked_scores = rank_by_scores(candidates, query_scores)
+            results = fusion.fuse(
+                results, keyword_ranked, 'customer_id', top_k,
+                keyword_field='fulltext_score', keyword_scores=keyword_ranked_scores
+            )
             
             print(f"✓ Found {len(results)} results using hybrid search")
             return results
@@ -262,35 +288,9 @@ class CustomerRetriever:
         """Search customers by various criteria"""
 
         try:
-            conditions = []
-            parameters = []
-
-            if min_income is not None:
-                conditions.append("c.annual_income >= @min_income")
-                parameters.append({"name": "@min_income", "value": min_income})
-
-            if max_income is not None:
-                conditions.append("c.annual_income <= @max_income")
-                parameters.append({"name": "@max_income", "value": max_income})
-
-            if min_credit_score is not None:
-                conditions.append("c.credit_score >= @min_credit_score")
-                parameters.append({"name": "@min_credit_score", "value": min_credit_score})
-
-            if customer_segment:
-                conditions.append("c.metadata.customer_segment = @segment")
-                parameters.append({"name": "@segment", "value": customer_segment})
-
-            if state:
-                conditions.append("c.address.state = @state")
-                parameters.append({"name": "@state", "value": state})
-
-            if occupation:
-                conditions.append("CONTAINS(c.occupation, @occupation)")
-                parameters.append({"name": "@occupation", "value": occupation})
-
-            where_clause = " AND ".join(conditions) if conditions else "1=1"
-            query = f"SELECT * FROM c WHERE {where_clause}"
+            query, parameters = self._criteria_query(
+                min_income, max_income, min_credit_score, customer_segment, state, occupation
+            )
 
             results = list(self.container.query_items(
                 query=query,
@@ -298,17 +298,44 @@ class CustomerRetriever:
                 enable_cross_partition_query=True
             ))
 
-            # Remove embeddings from results
-            for result in results:
-                if 'embedding' in result:
-                    del result['embedding']
-
             return results
 
         except Exception as e:
             print(f"Error searching by criteria: {e}")
             return []
 
+    def search_by_criteria_pages(
+            self,
+            min_income: Optional[int] = None,
+            max_income: Optional[int] = None,
+            min_credit_score: Optional[int] = None,
+            customer_segment: Optional[str] = None,
+            state: Optional[str] = None,
+            occupation: Optional[str] = None,
+            page_size: int = QUERY_PAGE_SIZE,
+            continuation_token: Optional[str] = None
+    ) -> Iterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """
+        search_by_criteria one page at a time, so broad filters stream with
+        bounded memory
+
+        Args:
+            (criteria): Same filters as search_by_criteria
+            page_size: Customers per page (max_item_count)
+            continuation_token: Token yielded with an earlier page, to resume after it
+
+        Yields:
+            (customers, continuation token after them); query errors are
+            raised so the caller can resume from the last token
+        """
+        query, parameters = self._criteria_query(
+            min_income, max_income, min_credit_score, customer_segment, state, occupation
+        )
+        yield from iter_query_pages(self.container, query, parameters, page_size, continuation_token)
+
+    # Same filters and projection as the vector-only retriever
+    _criteria_query = staticmethod(cust_ret.CustomerRetriever._criteria_query)
+
     def hybrid_search_with_filters(
         self,
         query_text: str,
@@ -404,39 +431,29 @@ class CustomerRetriever:
                 enable_cross_partition_query=True
             ))
             
-            if not results:
+            # Add the best keyword matches from the whole container, not just the
+            # vector candidates
+            keyword_index = self.get_keyword_index()
+            candidates = add_keyword_candidates(
+                results, keyword_index, query_text, self.container,
+                CUSTOMER_SEARCH_FIELDS, query_embedding, candidate_count,
+                where_clause=where_clause, parameters=parameters
+            )
+
+            if not candidates:
                 print(f"✓ No results found matching the filters")
                 return []
             
-            # Post-process: Add keyword matching scores
-            query_terms = query_text.lower().split()
+            # Post-process: BM25 keyword scores over whole tokens
+            query_scores = keyword_scores(query_text, candidates, 'customer_id', customer_keyword_text, keyword_index)
             
-            for result in results:
-                # Create searchable text
-                searchable_text = " ".join([
-                    str(result.get('first_name', '')),
-                    str(result.get('last_name', '')),
-                    str(result.get('occupation', '')),
-                    str(result.get('email', '')),
-                    str(result.get('address', {}).get('city', '')),
-                    str(result.get('address', {}).get('state', ''))
-                ]).lower()
-                
-                # Calculate keyword match score
-                matches = sum(1 for term in query_terms if term in searchable_text)
-                keyword_score = matches / len(query_terms) if query_terms else 0
-                
-                # Calculate hybrid score
-                vector_score_normalized = result['vector_score']
-                hybrid_score = (vector_weight * vector_score_normalized) + (fulltext_weight * keyword_score)
-                
-                # Add scores
-                result['fulltext_score'] = keyword_score
-                result['hybrid_score'] = hybrid_score
-            
-            # Re-rank by hybrid score
-            results.sort(key=lambda x: x['hybrid_score'], reverse=False)
-            results = results[:top_k]
+            # Fuse the vector and keyword rankings and keep the top_k
+            fusion = get_fusion_strategy(self.fusion_strategy, vector_weight, fulltext_weight)
+            keyword_ranked, keyword_ranked_scores = rank_by_scores(candidates, query_scores)
+            results = fusion.fuse(
+                results, keyword_ranked, 'customer_id', top_k,
+                keyword_field='fulltext_score', keyword_scores=keyword_ranked_scores
+            )
             
             print(f"✓ Found {len(results)} filtered hybrid search results")
             return results
@@ -454,44 +471,11 @@ class CustomerRetriever:
             )
 
     def get_customer_statistics(self) -> Dict[str, Any]:
-        """Get basic statistics about customers in the database"""
+        """Get basic statistics about customers in the database (plus percentiles and histograms)"""
 
         try:
-            stats = {}
-
-            # Total count
-            count_query = "SELECT VALUE COUNT(1) FROM c"
-            stats['total_customers'] = list(self.container.query_items(
-                query=count_query,
-                enable_cross_partition_query=True
-            ))[0]
-
-            # Average income
-            avg_income_query = "SELECT VALUE AVG(c.annual_income) FROM c"
-            stats['average_income'] = round(list(self.container.query_items(
-                query=avg_income_query,
-                enable_cross_partition_query=True
-            ))[0], 2)
-
-            # Average credit score
-            avg_credit_query = "SELECT VALUE AVG(c.credit_score) FROM c"
-            stats['average_credit_score'] = round(list(self.container.query_items(
-                query=avg_credit_query,
-                enable_cross_partition_query=True
-            ))[0], 2)
-
-            # Segment distribution
-            segment_query = """
-            SELECT c.metadata.customer_segment AS segment, COUNT(1) AS count 
-            FROM c 
-            GROUP BY c.metadata.customer_segment
-            """
-            stats['segment_distribution'] = list(self.container.query_items(
-                query=segment_query,
-                enable_cross_partition_query=True
-            ))
-
-            return stats
+            # One shared snapshot from a single scan, kept current by the change feed
+            return get_statistics_engine("COSMOS_hybrid", self.container, CUSTOMER_STATISTICS).statistics()
 
         except Exception as e:
             print(f"Error fetching statistics: {e}")
@@ -761,30 +745,36 @@ def main():
                 occupation = occupation if occupation else None
 
                 print("\nSearching...")
-                results = retriever.search_by_criteria(
+                # Stream the matches page by page; only the ones shown are kept
+                results, total = [], 0
+                for page, _ in retriever.search_by_criteria_pages(
                     min_income=min_income,
                     max_income=max_income,
                     min_credit_score=min_credit,
                     customer_segment=segment,
                     state=state,
                     occupation=occupation
-                )
+                ):
+                    total += len(page)
+                    results.extend(page[:10 - len(results)])
 
                 if results:
-                    print(f"\n✓ Found {len(results)} customers matching criteria:\n")
-                    for i, customer in enumerate(results[:10], 1):
+                    print(f"\n✓ Found {total} customers matching criteria:\n")
+                    for i, customer in enumerate(results, 1):
                         print(f"{i}. {customer['first_name']} {customer['last_name']} ({customer['customer_id']})")
                         print(f"   Occupation: {customer['occupation']}")
                         print(f"   Income: ${customer['annual_income']:,} | Credit: {customer['credit_score']}")
                         print()
 
-                    if len(results) > 10:
-                        print(f"... and {len(results) - 10} more results")
+                    if total > 10:
+                        print(f"... and {total - 10} more results")
                 else:
                     print("❌ No customers match the criteria")
 
             except ValueError:
                 print("❌ Invalid input for numeric fields")
+            except Exception as e:
+                print(f"❌ Error searching by criteria: {e}")
 
         elif choice == "6":
             # Statistics
@@ -4,9 +4,13 @@ retrieval.py - Retrieve customer data from Azure Cosmos DB
 
 import os
 import json
-from azure.cosmos import CosmosClient
-from openai import AzureOpenAI
-from typing import List, Dict, Any, Optional
+from client_registry import get_cosmos_client, get_openai_client
+from embedding_batcher import get_embedding_batcher
+from cosmos_lookup import PartitionKeyLookup
+from projections import CUSTOMER_FIELDS, select_fields
+from query_pages import iter_query_pages, QUERY_PAGE_SIZE
+from statistics_engine import get_statistics_engine, CUSTOMER_STATISTICS
+from typing import Iterator, List, Dict, Any, Optional, Tuple
 
 from dotenv import load_dotenv
 import os
@@ -30,16 +34,18 @@ class CustomerRetriever:
         print("Initializing retrieval client...")
 
         # Initialize Cosmos DB client
-        self.cosmos_client = CosmosClient(COSMOS_ret_ENDPOINT, COSMOS_ret_KEY)
+        self.cosmos_client = get_cosmos_client(COSMOS_ret_ENDPOINT, COSMOS_ret_KEY)
         self.database = self.cosmos_client.get_database_client(COSMOS_ret_DATABASE_NAME)
         self.container = self.database.get_container_client(COSMOS_ret_CONTAINER_NAME)
+        self.lookup = PartitionKeyLookup(self.container, CUSTOMER_FIELDS)
 
         # Initialize Azure OpenAI client for vector search
-        self.openai_client = AzureOpenAI(
-            azure_endpoint=AZURE_OPENAI_ENDPOINT,
-            api_key=AZURE_OPENAI_KEY,
-            api_version=AZURE_OPENAI_API_VERSION
+        self.openai_client = get_openai_client(
+            AZURE_OPENAI_ENDPOINT,
+            AZURE_OPENAI_KEY,
+            AZURE_OPENAI_API_VERSION
         )
+        self.embedder = get_embedding_batcher(self.openai_client, AZURE_OPENAI_DEPLOYMENT, AZURE_OPENAI_ENDPOINT)
 
         print("✓ Client initialized successfully\n")
 
@@ -47,20 +53,10 @@ class CustomerRetriever:
         """Retrieve complete customer details by customer_id"""
 
         try:
-            query = "SELECT * FROM c WHERE c.customer_id = @customer_id"
-            parameters = [{"name": "@customer_id", "value": customer_id}]
+            # Single-partition projected query when customer_id is the partition key
+            customer = self.lookup.get_one('customer_id', customer_id)
 
-            items = list(self.container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
-
-            if items:
-                customer = items[0]
-                # Remove embedding from response (too large and not needed for display)
-                if 'embedding' in customer:
-                    del customer['embedding']
+            if customer:
                 return customer
             else:
                 return None
@@ -72,16 +68,22 @@ class CustomerRetriever:
     def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding vector for search query"""
 
+        # Cached queries return immediately; concurrent calls share one request
         try:
-            response = self.openai_client.embeddings.create(
-                input=text,
-                model=AZURE_OPENAI_DEPLOYMENT
-            )
-            return response.data[0].embedding
+            return self.embedder.embed(text)
         except Exception as e:
             print(f"Error generating embedding: {e}")
             raise
 
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embedding vectors for many texts in as few requests as possible"""
+
+        try:
+            return self.embedder.embed_many(texts)
+        except Exception as e:
+            print(f"Error generating embeddings: {e}")
+            raise
+
     def vector_search(self, query_text: str, top_k: int = 5) -> List[Dict[str, Any]]:
         """Search for similar customers using vector search"""
 
@@ -137,35 +139,9 @@ class CustomerRetriever:
         """Search customers by various criteria"""
 
         try:
-            conditions = []
-            parameters = []
-
-            if min_income is not None:
-                conditions.append("c.annual_income >= @min_income")
-                parameters.append({"name": "@min_income", "value": min_income})
-
-            if max_income is not None:
-                conditions.append("c.annual_income <= @max_income")
-                parameters.append({"name": "@max_income", "value": max_income})
-
-            if min_credit_score is not None:
-                conditions.append("c.credit_score >= @min_credit_score")
-                parameters.append({"name": "@min_credit_score", "value": min_credit_score})
-
-            if customer_segment:
-                conditions.append("c.metadata.customer_segment = @segment")
-                parameters.append({"name": "@segment", "value": customer_segment})
-
-            if state:
-                conditions.append("c.address.state = @state")
-                parameters.append({"name": "@state", "value": state})
-
-            if occupation:
-                conditions.append("CONTAINS(c.occupation, @occupation)")
-                parameters.append({"name": "@occupation", "value": occupation})
-
-            where_clause = " AND ".join(conditions) if conditions else "1=1"
-            query = f"SELECT * FROM c WHERE {where_clause}"
+            query, parameters = self._criteria_query(
+                min_income, max_income, min_credit_score, customer_segment, state, occupation
+            )
 
             results = list(self.container.query_items(
                 query=query,
@@ -173,56 +149,90 @@ class CustomerRetriever:
                 enable_cross_partition_query=True
             ))
 
-            # Remove embeddings from results
-            for result in results:
-                if 'embedding' in result:
-                    del result['embedding']
-
             return results
 
         except Exception as e:
             print(f"Error searching by criteria: {e}")
             return []
 
-    def get_customer_statistics(self) -> Dict[str, Any]:
-        """Get basic statistics about customers in the database"""
+    def search_by_criteria_pages(
+            self,
+            min_income: Optional[int] = None,
+            max_income: Optional[int] = None,
+            min_credit_score: Optional[int] = None,
+            customer_segment: Optional[str] = None,
+            state: Optional[str] = None,
+            occupation: Optional[str] = None,
+            page_size: int = QUERY_PAGE_SIZE,
+            continuation_token: Optional[str] = None
+    ) -> Iterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """
+        search_by_criteria one page at a time, so broad filters stream with
+        bounded memory
+
+        Args:
+            (criteria): Same filters as search_by_criteria
+            page_size: Customers per page (max_item_count)
+            continuation_token: Token yielded with an earlier page, to resume after it
+
+        Yields:
+            (customers, continuation token after them); query errors are
+            raised so the caller can resume from the last token
+        """
+        query, parameters = self._criteria_query(
+            min_income, max_income, min_credit_score, customer_segment, state, occupation
+        )
+        yield from iter_query_pages(self.container, query, parameters, page_size, continuation_token)
 
-        try:
-            stats = {}
+    @staticmethod
+    def _criteria_query(
+            min_income: Optional[int] = None,
+            max_income: Optional[int] = None,
+            min_credit_score: Optional[int] = None,
+            customer_segment: Optional[str] = None,
+            state: Optional[str] = None,
+            occupation: Optional[str] = None
+    ):
+        """Build the search_by_criteria query and parameters"""
 
-            # Total count
-            count_query = "SELECT VALUE COUNT(1) FROM c"
-            stats['total_customers'] = list(self.container.query_items(
-                query=count_query,
-                enable_cross_partition_query=True
-            ))[0]
+        conditions = []
+        parameters = []
 
-            # Average income
-            avg_income_query = "SELECT VALUE AVG(c.annual_income) FROM c"
-            stats['average_income'] = round(list(self.container.query_items(
-                query=avg_income_query,
-                enable_cross_partition_query=True
-            ))[0], 2)
+        if min_income is not None:
+            conditions.append("c.annual_income >= @min_income")
+            parameters.append({"name": "@min_income", "value": min_income})
 
-            # Average credit score
-            avg_credit_query = "SELECT VALUE AVG(c.credit_score) FROM c"
-            stats['average_credit_score'] = round(list(self.container.query_items(
-                query=avg_credit_query,
-                enable_cross_partition_query=True
-            ))[0], 2)
+        if max_income is not None:
+            conditions.append("c.annual_income <= @max_income")
+            parameters.append({"name": "@max_income", "value": max_income})
 
-            # Segment distribution
-            segment_query = """
-                SELECT c.metadata.customer_segment as segment, COUNT(1) as count
-                FROM c
-                GROUP BY c.metadata.customer_segment
-            """
-            stats['segment_distribution'] = list(self.container.query_items(
-                query=segment_query,
-                enable_cross_partition_query=True
-            ))
+        if min_credit_score is not None:
+            conditions.append("c.credit_score >= @min_credit_score")
+            parameters.append({"name": "@min_credit_score", "value": min_credit_score})
+
+        if customer_segment:
+            conditions.append("c.metadata.customer_segment = @segment")
+            parameters.append({"name": "@segment", "value": customer_segment})
 
-            return stats
+        if state:
+            conditions.append("c.address.state = @state")
+            parameters.append({"name": "@state", "value": state})
+
+        if occupation:
+            conditions.append("CONTAINS(c.occupation, @occupation)")
+            parameters.append({"name": "@occupation", "value": occupation})
+
+        where_clause = " AND ".join(conditions) if conditions else "1=1"
+        # Project every field except the embedding so vectors never leave Cosmos
+        query = f"SELECT {select_fields(CUSTOMER_FIELDS)} FROM c WHERE {where_clause}"
+        return query, parameters
+
+    def get_customer_statistics(self) -> Dict[str, Any]:
+        """Get basic statistics about customers in the database (plus percentiles and histograms)"""
+
+        try:
+            # One shared snapshot from a single scan, kept current by the change feed
+            return get_statistics_engine("COSMOS_ret", self.container, CUSTOMER_STATISTICS).statistics()
 
         except Exception as e:
             print(f"Error getting statistics: {e}")
@@ -389,30 +399,36 @@ def main():
                 occupation = occupation if occupation else None
 
                 print("\nSearching...")
-                results = retriever.search_by_criteria(
+                # Stream the matches page by page; only the ones shown are kept
+                results, total = [], 0
+                for page, _ in retriever.search_by_criteria_pages(
                     min_income=min_income,
                     max_income=max_income,
                     min_credit_score=min_credit,
                     customer_segment=segment,
                     state=state,
                     occupation=occupation
-                )
+                ):
+                    total += len(page)
+                    results.extend(page[:10 - len(results)])
 
                 if results:
-                    print(f"\n✓ Found {len(results)} customers matching criteria:\n")
-                    for i, customer in enumerate(results[:10], 1):
+                    print(f"\n✓ Found {total} customers matching criteria:\n")
+                    for i, customer in enumerate(results, 1):
                         print(f"{i}. {customer['first_name']} {customer['last_name']} ({customer['customer_id']})")
                         print(f"   Occupation: {customer['occupation']}")
                         print(f"   Income: ${customer['annual_income']:,} | Credit: {customer['credit_score']}")
                         print()
 
-                    if len(results) > 10:
-                        print(f"... and {len(results) - 10} more results")
+                    if total > 10:
+                        print(f"... and {total - 10} more results")
                 else:
                     print("❌ No customers match the criteria")
 
             except ValueError:
                 print("❌ Invalid input for numeric fields")
+            except Exception as e:
+                print(f"❌ Error searching by criteria: {e}")
 
         elif choice == "4":
             # Statistics
@@ -426,6 +442,8 @@ def main():
                 print(f"\nTotal Customers: {stats.get('total_customers', 0):,}")
                 print(f"Average Income: ${stats.get('average_income', 0):,.2f}")
                 print(f"Average Credit Score: {stats.get('average_credit_score', 0):.2f}")
+                print(f"Median Income: ${stats.get('income_percentiles', {}).get('p50', 0):,.2f}")
+                print(f"Median Credit Score: {stats.get('credit_score_percentiles', {}).get('p50', 0):.0f}")
 
                 print("\nCustomer Segment Distribution:")
                 for segment in stats.get('segment_distribution', []):
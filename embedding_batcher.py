@@ -0,0 +1,312 @@
+"""
+embedding_batcher.py - Batched embedding requests with automatic coalescing
+Packs many inputs into a single embeddings.create call and gathers concurrent
+single-text calls that arrive within a short window into one batch
+(AsyncEmbeddingBatcher does the same on the event loop for AsyncAzureOpenAI)
+"""
+
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import List, Dict, Tuple, Optional
+
+from dotenv import load_dotenv
+
+from embedding_cache import EmbeddingCache, get_embedding_cache, normalize_text
+
+load_dotenv()
+
+# Configuration
+# The embeddings endpoint accepts at most 2048 inputs per request
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "2048"))
+# How long the first caller waits for others to join its batch (0 disables coalescing)
+EMBEDDING_COALESCE_WINDOW_MS = float(os.getenv("EMBEDDING_COALESCE_WINDOW_MS", "5"))
+# Shortened embeddings via the API's dimensions parameter (0 = the model's full size,
+# 3072 for text-embedding-3-large). Stored embeddings must match; see embedding_dimensions.py
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0"))
+
+
+class EmbeddingBatcher:
+    """
+    Embedding front-end shared by the retrievers and RAG systems
+
+    - embed_many() answers what it can from the embedding cache, de-duplicates
+      the rest and sends them in as few requests as the input limit allows
+    - embed() coalesces concurrent single-text calls: the first caller waits
+      EMBEDDING_COALESCE_WINDOW_MS, then sends everything that queued up in
+      the meantime as one batch
+    """
+
+    def __init__(
+        self,
+        openai_client,
+        model: str,
+        deployment: str = "",
+        cache: Optional[EmbeddingCache] = None,
+        max_batch_size: int = EMBEDDING_MAX_BATCH_SIZE,
+        coalesce_window_ms: float = EMBEDDING_COALESCE_WINDOW_MS,
+        dimensions: int = EMBEDDING_DIMENSIONS
+    ):
+        """
+        Args:
+            openai_client: AzureOpenAI (or OpenAI) client used for requests
+            model: Embedding model / deployment name
+            deployment: Where the model is served, used in cache keys
+            cache: Embedding cache (defaults to the process-wide cache)
+            max_batch_size: Maximum inputs per embeddings.create call
+            coalesce_window_ms: Coalescing window for embed()
+            dimensions: Requested embedding size (0 = model default)
+        """
+        self.openai_client = openai_client
+        self.model = model
+        self.deployment = deployment
+        self.cache = cache if cache is not None else get_embedding_cache()
+        self.max_batch_size = max(1, max_batch_size)
+        self.coalesce_window = max(0.0, coalesce_window_ms) / 1000.0
+        self.dimensions = max(0, dimensions)
+        # Vectors of different sizes must never share cache entries
+        self.cache_model = f"{model}:{self.dimensions}" if self.dimensions else model
+
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[str, Future]] = []
+        self._flush_scheduled = False
+
+        self.requests_sent = 0
+        self.inputs_sent = 0
+
+    def embed(self, text: str) -> List[float]:
+        """Embed a single text, sharing a request with concurrent callers"""
+        cached = self.cache.get(text, self.cache_model, self.deployment)
+        if cached is not None:
+            return cached
+
+        if self.coalesce_window <= 0:
+            return self.embed_many([text])[0]
+
+        future: Future = Future()
+        with self._lock:
+            self._pending.append((text, future))
+            is_leader = not self._flush_scheduled
+            self._flush_scheduled = True
+
+        if is_leader:
+            time.sleep(self.coalesce_window)
+            self._flush()
+
+        return future.result()
+
+    def embed_many(self, texts: List[str], use_cache: bool = True) -> List[List[float]]:
+        """
+        Embed many texts with one request per max_batch_size inputs
+
+        Args:
+            texts: Texts to embed
+            use_cache: Read and fill the embedding cache (bulk document
+                embedding turns this off so it does not evict query vectors)
+
+        Returns:
+            Embedding vectors in the same order as texts
+        """
+        results, missing = self._from_cache(texts, use_cache)
+
+        unique_texts = list(missing.keys())
+        for start in range(0, len(unique_texts), self.max_batch_size):
+            chunk = unique_texts[start:start + self.max_batch_size]
+            self._fill(results, missing, chunk, self._request(chunk), use_cache)
+
+        return results
+
+    def _from_cache(self, texts: List[str], use_cache: bool):
+        """
+        Returns:
+            (vectors in input order with None where uncached, input positions
+            of each distinct uncached text)
+        """
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        missing: Dict[str, List[int]] = {}
+
+        for i, text in enumerate(texts):
+            cached = self.cache.get(text, self.cache_model, self.deployment) if use_cache else None
+            if cached is not None:
+                results[i] = cached
+            else:
+                missing.setdefault(normalize_text(text), []).append(i)
+
+        return results, missing
+
+    def _fill(self, results, missing: Dict[str, List[int]], chunk: List[str], vectors, use_cache: bool):
+        """Cache one request's vectors and put them at every position that asked for them"""
+        for text, vector in zip(chunk, vectors):
+            if use_cache:
+                self.cache.put(text, self.cache_model, vector, self.deployment)
+            for i in missing[text]:
+                results[i] = vector
+
+    def _request(self, texts: List[str]) -> List[List[float]]:
+        """Send one embeddings.create call and return vectors in input order"""
+        response = self.openai_client.embeddings.create(
+            input=texts,
+            model=self.model,
+            **self._request_options()
+        )
+        return self._vectors(response, texts)
+
+    def _request_options(self) -> Dict[str, int]:
+        """Extra embeddings.create arguments (dimensions when shortened)"""
+        return {"dimensions": self.dimensions} if self.dimensions else {}
+
+    def _vectors(self, response, texts: List[str]) -> List[List[float]]:
+        """Count the request and return its vectors in input order"""
+        with self._lock:
+            self.requests_sent += 1
+            self.inputs_sent += len(texts)
+        # The API returns one item per input with its position in `index`
+        ordered = sorted(response.data, key=lambda item: item.index)
+        return [item.embedding for item in ordered]
+
+    def _flush(self):
+        """Send every queued embed() call as one batch and resolve their futures"""
+        with self._lock:
+            batch = self._pending
+            self._pending = []
+            self._flush_scheduled = False
+
+        if not batch:
+            return
+
+        try:
+            vectors = self.embed_many([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future), vector in zip(batch, vectors):
+            future.set_result(vector)
+
+
+_batchers: Dict[Tuple[str, str, int], EmbeddingBatcher] = {}
+_batchers_lock = threading.Lock()
+
+
+def get_embedding_batcher(
+    openai_client,
+    model: str,
+    deployment: str = "",
+    dimensions: int = EMBEDDING_DIMENSIONS
+) -> EmbeddingBatcher:
+    """
+    Return the process-wide batcher for a model/deployment/dimensions triple
+
+    Every retriever and RAG system embedding with the same deployment shares
+    one batcher, so concurrent queries from different objects (or Streamlit
+    sessions) are coalesced together. The first caller's client is used.
+    """
+    key = (model, deployment or "", dimensions)
+    with _batchers_lock:
+        batcher = _batchers.get(key)
+        if batcher is None:
+            batcher = EmbeddingBatcher(openai_client, model, deployment, dimensions=dimensions)
+            _batchers[key] = batcher
+        return batcher
+
+
+class AsyncEmbeddingBatcher(EmbeddingBatcher):
+    """
+    EmbeddingBatcher for an AsyncAzureOpenAI client; embed() and embed_many()
+    are coroutines
+
+    Same cache and batching rules. Concurrent embed() calls on the event loop
+    are coalesced without blocking a thread: the first one schedules a flush
+    EMBEDDING_COALESCE_WINDOW_MS later and every caller awaits its future.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def embed(self, text: str) -> List[float]:
+        """Embed a single text, sharing a request with concurrent callers"""
+        cached = self.cache.get(text, self.cache_model, self.deployment)
+        if cached is not None:
+            return cached
+
+        if self.coalesce_window <= 0:
+            return (await self.embed_many([text]))[0]
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future))
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            # A task of its own, so a cancelled caller cannot strand the batch
+            self._flush_task = asyncio.ensure_future(self._flush_after_window())
+
+        return await future
+
+    async def embed_many(self, texts: List[str], use_cache: bool = True) -> List[List[float]]:
+        """Embed many texts with one request per max_batch_size inputs (see EmbeddingBatcher)"""
+        results, missing = self._from_cache(texts, use_cache)
+
+        unique_texts = list(missing.keys())
+        chunks = [unique_texts[start:start + self.max_batch_size]
+                  for start in range(0, len(unique_texts), self.max_batch_size)]
+        # Large inputs send their requests concurrently
+        for chunk, vectors in zip(chunks, await asyncio.gather(*(self._request(chunk) for chunk in chunks))):
+            self._fill(results, missing, chunk, vectors, use_cache)
+
+        return results
+
+    async def _request(self, texts: List[str]) -> List[List[float]]:
+        """Send one embeddings.create call and return vectors in input order"""
+        response = await self.openai_client.embeddings.create(
+            input=texts,
+            model=self.model,
+            **self._request_options()
+        )
+        return self._vectors(response, texts)
+
+    async def _flush_after_window(self):
+        await asyncio.sleep(self.coalesce_window)
+        await self._flush()
+
+    async def _flush(self):
+        """Send every queued embed() call as one batch and resolve their futures"""
+        batch = self._pending
+        self._pending = []
+        self._flush_scheduled = False
+
+        if not batch:
+            return
+
+        try:
+            vectors = await self.embed_many([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+
+_async_batchers: Dict[Tuple[str, str, int], AsyncEmbeddingBatcher] = {}
+
+
+def get_async_embedding_batcher(
+    openai_client,
+    model: str,
+    deployment: str = "",
+    dimensions: int = EMBEDDING_DIMENSIONS
+) -> AsyncEmbeddingBatcher:
+    """get_embedding_batcher for AsyncAzureOpenAI clients (one batcher per key on the shared event loop)"""
+    key = (model, deployment or "", dimensions)
+    with _batchers_lock:
+        batcher = _async_batchers.get(key)
+        if batcher is None:
+            batcher = AsyncEmbeddingBatcher(openai_client, model, deployment, dimensions=dimensions)
+            _async_batchers[key] = batcher
+        return batcher
@@ -0,0 +1,101 @@
+"""
+embedding_cache.py - Shared cache for query embeddings
+Two-level cache (two_level_cache.TwoLevelCache) of query vectors, keyed
+by model, deployment and normalized text
+"""
+
+import os
+import hashlib
+import threading
+from array import array
+from typing import List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from two_level_cache import TwoLevelCache
+
+load_dotenv()
+
+# Configuration
+# Set EMBEDDING_CACHE_PATH to an empty string to keep the cache in memory only
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "embeddings.sqlite3")
+)
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", "2048"))
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different spellings of a query share a key"""
+    return " ".join(text.split())
+
+
+class EmbeddingCache(TwoLevelCache):
+    """
+    Two-level embedding cache shared by every generate_embedding implementation
+
+    Level 1 is a bounded LRU held in process memory. Level 2 is a SQLite file on
+    local disk, so repeat queries survive restarts and are shared between
+    processes (e.g. several Streamlit workers) on the same machine.
+    """
+
+    table = "embeddings"
+    columns = "model TEXT NOT NULL, vector BLOB NOT NULL"
+    label = "Embedding cache"
+
+    def __init__(self, path: Optional[str] = EMBEDDING_CACHE_PATH,
+                 max_memory_items: int = EMBEDDING_CACHE_MEMORY_SIZE):
+        """
+        Args:
+            path: SQLite file for the on-disk store (None or "" for memory only)
+            max_memory_items: Number of vectors kept in the in-memory LRU
+        """
+        super().__init__(path, max_memory_items)
+
+    @staticmethod
+    def make_key(text: str, model: str, deployment: str = "") -> str:
+        """
+        Build the cache key for a text
+
+        Args:
+            text: Text that was embedded
+            model: Embedding model name
+            deployment: Where the model is served (e.g. Azure OpenAI endpoint),
+                so two resources hosting the same model name never share vectors
+        """
+        raw = "\x1f".join([model or "", deployment or "", normalize_text(text)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, text: str, model: str, deployment: str = "") -> Optional[List[float]]:
+        """Return the cached embedding for text, or None on a miss"""
+        entry = self._get(self.make_key(text, model, deployment))
+        return entry[1] if entry is not None else None
+
+    def put(self, text: str, model: str, embedding: List[float], deployment: str = ""):
+        """Store an embedding in memory and on disk"""
+        self._put(self.make_key(text, model, deployment), (model, embedding))
+
+    def _read(self, key: str) -> Optional[Tuple[str, List[float]]]:
+        row = self._conn.execute("SELECT model, vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        return (row[0], array("f", row[1]).tolist()) if row is not None else None
+
+    def _write(self, key: str, entry: Tuple[str, List[float]]):
+        model, embedding = entry
+        self._conn.execute(
+            "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)",
+            (key, model, array("f", embedding).tobytes())
+        )
+
+
+_shared_cache: Optional[EmbeddingCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Return the process-wide embedding cache, creating it on first use"""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = EmbeddingCache()
+    return _shared_cache
@@ -0,0 +1,247 @@
+"""
+embedding_dimensions.py - Reduced-dimension embeddings: recall report and migration
+text-embedding-3 models are trained so the leading components carry most of
+the meaning; asking the API for `dimensions=d` is the same as keeping the
+first d components of the full vector and re-normalizing. Stored embeddings
+can therefore be shortened in place of re-embedding every document
+
+Compare recall@5 and payload size of shorter vectors against the full ones:
+    python embedding_dimensions.py report COSMOS_ret customer_id --dimensions 256 512 1024
+    python embedding_dimensions.py report COSMOS_pol policy_id --query "auto policies in Texas"
+
+Copy a container with shortened embeddings (the target container's vector
+policy must declare the new size), then set EMBEDDING_DIMENSIONS and point
+the retrievers at the new container:
+    python embedding_dimensions.py migrate COSMOS_ret COSMOS_ret_small --dimensions 1024
+"""
+
+import os
+import json
+import argparse
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from projections import SYSTEM_FIELDS
+
+load_dotenv()
+
+# Configuration
+AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
+AZURE_OPENAI_KEY = os.getenv("AZURE_OPENAI_KEY")
+AZURE_OPENAI_DEPLOYMENT = "text-embedding-3-large"
+AZURE_OPENAI_API_VERSION = "2024-02-01"
+
+# Dimensions compared by the report when none are given
+EMBEDDING_REPORT_DIMENSIONS = [
+    int(value) for value in os.getenv("EMBEDDING_REPORT_DIMENSIONS", "256,512,1024,1536").split(",") if value.strip()
+]
+# Print migration progress every N documents
+EMBEDDING_MIGRATION_PROGRESS_EVERY = int(os.getenv("EMBEDDING_MIGRATION_PROGRESS_EVERY", "500"))
+
+
+def shorten_embeddings(vectors, dimensions: int) -> np.ndarray:
+    """
+    Keep the first `dimensions` components and re-normalize
+
+    Args:
+        vectors: One embedding or a (n, full_dimension) matrix
+        dimensions: Target size (must not exceed the current size)
+
+    Returns:
+        float32 array of the same rank, unit length rows
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if dimensions > matrix.shape[-1]:
+        raise ValueError(f"Cannot shorten {matrix.shape[-1]}-dimension embeddings to {dimensions}")
+    shortened = matrix[..., :dimensions]
+    norms = np.linalg.norm(shortened, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return shortened / norms
+
+
+def shorten_embedding(embedding: List[float], dimensions: int) -> List[float]:
+    """shorten_embeddings for a single vector, as a list (for documents)"""
+    return shorten_embeddings(embedding, dimensions).tolist()
+
+
+# ============================================================================
+# RECALL REPORT
+# ============================================================================
+
+def _load_embeddings(container, id_field: str, sample: int = 0):
+    """Ids and embedding matrix of a container (first `sample` documents when > 0)"""
+    top = f"TOP {int(sample)} " if sample > 0 else ""
+    query = f"SELECT {top}c.{id_field}, c.embedding FROM c WHERE IS_DEFINED(c.embedding)"
+
+    ids, vectors = [], []
+    for item in container.query_items(query=query, enable_cross_partition_query=True):
+        if item.get(id_field) is not None and item.get("embedding"):
+            ids.append(str(item[id_field]))
+            vectors.append(item["embedding"])
+    return ids, np.asarray(vectors, dtype=np.float32)
+
+
+def _top_rows(matrix: np.ndarray, queries: np.ndarray, top_k: int) -> List[set]:
+    """Row numbers of each query's top_k matches by inner product"""
+    scores = queries @ matrix.T
+    k = min(top_k, matrix.shape[0])
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return [set(row.tolist()) for row in best]
+
+
+def _payload_bytes(vector: np.ndarray) -> int:
+    """Size of a vector as the JSON @embedding query parameter"""
+    return len(json.dumps([round(float(value), 8) for value in vector]))
+
+
+def recall_report(
+    ids: List[str],
+    embeddings: np.ndarray,
+    dimensions: List[int],
+    query_embeddings: Optional[np.ndarray] = None,
+    queries: int = 50,
+    top_k: int = 5,
+    seed: int = 0
+) -> List[Dict[str, Any]]:
+    """
+    Recall@k of shortened embeddings against the full-size ranking
+
+    Args:
+        ids: Document ids, one per row of embeddings
+        embeddings: Full-size stored embeddings
+        dimensions: Sizes to compare
+        query_embeddings: Full-size query embeddings (e.g. real user queries);
+            defaults to normalized midpoints of random document pairs
+        queries: Number of synthetic queries when query_embeddings is None
+        top_k: k of recall@k
+        seed: Random seed for synthetic queries
+
+    Returns:
+        One row per size (the full size first) with recall, the bytes of the
+        @embedding parameter per query and the storage bytes per document
+    """
+    full = shorten_embeddings(embeddings, embeddings.shape[1])
+    if query_embeddings is None:
+        rng = np.random.default_rng(seed)
+        pairs = rng.choice(len(full), (queries, 2))
+        query_embeddings = full[pairs[:, 0]] + full[pairs[:, 1]]
+    query_embeddings = shorten_embeddings(query_embeddings, full.shape[1])
+    truth = _top_rows(full, query_embeddings, top_k)
+
+    report = []
+    for size in [full.shape[1]] + sorted(d for d in dimensions if d < full.shape[1]):
+        matrix = shorten_embeddings(full, size)
+        shortened_queries = shorten_embeddings(query_embeddings, size)
+        found = _top_rows(matrix, shortened_queries, top_k)
+        hits = sum(len(t & f) for t, f in zip(truth, found))
+        report.append({
+            "dimensions": size,
+            "recall": hits / max(1, len(truth) * min(top_k, len(ids))),
+            "query_payload_bytes": _payload_bytes(shortened_queries[0]),
+            "vector_bytes": size * 4
+        })
+    return report
+
+
+def print_recall_report(report: List[Dict[str, Any]], documents: int, top_k: int):
+    """Print the rows of recall_report as a table"""
+    full = report[0]
+    print(f"\nRecall@{top_k} of shortened embeddings over {documents} documents")
+    print(f"{'Dimensions':>10}  {'Recall':>7}  {'@embedding':>12}  {'Per document':>13}")
+    for row in report:
+        print(f"{row['dimensions']:>10}  {row['recall']:>7.3f}  "
+              f"{row['query_payload_bytes'] / 1024:>9.1f} KB  "
+              f"{row['vector_bytes'] / 1024:>10.1f} KB"
+              + ("" if row is full else f"  ({full['vector_bytes'] / row['vector_bytes']:.0f}x smaller)"))
+
+
+# ============================================================================
+# MIGRATION
+# ============================================================================
+
+def migrate_container(source, target, dimensions: int, progress_every: int = EMBEDDING_MIGRATION_PROGRESS_EVERY) -> int:
+    """
+    Copy every document to another container with shortened embeddings
+
+    The copy is an upsert per document, so an interrupted migration can
+    simply be run again. Documents without an embedding are copied as is.
+
+    Args:
+        source: Container to read
+        target: Container to write (its vector policy must use `dimensions`)
+        dimensions: New embedding size
+        progress_every: Print progress every N documents
+
+    Returns:
+        Number of documents written
+    """
+    written = 0
+    for document in source.query_items(query="SELECT * FROM c", enable_cross_partition_query=True):
+        for field in SYSTEM_FIELDS:
+            document.pop(field, None)
+        if document.get("embedding"):
+            document["embedding"] = shorten_embedding(document["embedding"], dimensions)
+        target.upsert_item(document)
+
+        written += 1
+        if progress_every and written % progress_every == 0:
+            print(f"   {written} documents migrated...")
+    return written
+
+
+def main():
+    """Recall report or container migration for shortened embeddings"""
+    from client_registry import get_container
+
+    parser = argparse.ArgumentParser(description="Reduced-dimension embeddings: recall report and migration")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    report_parser = commands.add_parser("report", help="Compare recall@k of shortened embeddings with the full ones")
+    report_parser.add_argument("prefix", help="Environment prefix of the container settings, e.g. COSMOS_ret")
+    report_parser.add_argument("id_field", help="Document id field, e.g. customer_id or policy_id")
+    report_parser.add_argument("--dimensions", type=int, nargs="+", default=EMBEDDING_REPORT_DIMENSIONS)
+    report_parser.add_argument("--query", action="append", help="Real query text (repeatable); embedded at full size")
+    report_parser.add_argument("--queries", type=int, default=50, help="Synthetic queries when no --query is given")
+    report_parser.add_argument("--top-k", type=int, default=5)
+    report_parser.add_argument("--sample", type=int, default=0, help="Only read the first N documents")
+
+    migrate_parser = commands.add_parser("migrate", help="Copy a container with shortened embeddings")
+    migrate_parser.add_argument("source", help="Environment prefix of the source container")
+    migrate_parser.add_argument("target", help="Environment prefix of the target container")
+    migrate_parser.add_argument("--dimensions", type=int, required=True)
+
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        print(f"Migrating {args.source} -> {args.target} with {args.dimensions}-dimension embeddings...")
+        written = migrate_container(get_container(args.source), get_container(args.target), args.dimensions)
+        print(f"✓ Migrated {written} documents; set EMBEDDING_DIMENSIONS={args.dimensions} and rebuild local indexes")
+        return
+
+    ids, embeddings = _load_embeddings(get_container(args.prefix), args.id_field, args.sample)
+    if not ids:
+        print(f"❌ No embeddings found in {args.prefix}")
+        return
+
+    query_embeddings = None
+    if args.query:
+        from client_registry import get_openai_client
+        from embedding_batcher import get_embedding_batcher
+
+        openai_client = get_openai_client(
+            AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY, AZURE_OPENAI_API_VERSION
+        )
+        # Full-size query vectors; the report shortens them like the API would
+        embedder = get_embedding_batcher(
+            openai_client, AZURE_OPENAI_DEPLOYMENT, AZURE_OPENAI_ENDPOINT, dimensions=0
+        )
+        query_embeddings = np.asarray(embedder.embed_many(args.query), dtype=np.float32)
+
+    report = recall_report(ids, embeddings, args.dimensions, query_embeddings, args.queries, args.top_k)
+    print_recall_report(report, len(ids), args.top_k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""
+exact_vector_store.py - Exact client-side vector search over a memory-mapped embedding matrix
+Keeps a container's embeddings as one float32 (or float16) matrix in a .npy
+file plus a parallel id array; a query is a single matrix-vector product.
+The matrix is opened with mmap, so every process (e.g. Streamlit workers)
+mapping the same file shares one copy through the OS page cache
+
+Build a store (reads <PREFIX>_ENDPOINT/_KEY/_DATABASE_NAME/_CONTAINER_NAME):
+    python exact_vector_store.py COSMOS_ret customer_id .cache/customers.exact.json
+    python exact_vector_store.py COSMOS_pol policy_id .cache/policies.exact.json --dtype float16
+
+Point the retriever's <PREFIX>_VECTOR_INDEX_PATH at the .json manifest to use
+it instead of the IVF index (see load_vector_index in vector_index.py).
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from vector_index import _normalize, fetch_ranked_documents
+from change_feed_sync import index_checkpoint_path
+
+load_dotenv()
+
+# Configuration
+# Storage type of the matrix: float32 or float16 (half the memory, ~3 decimal digits)
+EXACT_VECTOR_DTYPE = os.getenv("EXACT_VECTOR_DTYPE", "float32")
+# Rows scored per block when the matrix has to be converted to float32 first
+EXACT_SEARCH_BLOCK_ROWS = int(os.getenv("EXACT_SEARCH_BLOCK_ROWS", "65536"))
+
+SUPPORTED_DTYPES = ("float32", "float16")
+
+
+class ExactVectorStore:
+    """
+    Brute-force cosine search over a memory-mapped matrix
+
+    On disk a store is a small JSON manifest naming the current generation of
+    two .npy files (vectors and ids). Saving writes a new generation and swaps
+    the manifest atomically, so readers never see a half-written matrix, and
+    other processes pick the new files up on their next search.
+
+    Change feed upserts are kept in a small in-memory overlay (the mapped
+    matrix is read-only) and merged into the files by flush(). Has the same
+    search/search_documents/apply_changes/flush interface as IVFIndex.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Manifest written by write_store()
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._manifest_mtime = None
+        self._open()
+
+    def _open(self):
+        """(Re)map the files named by the manifest"""
+        with open(self.path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        vectors_path = os.path.join(directory, manifest["vectors"])
+        ids_path = os.path.join(directory, manifest["ids"])
+
+        self.id_field = manifest["id_field"]
+        self.vectors = np.load(vectors_path, mmap_mode="r")
+        self.ids = np.load(ids_path, allow_pickle=False).astype(str)
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        self.id_to_row = {str(doc_id): row for row, doc_id in enumerate(self.ids)}
+        self._dimension = int(manifest["dimension"])
+        self._manifest_mtime = os.stat(self.path).st_mtime_ns
+
+        # Upserts since the files were written
+        self._overlay_ids: List[str] = []
+        self._overlay_vectors = np.empty((0, self._dimension), dtype=np.float32)
+        self._overlay_rows: Dict[str, int] = {}
+        self._dirty = False
+
+    def _reload_if_replaced(self):
+        """Remap when another process has saved a newer generation"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._manifest_mtime and not self._dirty:
+            self._open()
+
+    def __len__(self) -> int:
+        return int(self.alive.sum()) + len(self._overlay_ids)
+
+    @property
+    def dimension(self) -> int:
+        return self._dimension
+
+    @property
+    def checkpoint_path(self) -> str:
+        """Change feed checkpoint of the store, next to its manifest"""
+        return index_checkpoint_path(self.path)
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the mapped matrix (shared between processes, not per process)"""
+        return int(self.vectors.nbytes)
+
+    # ========================================================================
+    # SEARCH
+    # ========================================================================
+
+    def _matrix_scores(self, query: np.ndarray) -> np.ndarray:
+        """Cosine similarity of the query with every row of the mapped matrix"""
+        if self.vectors.dtype == np.float32:
+            return self.vectors @ query
+
+        # float16: convert a block at a time instead of materializing a float32 copy
+        scores = np.empty(len(self.vectors), dtype=np.float32)
+        for start in range(0, len(self.vectors), EXACT_SEARCH_BLOCK_ROWS):
+            block = self.vectors[start:start + EXACT_SEARCH_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ query
+        return scores
+
+    def search(self, query_embedding: List[float], top_k: int = 5) -> List[Tuple[str, float]]:
+        """
+        Exact nearest neighbours of a query embedding
+
+        Args:
+            query_embedding: Query vector (same model/dimension as the store)
+            top_k: Number of hits to return
+
+        Returns:
+            (id, cosine similarity) pairs, most similar first
+        """
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+
+        with self._lock:
+            self._reload_if_replaced()
+
+            scores = np.where(self.alive, self._matrix_scores(query), -np.inf)
+            ids = self.ids
+            if self._overlay_ids:
+                scores = np.concatenate([scores, self._overlay_vectors @ query])
+                ids = np.concatenate([ids, np.asarray(self._overlay_ids)])
+
+            count = len(self)
+            if count == 0:
+                return []
+            k = min(top_k, count)
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            return [(str(ids[i]), float(scores[i])) for i in best]
+
+    def search_documents(
+        self,
+        container,
+        query_embedding: List[float],
+        top_k: int,
+        fields: List[str],
+        score_field: str
+    ) -> List[Dict[str, Any]]:
+        """Rank locally, then fetch only the top_k documents (see IVFIndex.search_documents)"""
+        hits = self.search(query_embedding, top_k)
+        return fetch_ranked_documents(container, self.id_field, hits, fields, score_field)
+
+    # ========================================================================
+    # UPDATES
+    # ========================================================================
+
+    def add_many(self, doc_ids: List[str], embeddings: List[List[float]]):
+        """Insert or replace many vectors (held in the overlay until flush)"""
+        if not doc_ids:
+            return
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+
+        with self._lock:
+            new_vectors = []
+            for doc_id, vector in zip(map(str, doc_ids), vectors):
+                row = self.id_to_row.pop(doc_id, None)
+                if row is not None:
+                    self.alive[row] = False
+
+                overlay_row = self._overlay_rows.get(doc_id)
+                if overlay_row is None:
+                    self._overlay_rows[doc_id] = len(self._overlay_ids)
+                    self._overlay_ids.append(doc_id)
+                    new_vectors.append(vector)
+                elif overlay_row < len(self._overlay_vectors):
+                    self._overlay_vectors[overlay_row] = vector
+                else:
+                    new_vectors[overlay_row - len(self._overlay_vectors)] = vector
+
+            if new_vectors:
+                self._overlay_vectors = np.vstack([self._overlay_vectors, np.stack(new_vectors)])
+            self._dirty = True
+
+    def remove(self, doc_id: str) -> bool:
+        """Mask a document out of the store; returns False if it was not stored"""
+        with self._lock:
+            row = self.id_to_row.pop(doc_id, None)
+            if row is not None:
+                self.alive[row] = False
+            elif doc_id in self._overlay_rows:
+                position = self._overlay_rows.pop(doc_id)
+                self._overlay_ids.pop(position)
+                self._overlay_vectors = np.delete(self._overlay_vectors, position, axis=0)
+                self._overlay_rows = {overlay_id: i for i, overlay_id in enumerate(self._overlay_ids)}
+            else:
+                return False
+            self._dirty = True
+            return True
+
+    def apply_changes(self, documents: List[Dict[str, Any]]):
+        """Upsert changed documents from the change feed (change_feed_sync consumer)"""
+        doc_ids, embeddings = [], []
+        for document in documents:
+            doc_id = document.get(self.id_field)
+            embedding = document.get("embedding")
+            if doc_id is None or not embedding:
+                continue
+            if len(embedding) != self.dimension:
+                print(f"⚠️  Skipping {self.id_field} {doc_id}: embedding dimension {len(embedding)} != {self.dimension}")
+                continue
+            doc_ids.append(str(doc_id))
+            embeddings.append(embedding)
+        self.add_many(doc_ids, embeddings)
+
+    def flush(self):
+        """Merge the overlay and removals into a new generation of the files"""
+        with self._lock:
+            if not self._dirty:
+                return
+            rows = np.nonzero(self.alive)[0]
+            ids = np.concatenate([self.ids[rows], np.asarray(self._overlay_ids, dtype=str)])
+
+            def blocks():
+                for start in range(0, len(rows), EXACT_SEARCH_BLOCK_ROWS):
+                    yield self.vectors[rows[start:start + EXACT_SEARCH_BLOCK_ROWS]]
+                if len(self._overlay_vectors):
+                    yield self._overlay_vectors
+
+            write_store(self.path, self.id_field, ids, blocks(), self.dimension, str(self.vectors.dtype))
+            self._open()
+
+
+def write_store(
+    path: str,
+    id_field: str,
+    ids: np.ndarray,
+    vector_blocks,
+    dimension: int,
+    dtype: str = EXACT_VECTOR_DTYPE
+):
+    """
+    Write a new generation of a store and point its manifest at it
+
+    Args:
+        path: Manifest path (e.g. .cache/customers.exact.json)
+        id_field: Document field the ids refer to
+        ids: Document ids, one per row
+        vector_blocks: Iterable of (rows, dimension) arrays in id order,
+            already normalized; written straight into the memory-mapped file
+        dimension: Embedding dimension
+        dtype: float32 or float16
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"Unsupported dtype '{dtype}' (use {' or '.join(SUPPORTED_DTYPES)})")
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    generation = time.time_ns()
+    vectors_name = f"{stem}.{generation}.vectors.npy"
+    ids_name = f"{stem}.{generation}.ids.npy"
+
+    matrix = np.lib.format.open_memmap(
+        os.path.join(directory, vectors_name), mode="w+", dtype=dtype, shape=(len(ids), dimension)
+    )
+    written = 0
+    for block in vector_blocks:
+        matrix[written:written + len(block)] = block
+        written += len(block)
+    if written != len(ids):
+        raise ValueError(f"Got {written} vectors for {len(ids)} ids")
+    matrix.flush()
+    del matrix
+
+    np.save(os.path.join(directory, ids_name), np.asarray(ids).astype(str))
+
+    manifest = {
+        "id_field": id_field,
+        "dimension": dimension,
+        "dtype": dtype,
+        "count": len(ids),
+        "vectors": vectors_name,
+        "ids": ids_name
+    }
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        old_files = [previous["vectors"], previous["ids"]]
+    except (OSError, ValueError, KeyError):
+        old_files = []
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+    for old_file in old_files:
+        try:
+            # Processes still mapping the old generation keep it until they remap
+            os.remove(os.path.join(directory, old_file))
+        except OSError:
+            pass
+
+
+def build_from_container(container, id_field: str, path: str, dtype: str = EXACT_VECTOR_DTYPE) -> ExactVectorStore:
+    """Read every (id, embedding) pair from a container and write a store"""
+    query = f"SELECT c.{id_field}, c.embedding FROM c WHERE IS_DEFINED(c.embedding)"
+
+    ids, vectors = [], []
+    for item in container.query_items(query=query, enable_cross_partition_query=True):
+        if item.get(id_field) is not None and item.get("embedding"):
+            ids.append(str(item[id_field]))
+            vectors.append(np.asarray(item["embedding"], dtype=np.float32))
+
+    if not ids:
+        raise ValueError("Cannot build a vector store from an empty corpus")
+
+    matrix = _normalize(np.stack(vectors))
+    write_store(path, id_field, np.asarray(ids), [matrix], matrix.shape[1], dtype)
+    return ExactVectorStore(path)
+
+
+def main():
+    """Build a store from a container and save it"""
+    from client_registry import get_container
+    from change_feed_sync import CosmosChangeFeedSource, save_checkpoint
+
+    parser = argparse.ArgumentParser(description="Build a memory-mapped exact vector store from a Cosmos DB container")
+    parser.add_argument("prefix", help="Environment prefix of the container settings, e.g. COSMOS_ret")
+    parser.add_argument("id_field", help="Document id field, e.g. customer_id or policy_id")
+    parser.add_argument("output", help="Path of the .json manifest to write")
+    parser.add_argument("--dtype", choices=SUPPORTED_DTYPES, default=EXACT_VECTOR_DTYPE)
+    args = parser.parse_args()
+
+    container = get_container(args.prefix)
+
+    # Record the feed position before scanning (see vector_index.main)
+    token = CosmosChangeFeedSource(container).current_token()
+
+    print(f"Building exact vector store from {args.prefix} container...")
+    store = build_from_container(container, args.id_field, args.output, args.dtype)
+    save_checkpoint(args.prefix, token, index_checkpoint_path(args.output))
+    print(f"✓ Saved {len(store)} {args.dtype} vectors ({store.nbytes / 1e6:.1f} MB) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
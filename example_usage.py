@@ -189,6 +189,9 @@ def example_batch_queries():
     
     print("\nProcessing batch queries...\n")
     
+    # Embed every query in a single request; the searches below reuse the cached vectors
+    rag.generate_embeddings(queries)
+    
     all_results = {}
     for query in queries:
         results = rag.search_customers(query, top_k=2)
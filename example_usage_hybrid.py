@@ -235,6 +235,9 @@ def example_batch_hybrid_queries():
     
     print("\nProcessing batch queries with hybrid search...\n")
     
+    # Embed every query in a single request; the searches below reuse the cached vectors
+    rag.generate_embeddings(queries)
+    
     all_results = {}
     for query in queries:
         results = rag.search_customers(query, top_k=2)
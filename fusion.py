@@ -0,0 +1,295 @@
+"""
+fusion.py - Pluggable fusion of vector and keyword rankings for hybrid search
+Combines independently retrieved vector and keyword result lists with
+Reciprocal Rank Fusion or a weighted sum. Scores are computed as NumPy arrays
+and top-k is selected with argpartition; only the winning dicts are touched
+"""
+
+import os
+from typing import Callable, Hashable, List, Dict, Any, Optional, Tuple, Union
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuration
+# "rrf" (Reciprocal Rank Fusion) or "weighted" (weighted sum of normalized scores)
+HYBRID_FUSION_STRATEGY = os.getenv("HYBRID_FUSION_STRATEGY", "rrf").lower()
+# RRF damping constant; 60 is the value from the original RRF paper
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Candidates retrieved per source = top_k * multiplier (RRF needs fewer than min-max weighting)
+HYBRID_CANDIDATE_MULTIPLIER = int(os.getenv("HYBRID_CANDIDATE_MULTIPLIER", "2"))
+# Upper bound on candidates per source (raise for recall; re-ranking is vectorized)
+HYBRID_MAX_CANDIDATES = int(os.getenv("HYBRID_MAX_CANDIDATES", "50"))
+
+
+def _top_k_order(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the top_k largest scores, best first (argpartition + small sort)"""
+    count = len(scores)
+    if count == 0 or top_k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if top_k < count:
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(count)
+    # Stable sort keeps the input order for ties
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def _scores(results: List[Dict[str, Any]], field: str) -> np.ndarray:
+    """One float per result (NaN where the field is missing)"""
+    values = (result.get(field) for result in results)
+    return np.fromiter(
+        (np.nan if value is None else value for value in values),
+        dtype=np.float64,
+        count=len(results)
+    )
+
+
+def rank_by_scores(
+    results: List[Dict[str, Any]],
+    scores,
+    limit: Optional[int] = None,
+    positive_only: bool = True
+) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+    """
+    Order results by a parallel array of scores, highest first
+
+    Args:
+        results: Candidate documents
+        scores: One score per result (NaN = missing)
+        limit: Keep at most this many
+        positive_only: Drop scores <= 0 (e.g. no keyword match); missing
+            scores are always dropped
+
+    Returns:
+        (ranked results, their scores)
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    valid = ~np.isnan(scores)
+    if positive_only:
+        valid &= scores > 0
+    masked = np.where(valid, scores, -np.inf)
+    order = _top_k_order(masked, min(limit or len(results), int(valid.sum())))
+    return [results[i] for i in order], scores[order]
+
+
+def rank_by(
+    results: List[Dict[str, Any]],
+    field: str,
+    limit: Optional[int] = None,
+    positive_only: bool = True
+) -> List[Dict[str, Any]]:
+    """Results ordered by their `field` value, highest first (see rank_by_scores)"""
+    ranked, _ = rank_by_scores(results, _scores(results, field), limit, positive_only)
+    return ranked
+
+
+KeyFunction = Callable[[Dict[str, Any]], Hashable]
+
+
+def _key_function(id_field: Union[str, KeyFunction]) -> KeyFunction:
+    if callable(id_field):
+        return id_field
+    return lambda document: str(document.get(id_field))
+
+
+def _union(key: KeyFunction, vector_ranked: List[Dict[str, Any]], keyword_ranked: List[Dict[str, Any]]):
+    """
+    Align both rankings on one list of distinct documents
+
+    Returns:
+        (documents, vector positions, keyword positions): the positions map
+        each ranking's entries to their index in documents
+    """
+    documents: List[Dict[str, Any]] = []
+    index: Dict[Hashable, int] = {}
+    positions = []
+    for ranking in (vector_ranked, keyword_ranked):
+        ranking_positions = np.empty(len(ranking), dtype=np.intp)
+        for rank, document in enumerate(ranking):
+            doc_key = key(document)
+            slot = index.get(doc_key)
+            if slot is None:
+                slot = index[doc_key] = len(documents)
+                documents.append(document)
+            ranking_positions[rank] = slot
+        positions.append(ranking_positions)
+    return documents, positions[0], positions[1]
+
+
+def _keyword_array(
+    documents: List[Dict[str, Any]],
+    keyword_positions: np.ndarray,
+    keyword_scores,
+    keyword_field: str
+) -> np.ndarray:
+    """Keyword score of every document (0 where it has none)"""
+    if keyword_scores is None:
+        return np.nan_to_num(_scores(documents, keyword_field))
+    values = np.zeros(len(documents))
+    values[keyword_positions] = keyword_scores
+    return values
+
+
+def _materialize(
+    documents: List[Dict[str, Any]],
+    scores: np.ndarray,
+    top_k: int,
+    keyword_values: Optional[np.ndarray] = None,
+    keyword_field: str = 'keyword_score'
+) -> List[Dict[str, Any]]:
+    """Write scores onto the winners only and return them best first"""
+    winners = []
+    for i in _top_k_order(scores, top_k):
+        document = documents[i]
+        document['hybrid_score'] = float(scores[i])
+        if keyword_values is not None:
+            document[keyword_field] = float(keyword_values[i])
+        winners.append(document)
+    return winners
+
+
+class ReciprocalRankFusion:
+    """
+    Reciprocal Rank Fusion: score = sum of weight / (k + rank) over the lists
+
+    Uses only positions, so vector distances and BM25 scores never need to be
+    put on a common scale. A document missing from a list gets nothing from it.
+    """
+
+    name = "rrf"
+
+    def __init__(self, k: int = RRF_K, vector_weight: float = 1.0, keyword_weight: float = 1.0):
+        """
+        Args:
+            k: Damping constant (larger = flatter contribution across ranks)
+            vector_weight: Multiplier for the vector list's contributions
+            keyword_weight: Multiplier for the keyword list's contributions
+        """
+        self.k = k
+        self.vector_weight = vector_weight
+        self.keyword_weight = keyword_weight
+
+    def fuse(
+        self,
+        vector_ranked: List[Dict[str, Any]],
+        keyword_ranked: List[Dict[str, Any]],
+        id_field: Union[str, KeyFunction],
+        top_k: int,
+        vector_field: str = 'vector_score',
+        keyword_field: str = 'keyword_score',
+        keyword_scores=None
+    ) -> List[Dict[str, Any]]:
+        """
+        Fuse two rankings
+
+        Args:
+            vector_ranked: Vector search results, best first
+            keyword_ranked: Keyword matches, best first
+            id_field: Field identifying the same document in both lists, or a
+                function returning that identity (e.g. across containers)
+            top_k: Number of results to return
+            vector_field: Key of the vector score (unused by RRF)
+            keyword_field: Key of the keyword score
+            keyword_scores: Scores of keyword_ranked, parallel to it; when
+                given they are written to keyword_field on the winners only
+                (otherwise read from keyword_field)
+
+        Returns:
+            Top_k documents, highest hybrid_score first
+        """
+        documents, vector_positions, keyword_positions = _union(
+            _key_function(id_field), vector_ranked, keyword_ranked
+        )
+
+        scores = np.zeros(len(documents))
+        for weight, positions in ((self.vector_weight, vector_positions), (self.keyword_weight, keyword_positions)):
+            ranks = np.arange(1, len(positions) + 1)
+            np.add.at(scores, positions, weight / (self.k + ranks))
+
+        keyword_values = None
+        if keyword_scores is not None:
+            keyword_values = _keyword_array(documents, keyword_positions, keyword_scores, keyword_field)
+        return _materialize(documents, scores, top_k, keyword_values, keyword_field)
+
+
+class WeightedSumFusion:
+    """
+    Weighted sum of a 0-1 vector score and a 0-1 keyword score
+
+    The vector score is min-max scaled between the best and worst entries of
+    the vector list, in the list's own order, so it works whether the metric
+    is a similarity or a distance. Keyword scores are expected in 0-1 (BM25
+    scaled by keyword_index).
+    """
+
+    name = "weighted"
+
+    def __init__(self, vector_weight: float = 0.6, keyword_weight: float = 0.4):
+        self.vector_weight = vector_weight
+        self.keyword_weight = keyword_weight
+
+    def fuse(
+        self,
+        vector_ranked: List[Dict[str, Any]],
+        keyword_ranked: List[Dict[str, Any]],
+        id_field: Union[str, KeyFunction],
+        top_k: int,
+        vector_field: str = 'vector_score',
+        keyword_field: str = 'keyword_score',
+        keyword_scores=None
+    ) -> List[Dict[str, Any]]:
+        """Fuse two rankings (same arguments as ReciprocalRankFusion.fuse)"""
+        documents, _, keyword_positions = _union(_key_function(id_field), vector_ranked, keyword_ranked)
+
+        vector_scores = _scores(documents, vector_field)
+        keyword_values = _keyword_array(documents, keyword_positions, keyword_scores, keyword_field)
+
+        # Global scaling in one shot, oriented by the vector list's own order
+        ranked_scores = _scores(vector_ranked, vector_field)
+        ranked_scores = ranked_scores[~np.isnan(ranked_scores)]
+        if len(ranked_scores) == 0:
+            vector_part = np.zeros(len(documents))
+        else:
+            best, worst = ranked_scores[0], ranked_scores[-1]
+            if best == worst:
+                vector_part = np.ones(len(documents))
+            else:
+                vector_part = np.clip((vector_scores - worst) / (best - worst), 0.0, 1.0)
+            vector_part = np.nan_to_num(vector_part)
+
+        scores = self.vector_weight * vector_part + self.keyword_weight * keyword_values
+        return _materialize(
+            documents, scores, top_k,
+            keyword_values if keyword_scores is not None else None, keyword_field
+        )
+
+
+def get_fusion_strategy(
+    strategy: Union[str, object, None] = None,
+    vector_weight: float = 0.6,
+    keyword_weight: float = 0.4
+):
+    """
+    Resolve a fusion strategy
+
+    Args:
+        strategy: "rrf", "weighted", an object with a fuse() method (returned
+            as is), or None for HYBRID_FUSION_STRATEGY
+        vector_weight: Weight of the vector ranking
+        keyword_weight: Weight of the keyword ranking
+
+    Returns:
+        Object with fuse(vector_ranked, keyword_ranked, id_field, top_k, ...)
+    """
+    if strategy is not None and not isinstance(strategy, str):
+        return strategy
+
+    name = (strategy or HYBRID_FUSION_STRATEGY).lower()
+    if name == "rrf":
+        return ReciprocalRankFusion(vector_weight=vector_weight, keyword_weight=keyword_weight)
+    if name == "weighted":
+        return WeightedSumFusion(vector_weight, keyword_weight)
+    raise ValueError(f"Unknown fusion strategy '{strategy}' (use 'rrf' or 'weighted')")
@@ -0,0 +1,460 @@
+"""
+ingestion_pipeline.py - Bulk (re-)embedding and ingestion for the customer and policy containers
+Streams documents from a container or a JSONL file, builds each document's
+embedding text, embeds in large batches with bounded concurrency (retrying
+on throttling) and writes back with Cosmos DB transactional batches.
+Progress is checkpointed, so a killed job resumes where it stopped
+
+Re-embed a container in place (e.g. after changing the model, EMBEDDING_DIMENSIONS
+or the embedding text), or only the documents still missing an embedding:
+    python ingestion_pipeline.py COSMOS_ret customer
+    python ingestion_pipeline.py COSMOS_pol policy --missing-only
+
+Load a JSONL file (one document per line) into a container:
+    python ingestion_pipeline.py COSMOS_pol policy --jsonl policies.jsonl
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Iterator, List, Dict, Any, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from projections import SYSTEM_FIELDS
+from cosmos_lookup import PartitionKeyLookup
+from change_feed_sync import load_checkpoint, save_checkpoint
+from throttling import is_throttled, retry_delay
+
+load_dotenv()
+
+# Configuration
+# Texts per embeddings request (the endpoint accepts up to 2048)
+INGESTION_EMBED_BATCH_SIZE = int(os.getenv("INGESTION_EMBED_BATCH_SIZE", "256"))
+# Embedding batches in flight at once (each also writes its own documents)
+INGESTION_CONCURRENCY = int(os.getenv("INGESTION_CONCURRENCY", "4"))
+# Documents per transactional batch: at most 100 operations and 2 MB, and a
+# document with a 3072-float embedding is ~40 KB of JSON
+INGESTION_WRITE_BATCH_SIZE = int(os.getenv("INGESTION_WRITE_BATCH_SIZE", "25"))
+INGESTION_MAX_RETRIES = int(os.getenv("INGESTION_MAX_RETRIES", "6"))
+INGESTION_RETRY_BASE_SECONDS = float(os.getenv("INGESTION_RETRY_BASE_SECONDS", "1"))
+INGESTION_PROGRESS_EVERY = int(os.getenv("INGESTION_PROGRESS_EVERY", "1000"))
+INGESTION_CHECKPOINT_PATH = os.getenv(
+    "INGESTION_CHECKPOINT_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "ingestion_checkpoints.json")
+)
+
+AZURE_OPENAI_DEPLOYMENT = "text-embedding-3-large"
+AZURE_OPENAI_API_VERSION = "2024-02-01"
+
+ID_FIELDS = {"customer": "customer_id", "policy": "policy_id"}
+
+
+# ============================================================================
+# EMBEDDING TEXT
+# ============================================================================
+
+def customer_embedding_text(customer: Dict[str, Any]) -> str:
+    """Descriptive text a customer document is embedded from"""
+    address = customer.get('address') or {}
+    parts = [
+        f"Customer {customer.get('first_name', '')} {customer.get('last_name', '')}".strip(),
+        f"occupation {customer.get('occupation')}" if customer.get('occupation') else "",
+        f"annual income {customer.get('annual_income')}" if customer.get('annual_income') is not None else "",
+        f"credit score {customer.get('credit_score')}" if customer.get('credit_score') is not None else "",
+        f"marital status {customer.get('marital_status')}" if customer.get('marital_status') else "",
+        " ".join(str(address.get(key, '')) for key in ('city', 'state') if address.get(key)),
+        str(customer.get('email', ''))
+    ]
+    return ", ".join(part for part in parts if part)
+
+
+def policy_embedding_text(policy: Dict[str, Any]) -> str:
+    """Descriptive text a policy document is embedded from"""
+    parts = [
+        f"{policy.get('policy_type', '')} insurance policy {policy.get('policy_number', '')}".strip(),
+        f"status {policy.get('status')}" if policy.get('status') else "",
+        f"annual premium {policy.get('annual_premium')}" if policy.get('annual_premium') is not None else "",
+        f"coverage {policy.get('coverage_amount')}" if policy.get('coverage_amount') is not None else "",
+        f"deductible {policy.get('deductible')}" if policy.get('deductible') is not None else "",
+        f"paid {policy.get('payment_frequency')}" if policy.get('payment_frequency') else "",
+        "auto renew" if policy.get('auto_renew') else "",
+        f"customer {policy.get('customer_id')}" if policy.get('customer_id') else ""
+    ]
+    return ", ".join(part for part in parts if part)
+
+
+EMBEDDING_TEXT_BUILDERS = {"customer": customer_embedding_text, "policy": policy_embedding_text}
+
+
+def fields_text_builder(fields: List[str]) -> Callable[[Dict[str, Any]], str]:
+    """Text builder joining the given top-level fields as 'field: value'"""
+    def build(document: Dict[str, Any]) -> str:
+        return ", ".join(f"{field}: {document[field]}" for field in fields if document.get(field) not in (None, ""))
+    return build
+
+
+# ============================================================================
+# SOURCES
+# ============================================================================
+
+def container_source(container, order_field: str, after: Optional[str] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Stream every document of a container in order_field order
+
+    Yields:
+        (order_field value, document); the value is the resume position
+    """
+    query = f"SELECT * FROM c WHERE IS_DEFINED(c.{order_field})"
+    parameters = []
+    if after is not None:
+        query += f" AND c.{order_field} > @after"
+        parameters.append({"name": "@after", "value": after})
+    query += f" ORDER BY c.{order_field}"
+
+    for document in container.query_items(
+        query=query,
+        parameters=parameters,
+        enable_cross_partition_query=True
+    ):
+        yield str(document[order_field]), document
+
+
+def jsonl_source(path: str, after: Optional[str] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Stream documents from a JSONL file
+
+    Yields:
+        (line number, document); lines up to `after` are skipped
+    """
+    skip = int(after) if after is not None else 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if line_number <= skip or not line.strip():
+                continue
+            yield str(line_number), json.loads(line)
+
+
+# ============================================================================
+# RETRIES
+# ============================================================================
+
+def with_retry(fn: Callable, *args, max_retries: int = INGESTION_MAX_RETRIES, on_retry: Optional[Callable] = None):
+    """Call fn(*args), retrying throttled calls up to max_retries times"""
+    for attempt in range(max_retries + 1):
+        try:
+            return fn(*args)
+        except Exception as e:
+            if not is_throttled(e) or attempt == max_retries:
+                raise
+            delay = retry_delay(e, attempt, INGESTION_RETRY_BASE_SECONDS)
+            if on_retry is not None:
+                on_retry()
+            time.sleep(delay)
+
+
+# ============================================================================
+# WRITER
+# ============================================================================
+
+class CosmosBulkWriter:
+    """
+    Upserts documents with transactional batches grouped by partition key
+
+    Falls back to one upsert_item per document when the partition key is
+    unknown or hierarchical, or the SDK has no execute_item_batch.
+    """
+
+    def __init__(self, container, batch_size: int = INGESTION_WRITE_BATCH_SIZE):
+        """
+        Args:
+            container: Cosmos DB container client
+            batch_size: Operations per transactional batch (max 100)
+        """
+        self.container = container
+        self.batch_size = max(1, min(batch_size, 100))
+        self.partition_key_path = PartitionKeyLookup(container).partition_key_path
+        self.use_batches = self.partition_key_path is not None and hasattr(container, "execute_item_batch")
+
+    def write(self, documents: List[Dict[str, Any]], on_retry: Optional[Callable] = None):
+        """Upsert documents (each batch or document retried when throttled)"""
+        if not self.use_batches:
+            for document in documents:
+                with_retry(self.container.upsert_item, document, on_retry=on_retry)
+            return
+
+        key_field = self.partition_key_path.lstrip("/")
+        groups: Dict[Any, List[Dict[str, Any]]] = {}
+        for document in documents:
+            groups.setdefault(document.get(key_field), []).append(document)
+
+        for partition_key, group in groups.items():
+            for start in range(0, len(group), self.batch_size):
+                operations = [("upsert", (document,)) for document in group[start:start + self.batch_size]]
+                with_retry(self._execute, operations, partition_key, on_retry=on_retry)
+
+    def _execute(self, operations, partition_key):
+        return self.container.execute_item_batch(batch_operations=operations, partition_key=partition_key)
+
+
+# ============================================================================
+# PIPELINE
+# ============================================================================
+
+class IngestionPipeline:
+    """
+    Embed and write a stream of documents in parallel batches
+
+    Batches complete out of order; the checkpoint only ever moves to the end
+    of the last batch before which every batch has been written, so resuming
+    re-processes at most the batches that were in flight (upserts, so
+    repeating them is harmless).
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        text_builder: Callable[[Dict[str, Any]], str],
+        writer: CosmosBulkWriter,
+        checkpoint_name: str,
+        embed_batch_size: int = INGESTION_EMBED_BATCH_SIZE,
+        concurrency: int = INGESTION_CONCURRENCY,
+        missing_only_dimension: Optional[int] = None,
+        write_embedded: bool = False,
+        checkpoint_path: str = INGESTION_CHECKPOINT_PATH,
+        progress_every: int = INGESTION_PROGRESS_EVERY
+    ):
+        """
+        Args:
+            embed_fn: Embeds a list of texts (e.g. EmbeddingBatcher.embed_many)
+            text_builder: Builds a document's embedding text
+            writer: Where embedded documents are written
+            checkpoint_name: Name of this job's resume position
+            embed_batch_size: Texts per embedding call
+            concurrency: Batches in flight
+            missing_only_dimension: When set, do not re-embed documents that
+                already have an embedding of this size
+            write_embedded: Still write those documents, with their existing
+                embedding (loading a file, whose documents are not in the
+                target yet); otherwise they are skipped (re-embedding a
+                container in place)
+            checkpoint_path: JSON file holding resume positions
+            progress_every: Print throughput every N documents
+        """
+        self.embed_fn = embed_fn
+        self.text_builder = text_builder
+        self.writer = writer
+        self.checkpoint_name = checkpoint_name
+        self.embed_batch_size = max(1, embed_batch_size)
+        self.concurrency = max(1, concurrency)
+        self.missing_only_dimension = missing_only_dimension
+        self.write_embedded = write_embedded
+        self.checkpoint_path = checkpoint_path
+        self.progress_every = progress_every
+
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.stats = {'read': 0, 'embedded': 0, 'reused': 0, 'written': 0, 'skipped': 0, 'retries': 0}
+        self._started = time.perf_counter()
+        self._last_progress = 0
+
+    def resume_position(self) -> Optional[str]:
+        """Saved position of this job (None to start from the beginning)"""
+        return load_checkpoint(self.checkpoint_name, self.checkpoint_path)
+
+    def reset(self):
+        """Forget the saved position so the next run starts over"""
+        save_checkpoint(self.checkpoint_name, None, self.checkpoint_path)
+
+    def run(self, source: Iterator[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Process a source to the end
+
+        Args:
+            source: (position, document) pairs, e.g. container_source(...,
+                after=pipeline.resume_position())
+
+        Returns:
+            Counters plus elapsed seconds and documents per second
+        """
+        self._reset_stats()
+        in_flight = {}
+        completed: Dict[int, str] = {}
+        next_to_checkpoint = 0
+
+        def collect(block: bool):
+            nonlocal next_to_checkpoint
+            finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED, timeout=None if block else 0)
+            for future in finished:
+                sequence, last_position = in_flight.pop(future)
+                future.result()
+                completed[sequence] = last_position
+            while next_to_checkpoint in completed:
+                save_checkpoint(self.checkpoint_name, completed.pop(next_to_checkpoint), self.checkpoint_path)
+                next_to_checkpoint += 1
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="ingestion") as pool:
+            try:
+                for sequence, batch in enumerate(self._batches(source)):
+                    future = pool.submit(self._process, batch)
+                    in_flight[future] = (sequence, batch[-1][0])
+                    while len(in_flight) >= self.concurrency * 2:
+                        collect(block=True)
+                    collect(block=False)
+                while in_flight:
+                    collect(block=True)
+            except BaseException:
+                # Stop feeding work; the checkpoint stays at the last contiguous batch
+                for future in in_flight:
+                    future.cancel()
+                raise
+
+        return self.report()
+
+    def _batches(self, source) -> Iterator[List[Tuple[str, Dict[str, Any]]]]:
+        batch = []
+        for position, document in source:
+            with self._lock:
+                self.stats['read'] += 1
+            batch.append((position, document))
+            if len(batch) >= self.embed_batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _needs_embedding(self, document: Dict[str, Any]) -> bool:
+        if self.missing_only_dimension is None:
+            return True
+        embedding = document.get("embedding")
+        return not embedding or len(embedding) != self.missing_only_dimension
+
+    def _count_retry(self):
+        with self._lock:
+            self.stats['retries'] += 1
+
+    def _process(self, batch: List[Tuple[str, Dict[str, Any]]]):
+        """Embed and write one batch (runs in a worker thread)"""
+        documents, texts, reused, skipped = [], [], [], 0
+        for _, document in batch:
+            if not self._needs_embedding(document):
+                if self.write_embedded:
+                    reused.append(document)
+                else:
+                    skipped += 1
+                continue
+            text = self.text_builder(document)
+            if not text:
+                skipped += 1
+                continue
+            documents.append(document)
+            texts.append(text)
+
+        if documents:
+            vectors = with_retry(self.embed_fn, texts, on_retry=self._count_retry)
+            for document, vector in zip(documents, vectors):
+                document["embedding"] = vector
+
+        if documents or reused:
+            for document in documents + reused:
+                for field in SYSTEM_FIELDS:
+                    document.pop(field, None)
+            self.writer.write(documents + reused, on_retry=self._count_retry)
+
+        with self._lock:
+            self.stats['embedded'] += len(documents)
+            self.stats['reused'] += len(reused)
+            self.stats['written'] += len(documents) + len(reused)
+            self.stats['skipped'] += skipped
+            processed = self.stats['written'] + self.stats['skipped']
+            if self.progress_every and processed - self._last_progress >= self.progress_every:
+                self._last_progress = processed
+                elapsed = time.perf_counter() - self._started
+                print(f"   {processed} documents processed ({processed / elapsed:.1f} docs/sec)")
+
+    def report(self) -> Dict[str, Any]:
+        """Counters so far with elapsed time and throughput"""
+        with self._lock:
+            elapsed = time.perf_counter() - self._started
+            processed = self.stats['written'] + self.stats['skipped']
+            return {
+                **self.stats,
+                'seconds': elapsed,
+                'docs_per_sec': processed / elapsed if elapsed > 0 else 0.0
+            }
+
+
+def main():
+    """Re-embed a container or ingest a JSONL file"""
+    from client_registry import get_container, get_openai_client
+    from embedding_batcher import get_embedding_batcher, EMBEDDING_DIMENSIONS
+
+    parser = argparse.ArgumentParser(description="Bulk (re-)embedding and ingestion for customer/policy containers")
+    parser.add_argument("prefix", help="Environment prefix of the target container, e.g. COSMOS_ret")
+    parser.add_argument("kind", choices=list(ID_FIELDS), help="Document kind (selects id field and embedding text)")
+    parser.add_argument("--jsonl", help="Read documents from this JSONL file instead of the container")
+    parser.add_argument("--source", help="Read from another container prefix instead of the target")
+    parser.add_argument("--text-fields", help="Comma-separated fields to embed instead of the default text")
+    parser.add_argument(
+        "--missing-only", action="store_true",
+        help="Do not re-embed documents that already have an embedding of the current size "
+             "(skipped when re-embedding in place, written as they are from --jsonl or --source)"
+    )
+    parser.add_argument("--dimensions", type=int, default=EMBEDDING_DIMENSIONS, help="Embedding size (0 = model default)")
+    parser.add_argument("--concurrency", type=int, default=INGESTION_CONCURRENCY)
+    parser.add_argument("--batch-size", type=int, default=INGESTION_EMBED_BATCH_SIZE)
+    parser.add_argument("--restart", action="store_true", help="Ignore the saved position and start over")
+    args = parser.parse_args()
+
+    id_field = ID_FIELDS[args.kind]
+    text_builder = EMBEDDING_TEXT_BUILDERS[args.kind]
+    if args.text_fields:
+        text_builder = fields_text_builder([field.strip() for field in args.text_fields.split(",") if field.strip()])
+
+    openai_client = get_openai_client(
+        os.getenv("AZURE_OPENAI_ENDPOINT"), os.getenv("AZURE_OPENAI_KEY"), AZURE_OPENAI_API_VERSION
+    )
+    embedder = get_embedding_batcher(
+        openai_client, AZURE_OPENAI_DEPLOYMENT, os.getenv("AZURE_OPENAI_ENDPOINT"), dimensions=args.dimensions
+    )
+    target = get_container(args.prefix)
+
+    source_name = f"jsonl:{os.path.abspath(args.jsonl)}" if args.jsonl else (args.source or args.prefix)
+    pipeline = IngestionPipeline(
+        embed_fn=lambda texts: embedder.embed_many(texts, use_cache=False),
+        text_builder=text_builder,
+        writer=CosmosBulkWriter(target),
+        checkpoint_name=f"{source_name}->{args.prefix}",
+        embed_batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        missing_only_dimension=(args.dimensions or 3072) if args.missing_only else None,
+        # Documents loaded from a file or another container are not in the
+        # target yet, so the already embedded ones are written too
+        write_embedded=bool(args.jsonl or (args.source and args.source != args.prefix))
+    )
+    if args.restart:
+        pipeline.reset()
+
+    after = pipeline.resume_position()
+    if after is not None:
+        print(f"Resuming after position {after}")
+    if args.jsonl:
+        source = jsonl_source(args.jsonl, after)
+    else:
+        source = container_source(get_container(args.source) if args.source else target, id_field, after)
+
+    print(f"Embedding {args.kind} documents into {args.prefix}...")
+    report = pipeline.run(source)
+    print(f"✓ {report['written']} documents written ({report['embedded']} embedded, "
+          f"{report['reused']} with their existing embedding), {report['skipped']} skipped, "
+          f"{report['retries']} throttling retries in {report['seconds']:.1f}s "
+          f"({report['docs_per_sec']:.1f} docs/sec)")
+
+
+if __name__ == "__main__":
+    main()
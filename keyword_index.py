@@ -0,0 +1,458 @@
+"""
+keyword_index.py - Tokenized inverted index with BM25 scoring for hybrid search
+Scores whole tokens (so "auto" no longer matches "automatic") and finds keyword
+candidates across the whole container, not just the vector search top-N
+"""
+
+import os
+import re
+import math
+import heapq
+import threading
+from collections import Counter
+from typing import Callable, List, Dict, Any, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from projections import select_fields
+from change_feed_sync import CosmosChangeFeedSource, start_change_feed_sync, CHANGE_FEED_SYNC_ENABLED
+
+load_dotenv()
+
+# Configuration
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Build a corpus-wide index per container in the background (until it is ready, and
+# when disabled, BM25 runs over the candidates only)
+KEYWORD_INDEX_ENABLED = os.getenv("KEYWORD_INDEX_ENABLED", "true").lower() == "true"
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens (emails and policy numbers split on punctuation)"""
+    return _TOKEN_PATTERN.findall((text or "").lower())
+
+
+# ============================================================================
+# SEARCHABLE TEXT
+# ============================================================================
+
+# Fields read from the container to build the index (no embeddings)
+CUSTOMER_KEYWORD_FIELDS = ["customer_id", "first_name", "last_name", "occupation", "email", "address"]
+POLICY_KEYWORD_FIELDS = ["policy_id", "policy_type", "policy_number", "status", "payment_frequency", "customer_id", "auto_renew"]
+
+
+def customer_keyword_text(customer: Dict[str, Any]) -> str:
+    """Name, occupation, email, city and state of a customer"""
+    address = customer.get('address') or {}
+    return " ".join([
+        str(customer.get('first_name', '')),
+        str(customer.get('last_name', '')),
+        str(customer.get('occupation', '')),
+        str(customer.get('email', '')),
+        str(address.get('city', '')),
+        str(address.get('state', ''))
+    ])
+
+
+def policy_keyword_text(policy: Dict[str, Any]) -> str:
+    """Type, number, status, payment frequency, customer and auto-renew flag of a policy"""
+    return " ".join([
+        str(policy.get('policy_type', '')),
+        str(policy.get('policy_number', '')),
+        str(policy.get('status', '')),
+        str(policy.get('payment_frequency', '')),
+        str(policy.get('customer_id', '')),
+        "auto renew" if policy.get('auto_renew') else ""
+    ])
+
+
+# ============================================================================
+# INDEX
+# ============================================================================
+
+class KeywordIndex:
+    """
+    In-memory inverted index (term -> {doc id: term frequency}) scored with BM25
+
+    Documents are keyed by `id_field`; their searchable text comes from
+    `text_builder`. apply_changes() makes the index a change_feed_sync consumer.
+    """
+
+    def __init__(
+        self,
+        id_field: str,
+        text_builder: Callable[[Dict[str, Any]], str],
+        k1: float = BM25_K1,
+        b: float = BM25_B
+    ):
+        """
+        Args:
+            id_field: Document field used as the key (e.g. 'customer_id')
+            text_builder: Function returning a document's searchable text
+            k1: BM25 term-frequency saturation
+            b: BM25 document-length normalization
+        """
+        self.id_field = id_field
+        self.text_builder = text_builder
+        self.k1 = k1
+        self.b = b
+
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.doc_terms: Dict[str, Counter] = {}
+        self.total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self.doc_lengths
+
+    # ========================================================================
+    # UPDATES
+    # ========================================================================
+
+    def add_documents(self, documents: List[Dict[str, Any]]):
+        """Insert or replace documents"""
+        with self._lock:
+            for document in documents:
+                doc_id = document.get(self.id_field)
+                if doc_id is None:
+                    continue
+                doc_id = str(doc_id)
+                self.remove(doc_id)
+
+                terms = Counter(tokenize(self.text_builder(document)))
+                for term, frequency in terms.items():
+                    self.postings.setdefault(term, {})[doc_id] = frequency
+                self.doc_terms[doc_id] = terms
+                self.doc_lengths[doc_id] = sum(terms.values())
+                self.total_length += self.doc_lengths[doc_id]
+
+    def remove(self, doc_id: str) -> bool:
+        """Remove a document; returns False if it was not indexed"""
+        with self._lock:
+            terms = self.doc_terms.pop(doc_id, None)
+            if terms is None:
+                return False
+            for term in terms:
+                posting = self.postings.get(term)
+                if posting is not None:
+                    posting.pop(doc_id, None)
+                    if not posting:
+                        del self.postings[term]
+            self.total_length -= self.doc_lengths.pop(doc_id)
+            return True
+
+    def apply_changes(self, documents: List[Dict[str, Any]]):
+        """Upsert changed documents from the change feed (change_feed_sync consumer)"""
+        self.add_documents(documents)
+
+    # ========================================================================
+    # SCORING
+    # ========================================================================
+
+    def _idf(self, term: str) -> float:
+        """BM25 inverse document frequency (always positive)"""
+        doc_count = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.doc_lengths) - doc_count + 0.5) / (doc_count + 0.5))
+
+    def _query_terms(self, query: str) -> List[str]:
+        # A repeated query word counts once, as in the original per-term match
+        return list(dict.fromkeys(tokenize(query)))
+
+    def scores(self, query: str, doc_ids: Optional[List[str]] = None) -> Dict[str, float]:
+        """
+        BM25 scores for a query
+
+        Args:
+            query: Query text
+            doc_ids: Restrict scoring to these documents (None = every match)
+
+        Returns:
+            Mapping of doc id to BM25 score (documents matching no term omitted)
+        """
+        with self._lock:
+            if not self.doc_lengths:
+                return {}
+            average_length = self.total_length / len(self.doc_lengths) or 1.0
+            wanted = set(doc_ids) if doc_ids is not None else None
+
+            totals: Dict[str, float] = {}
+            for term in self._query_terms(query):
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = self._idf(term)
+                if wanted is None:
+                    matches = posting.items()
+                else:
+                    # Walk whichever side is smaller: the candidates or the posting list
+                    if len(wanted) < len(posting):
+                        matches = [(doc_id, posting[doc_id]) for doc_id in wanted if doc_id in posting]
+                    else:
+                        matches = [(doc_id, frequency) for doc_id, frequency in posting.items() if doc_id in wanted]
+                for doc_id, frequency in matches:
+                    length_norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / average_length
+                    totals[doc_id] = totals.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+            return totals
+
+    def max_score(self, query: str) -> float:
+        """Upper bound of scores() for a query, used to scale scores to 0-1"""
+        with self._lock:
+            return sum(self._idf(term) * (self.k1 + 1) for term in self._query_terms(query))
+
+    def normalized_scores(self, query: str, doc_ids: List[str]) -> List[float]:
+        """BM25 scores scaled to 0-1, in the order of doc_ids (0 for no match)"""
+        upper = self.max_score(query)
+        if upper <= 0:
+            return [0.0] * len(doc_ids)
+        totals = self.scores(query, doc_ids)
+        return [min(1.0, totals.get(doc_id, 0.0) / upper) for doc_id in doc_ids]
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """Best-matching documents across the whole index, highest BM25 first"""
+        totals = self.scores(query)
+        return heapq.nlargest(top_k, totals.items(), key=lambda item: item[1])
+
+
+def keyword_scores(
+    query: str,
+    documents: List[Dict[str, Any]],
+    id_field: str,
+    text_builder: Callable[[Dict[str, Any]], str],
+    index: Optional[KeywordIndex] = None
+) -> List[float]:
+    """
+    0-1 BM25 keyword scores for candidate documents
+
+    Uses the corpus-wide index when available (IDF from the whole container);
+    otherwise builds a throwaway index over the candidates themselves.
+
+    Returns:
+        One score per document, in order
+    """
+    doc_ids = [str(document.get(id_field)) for document in documents]
+    if index is None or not all(doc_id in index for doc_id in doc_ids):
+        index = KeywordIndex(id_field, text_builder)
+        index.add_documents(documents)
+    return index.normalized_scores(query, doc_ids)
+
+
+# ============================================================================
+# CORPUS-WIDE CANDIDATES
+# ============================================================================
+
+def fetch_keyword_candidates(
+    container,
+    id_field: str,
+    doc_ids: List[str],
+    fields: List[str],
+    query_embedding: List[float],
+    score_field: str,
+    where_clause: str = "",
+    parameters: Optional[List[Dict[str, Any]]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Fetch keyword-only candidates with their vector score, in one query
+
+    Args:
+        container: Cosmos DB container client
+        id_field: Field the ids refer to
+        doc_ids: Candidate ids found by the keyword index
+        fields: Fields to project
+        query_embedding: Query vector, so candidates get the same vector score
+            as the VectorDistance search results
+        score_field: Result key for the vector score (e.g. 'vector_score')
+        where_clause: Extra filter conditions (hybrid_search_with_filters)
+        parameters: Parameters referenced by where_clause
+
+    Returns:
+        Candidate documents (ids filtered out or deleted are skipped)
+    """
+    if not doc_ids:
+        return []
+
+    query, query_parameters = keyword_candidates_query(
+        id_field, doc_ids, fields, query_embedding, score_field, where_clause, parameters
+    )
+    return list(container.query_items(
+        query=query,
+        parameters=query_parameters,
+        enable_cross_partition_query=True
+    ))
+
+
+def keyword_candidates_query(
+    id_field: str,
+    doc_ids: List[str],
+    fields: List[str],
+    query_embedding: List[float],
+    score_field: str,
+    where_clause: str = "",
+    parameters: Optional[List[Dict[str, Any]]] = None
+):
+    """Query and parameters of fetch_keyword_candidates (shared with the async systems)"""
+    # Catch arguments shifted into the wrong slot before they turn into invalid SQL
+    if not isinstance(score_field, str) or not score_field.isidentifier():
+        raise ValueError(f"score_field must be a result alias, got {score_field!r}")
+    if not isinstance(where_clause, str):
+        raise ValueError(f"where_clause must be SQL text, got {type(where_clause).__name__}")
+    if parameters is not None and not all(isinstance(param, dict) and "name" in param for param in parameters):
+        raise ValueError("parameters must be a list of {'name', 'value'} dicts")
+
+    query = f"""
+    SELECT {select_fields(fields)},
+        VectorDistance(c.embedding, @embedding) AS {score_field}
+    FROM c
+    WHERE ARRAY_CONTAINS(@keyword_ids, c.{id_field}){f" AND {where_clause}" if where_clause else ""}
+    """
+    query_parameters = [
+        param for param in (parameters or []) if param["name"] not in ("@embedding", "@keyword_ids", "@top_k")
+    ] + [
+        {"name": "@embedding", "value": query_embedding},
+        {"name": "@keyword_ids", "value": list(doc_ids)}
+    ]
+    return query, query_parameters
+
+
+def missing_keyword_ids(
+    results: List[Dict[str, Any]],
+    index: Optional[KeywordIndex],
+    query: str,
+    candidate_count: int
+) -> List[str]:
+    """Ids of the index's best matches for query that results do not already hold"""
+    if index is None:
+        return []
+    seen = {str(result.get(index.id_field)) for result in results}
+    return [doc_id for doc_id, _ in index.search(query, candidate_count) if doc_id not in seen]
+
+
+def add_keyword_candidates(
+    results: List[Dict[str, Any]],
+    index: Optional[KeywordIndex],
+    query: str,
+    container,
+    fields: List[str],
+    query_embedding: List[float],
+    candidate_count: int,
+    *,
+    score_field: str = 'vector_score',
+    where_clause: str = "",
+    parameters: Optional[List[Dict[str, Any]]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Extend vector search candidates with the best keyword matches in the corpus
+
+    Args:
+        results: Vector search candidates
+        index: Corpus-wide keyword index (None = return results unchanged)
+        query: Query text
+        container: Container the candidates come from
+        fields: Fields to project for added candidates
+        query_embedding: Query vector
+        candidate_count: Number of keyword candidates to consider
+        score_field: Key holding the vector score (keyword-only, like the filters,
+            so a filter can never be passed where the score alias goes)
+        where_clause: Filter conditions the added candidates must satisfy
+        parameters: Parameters referenced by where_clause
+
+    Returns:
+        results followed by keyword candidates not already present
+    """
+    missing = missing_keyword_ids(results, index, query, candidate_count)
+    if not missing:
+        return results
+
+    try:
+        extra = fetch_keyword_candidates(
+            container, index.id_field, missing, fields, query_embedding,
+            score_field, where_clause, parameters
+        )
+    except Exception as e:
+        print(f"⚠️  Could not fetch keyword candidates, using vector candidates only: {e}")
+        return results
+
+    return results + extra
+
+
+# name -> built index (None when the build failed); _builds holds started builds
+_indexes: Dict[str, Optional[KeywordIndex]] = {}
+_builds: Dict[str, threading.Thread] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_keyword_index(
+    name: str,
+    container,
+    id_field: str,
+    text_builder: Callable[[Dict[str, Any]], str],
+    fields: List[str]
+) -> Optional[KeywordIndex]:
+    """
+    Return the process-wide keyword index for a container, or None until it is built
+
+    The first call starts the build in a background thread and returns
+    immediately, so a search never waits for a full container scan: until
+    the index is ready callers score their vector candidates only. Call it
+    at system start to have the index ready for the first searches. Returns
+    None for good when KEYWORD_INDEX_ENABLED is false or the container
+    cannot be scanned.
+
+    Args:
+        name: Container's environment prefix (e.g. 'COSMOS_hybrid')
+        container: Cosmos DB container client
+        id_field: Document key field
+        text_builder: Function returning a document's searchable text
+        fields: Fields read from the container to build the text
+    """
+    if not KEYWORD_INDEX_ENABLED:
+        return None
+
+    with _indexes_lock:
+        if name in _indexes:
+            return _indexes[name]
+        if name not in _builds:
+            build = threading.Thread(
+                target=_build_keyword_index,
+                args=(name, container, id_field, text_builder, fields),
+                name=f"keyword-index-{name}",
+                daemon=True
+            )
+            _builds[name] = build
+            build.start()
+    return None
+
+
+def _build_keyword_index(
+    name: str,
+    container,
+    id_field: str,
+    text_builder: Callable[[Dict[str, Any]], str],
+    fields: List[str]
+):
+    """Scan a container into a new index and publish it (background thread of get_keyword_index)"""
+    index = KeywordIndex(id_field, text_builder)
+    token = None
+    try:
+        # Feed position before the scan; changes made during it are replayed
+        if CHANGE_FEED_SYNC_ENABLED:
+            token = CosmosChangeFeedSource(container).current_token()
+        print(f"📚 Building keyword index for {name}...")
+        index.add_documents(container.query_items(
+            query=f"SELECT {select_fields(fields)} FROM c",
+            enable_cross_partition_query=True
+        ))
+        print(f"✓ Keyword index ready ({len(index)} documents, {len(index.postings)} terms)")
+    except Exception as e:
+        print(f"⚠️  Could not build keyword index for {name}, scoring candidates only: {e}")
+        index = None
+
+    if index is not None:
+        start_change_feed_sync(name, container, index, token)
+    with _indexes_lock:
+        _indexes[name] = index
@@ -0,0 +1,272 @@
+"""
+llm_executor.py - Rate-limit-aware concurrent executor for chat model calls
+Every churn narrative call goes through one process-wide executor that keeps
+the deployment's requests-per-minute and tokens-per-minute quotas with two
+token buckets, runs at most LLM_CONCURRENCY calls at once, retries 429s with
+the service's Retry-After hint or jittered backoff, and serves a priority
+queue, so an analyst's interactive request jumps ahead of queued batch work
+
+    from llm_executor import get_llm_executor, BATCH
+
+    executor = get_llm_executor()
+    response = executor.invoke(llm, messages)                    # interactive
+    futures = [executor.submit(llm.invoke, m, priority=BATCH) for m in batch]
+"""
+
+import os
+import time
+import queue
+import itertools
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+from throttling import is_throttled, retry_delay
+from prompt_builder import count_message_tokens
+
+load_dotenv()
+
+# Configuration
+# Quotas of the chat deployment (keep a little below the provisioned limits)
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "450"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "180000"))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "6"))
+# Tokens budgeted for a completion before its actual usage is known
+LLM_COMPLETION_TOKENS_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKENS_ESTIMATE", "800"))
+
+# Priorities (lower runs first)
+INTERACTIVE = 0
+BATCH = 10
+
+
+def estimate_tokens(messages: List[Any]) -> int:
+    """Prompt tokens of chat messages plus the completion estimate"""
+    return count_message_tokens(messages) + LLM_COMPLETION_TOKENS_ESTIMATE
+
+
+def _usage_tokens(response: Any) -> Optional[int]:
+    """Total tokens reported on a chat response (LangChain AIMessage), if any"""
+    usage = getattr(response, "usage_metadata", None) or {}
+    if usage.get("total_tokens"):
+        return int(usage["total_tokens"])
+    token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+    return token_usage.get("total_tokens")
+
+
+class TokenBucket:
+    """Budget refilled continuously at capacity per minute"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float):
+        """Block until amount is available and take it (amounts above capacity wait for a full bucket)"""
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                wait = (amount - self.level) / self.rate
+            time.sleep(wait)
+
+    def adjust(self, amount: float):
+        """Take (or with a negative amount give back) budget without waiting, e.g. once actual usage is known"""
+        with self._lock:
+            self._refill()
+            self.level = min(self.capacity, self.level - amount)
+
+
+class _Job:
+    def __init__(self, fn: Callable, args: tuple, kwargs: dict, tokens: int):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.tokens = tokens
+        self.future: Future = Future()
+
+
+class LLMExecutor:
+    """
+    Worker pool that admits LLM calls in priority order within RPM/TPM budgets
+
+    Admission is serialized: one worker at a time takes the highest-priority
+    job and waits for its request and token budget, so a job submitted with
+    INTERACTIVE priority is the next one admitted even when hundreds of BATCH
+    jobs are queued.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = LLM_TOKENS_PER_MINUTE,
+        concurrency: int = LLM_CONCURRENCY,
+        max_retries: int = LLM_MAX_RETRIES
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._admission = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._workers: List[threading.Thread] = []
+
+        self.completed = 0
+        self.failed = 0
+        self.throttled = 0
+
+    def _start(self):
+        with self._stats_lock:
+            if self._workers:
+                return
+            for i in range(self.concurrency):
+                worker = threading.Thread(target=self._work, name=f"llm-executor-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(self, fn: Callable, *args, priority: int = BATCH, tokens: Optional[int] = None, **kwargs) -> Future:
+        """
+        Queue a call
+
+        Args:
+            fn: Function making one LLM request (e.g. llm.invoke)
+            priority: INTERACTIVE or BATCH (lower runs first)
+            tokens: Estimated tokens of the request (default: estimated from a
+                message list in args[0])
+
+        Returns:
+            Future of fn's result
+        """
+        if tokens is None:
+            tokens = estimate_tokens(args[0]) if args and isinstance(args[0], list) else LLM_COMPLETION_TOKENS_ESTIMATE
+
+        self._start()
+        job = _Job(fn, args, kwargs, tokens)
+        self._queue.put((priority, next(self._sequence), job))
+        return job.future
+
+    def invoke(self, llm, messages: List[Any], priority: int = INTERACTIVE) -> Any:
+        """llm.invoke(messages) through the executor, blocking for the response"""
+        return self.submit(llm.invoke, messages, priority=priority).result()
+
+    def stream(self, llm, messages: List[Any]) -> Iterator[Any]:
+        """
+        llm.stream(messages) within the budgets (for an interactive caller, so
+        it bypasses the queue); a 429 before the first chunk is retried, and
+        the estimate is settled with the usage reported on the final chunk
+        """
+        tokens = estimate_tokens(messages)
+        self.requests.acquire(1)
+        self.tokens.acquire(tokens)
+
+        for attempt in range(self.max_retries + 1):
+            started = False
+            actual = None
+            try:
+                for chunk in llm.stream(messages):
+                    started = True
+                    actual = _usage_tokens(chunk) or actual
+                    yield chunk
+            except Exception as e:
+                if started or not is_throttled(e) or attempt == self.max_retries:
+                    raise
+                self._count("throttled")
+                time.sleep(retry_delay(e, attempt))
+                self.requests.acquire(1)
+                self.tokens.acquire(tokens)
+                continue
+
+            # Settle the token estimate as _call does
+            if actual is not None:
+                self.tokens.adjust(actual - tokens)
+            return
+
+    def _work(self):
+        while True:
+            with self._admission:
+                _, _, job = self._queue.get()
+                # Jobs cancelled while queued never take budget
+                if job.future.cancelled():
+                    continue
+                self.requests.acquire(1)
+                self.tokens.acquire(job.tokens)
+
+            if not job.future.set_running_or_notify_cancel():
+                # Cancelled while waiting for budget: give it back
+                self.requests.adjust(-1)
+                self.tokens.adjust(-job.tokens)
+                continue
+            try:
+                result = self._call(job)
+            except BaseException as e:
+                self._count("failed")
+                job.future.set_exception(e)
+            else:
+                self._count("completed")
+                job.future.set_result(result)
+
+    def _call(self, job: _Job) -> Any:
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+                break
+            except Exception as e:
+                if not is_throttled(e) or attempt == self.max_retries:
+                    raise
+                self._count("throttled")
+                time.sleep(retry_delay(e, attempt))
+                # The retry is a new request against the quotas
+                self.requests.acquire(1)
+                self.tokens.acquire(job.tokens)
+
+        # Settle the token estimate against what the request actually used
+        actual = _usage_tokens(result)
+        if actual is not None:
+            self.tokens.adjust(actual - job.tokens)
+        return result
+
+    def _count(self, counter: str):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for monitoring"""
+        with self._stats_lock:
+            return {
+                'queued': self._queue.qsize(),
+                'completed': self.completed,
+                'failed': self.failed,
+                'throttled': self.throttled,
+                'request_budget': round(self.requests.level, 1),
+                'token_budget': round(self.tokens.level)
+            }
+
+
+_shared_executor: Optional[LLMExecutor] = None
+_shared_executor_lock = threading.Lock()
+
+
+def get_llm_executor() -> LLMExecutor:
+    """Return the process-wide LLM executor, creating it on first use"""
+    global _shared_executor
+    if _shared_executor is None:
+        with _shared_executor_lock:
+            if _shared_executor is None:
+                _shared_executor = LLMExecutor()
+    return _shared_executor
@@ -0,0 +1,151 @@
+"""
+narrative_cache.py - Shared cache for LLM churn narratives
+Two-level cache (two_level_cache.TwoLevelCache) keyed by a
+fingerprint of the model, temperature and the narrative's structured inputs, so
+re-analysing an unchanged customer returns the earlier narrative instead of
+paying for another chat completion. Entries expire after a TTL and the disk
+store is capped at NARRATIVE_CACHE_MAX_ENTRIES, evicting least recently used
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from two_level_cache import TwoLevelCache
+
+load_dotenv()
+
+# Configuration
+# Set NARRATIVE_CACHE_PATH to an empty string to keep the cache in memory only
+NARRATIVE_CACHE_PATH = os.getenv(
+    "NARRATIVE_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "narratives.sqlite3")
+)
+NARRATIVE_CACHE_MEMORY_SIZE = int(os.getenv("NARRATIVE_CACHE_MEMORY_SIZE", "256"))
+NARRATIVE_CACHE_MAX_ENTRIES = int(os.getenv("NARRATIVE_CACHE_MAX_ENTRIES", "10000"))
+NARRATIVE_CACHE_TTL_SECONDS = float(os.getenv("NARRATIVE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+def fingerprint(model: str, temperature: Any, inputs: Dict[str, Any]) -> str:
+    """
+    Stable key of one narrative request
+
+    Hashes the structured inputs of the narrative (churn factors, profile
+    fields, policy-type breakdown and prompt templates, as returned by
+    prompt_builder.narrative_inputs) as canonical JSON, not the rendered
+    prompt. Time-derived values such as tenure are already coarsened to
+    whole months there, so an unchanged customer keeps the same key until a
+    month boundary passes; a real change, or editing a prompt template,
+    gives a new key.
+
+    Args:
+        model: Chat model or deployment name
+        temperature: Sampling temperature
+        inputs: Everything the prompt is rendered from
+    """
+    raw = json.dumps(
+        {'model': model or "", 'temperature': temperature, 'inputs': inputs},
+        sort_keys=True, default=str
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class NarrativeCache(TwoLevelCache):
+    """
+    Two-level narrative cache shared by every ChurnPredictionAgent in the process
+
+    Adds a TTL and a cap on the number of narratives on disk to
+    TwoLevelCache. Disk entries are evicted least recently used first; memory
+    hits only note the time in memory and are written to last_used in
+    batches by put(), so a hit never waits for the disk.
+    """
+
+    table = "narratives"
+    columns = "model TEXT NOT NULL, narrative TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL"
+    label = "Narrative cache"
+
+    def __init__(self, path: Optional[str] = NARRATIVE_CACHE_PATH,
+                 max_memory_items: int = NARRATIVE_CACHE_MEMORY_SIZE,
+                 max_entries: int = NARRATIVE_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = NARRATIVE_CACHE_TTL_SECONDS):
+        """
+        Args:
+            path: SQLite file for the on-disk store (None or "" for memory only)
+            max_memory_items: Number of narratives kept in the in-memory LRU
+            max_entries: Number of narratives kept on disk
+            ttl_seconds: Age after which a narrative is regenerated
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> time of memory hits not yet written to last_used
+        self._touched: Dict[str, float] = {}
+        super().__init__(path, max_memory_items)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached narrative for a fingerprint, or None on a miss or when expired"""
+        entry = self._get(key)
+        return entry[1] if entry is not None else None
+
+    def put(self, key: str, model: str, narrative: str):
+        """Store a narrative in memory and on disk, evicting the least recently used beyond the cap"""
+        self._put(key, (model, narrative, time.time()))
+
+    def _create_indexes(self):
+        self._conn.execute("CREATE INDEX IF NOT EXISTS narratives_last_used ON narratives (last_used)")
+
+    def _fresh(self, entry: Tuple[str, str, float]) -> bool:
+        return time.time() - entry[2] <= self.ttl_seconds
+
+    def _on_memory_hit(self, key: str):
+        if self._conn is not None:
+            self._touched[key] = time.time()
+
+    def _read(self, key: str) -> Optional[Tuple[str, str, float]]:
+        now = time.time()
+        row = self._conn.execute(
+            "SELECT model, narrative, created_at FROM narratives WHERE key = ? AND created_at >= ?",
+            (key, now - self.ttl_seconds)
+        ).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("UPDATE narratives SET last_used = ? WHERE key = ?", (now, key))
+        self._conn.commit()
+        return row[0], row[1], row[2]
+
+    def _write(self, key: str, entry: Tuple[str, str, float]):
+        model, narrative, created_at = entry
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE narratives SET last_used = ? WHERE key = ?",
+                [(used, touched) for touched, used in self._touched.items()]
+            )
+            self._touched.clear()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO narratives (key, model, narrative, created_at, last_used)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (key, model, narrative, created_at, created_at)
+        )
+        self._conn.execute(
+            "DELETE FROM narratives WHERE created_at < ? OR key IN ("
+            " SELECT key FROM narratives ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (created_at - self.ttl_seconds, self.max_entries)
+        )
+
+
+_shared_cache: Optional[NarrativeCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_narrative_cache() -> NarrativeCache:
+    """Return the process-wide narrative cache, creating it on first use"""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = NarrativeCache()
+    return _shared_cache
@@ -0,0 +1,96 @@
+"""
+parallel_search.py - Concurrent fan-out of independent container searches
+Runs the customer and policy searches side by side on a shared thread pool (or
+as coroutines on the event loop) and degrades to partial results when a
+source is slow
+"""
+
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Awaitable, Callable, Dict, List, Any, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuration
+SEARCH_FANOUT_WORKERS = int(os.getenv("SEARCH_FANOUT_WORKERS", "8"))
+SEARCH_SOURCE_TIMEOUT = float(os.getenv("SEARCH_SOURCE_TIMEOUT", "10"))
+
+# Shared by every RAG system in the process; the sync Cosmos SDK blocks on I/O,
+# so threads are enough to overlap the round-trips
+_executor = ThreadPoolExecutor(max_workers=SEARCH_FANOUT_WORKERS, thread_name_prefix="search-fanout")
+
+
+def run_parallel_searches(
+    searches: Dict[str, Callable[[], List[Dict[str, Any]]]],
+    timeout: Optional[float] = None
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Run several searches concurrently and collect their results
+
+    Args:
+        searches: Mapping of source name (e.g. 'customers') to a no-argument
+            callable returning that source's results
+        timeout: Seconds each source may take, measured from submission
+            (defaults to SEARCH_SOURCE_TIMEOUT)
+
+    Returns:
+        Mapping of source name to results. A source that times out or raises
+        contributes an empty list instead of blocking the others.
+    """
+    if timeout is None:
+        timeout = SEARCH_SOURCE_TIMEOUT
+
+    started = time.monotonic()
+    futures = {name: _executor.submit(search) for name, search in searches.items()}
+
+    results = {}
+    for name, future in futures.items():
+        remaining = max(0.0, timeout - (time.monotonic() - started))
+        try:
+            results[name] = future.result(timeout=remaining)
+        except FutureTimeoutError:
+            print(f"⚠️  {name} search timed out after {timeout:.1f}s, continuing with partial results")
+            future.cancel()
+            results[name] = []
+        except Exception as e:
+            print(f"❌ Error in {name} search: {e}")
+            results[name] = []
+
+    return results
+
+
+async def gather_searches(
+    searches: Dict[str, Awaitable[List[Dict[str, Any]]]],
+    timeout: Optional[float] = None
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    run_parallel_searches for coroutines: await several searches concurrently
+
+    Args:
+        searches: Mapping of source name to a search coroutine
+        timeout: Seconds each source may take (defaults to SEARCH_SOURCE_TIMEOUT)
+
+    Returns:
+        Mapping of source name to results; a source that times out or raises
+        contributes an empty list
+    """
+    if timeout is None:
+        timeout = SEARCH_SOURCE_TIMEOUT
+
+    async def guarded(name: str, search: Awaitable[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        try:
+            return await asyncio.wait_for(search, timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️  {name} search timed out after {timeout:.1f}s, continuing with partial results")
+            return []
+        except Exception as e:
+            print(f"❌ Error in {name} search: {e}")
+            return []
+
+    names = list(searches)
+    results = await asyncio.gather(*(guarded(name, searches[name]) for name in names))
+    return dict(zip(names, results))
@@ -5,9 +5,24 @@ Combines vector search (semantic) + keyword matching for optimal results
 
 import os
 import json
-from azure.cosmos import CosmosClient
-from openai import AzureOpenAI
-from typing import List, Dict, Any, Optional
+from client_registry import get_cosmos_client, get_openai_client
+from embedding_batcher import get_embedding_batcher
+from cosmos_lookup import PartitionKeyLookup
+import policy_retrieval
+from projections import POLICY_FIELDS, POLICY_SEARCH_FIELDS
+from query_pages import iter_query_pages, QUERY_PAGE_SIZE
+from vector_index import load_vector_index
+from keyword_index import (
+    get_keyword_index, keyword_scores, add_keyword_candidates,
+    policy_keyword_text, POLICY_KEYWORD_FIELDS
+)
+from change_feed_sync import start_change_feed_sync
+from statistics_engine import get_statistics_engine, POLICY_STATISTICS
+from fusion import (
+    get_fusion_strategy, rank_by_scores,
+    HYBRID_CANDIDATE_MULTIPLIER, HYBRID_MAX_CANDIDATES, HYBRID_FUSION_STRATEGY
+)
+from typing import Iterator, List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
 import os
 
@@ -17,6 +32,8 @@ COSMOS_pol_hybrid_ENDPOINT = os.getenv("COSMOS_pol_hybrid_ENDPOINT")
 COSMOS_pol_hybrid_KEY = os.getenv("COSMOS_pol_hybrid_KEY")
 COSMOS_pol_hybrid_DATABASE_NAME = os.getenv("COSMOS_pol_hybrid_DATABASE_NAME")
 COSMOS_pol_hybrid_CONTAINER_NAME = os.getenv("COSMOS_pol_hybrid_CONTAINER_NAME")
+# Optional local ANN index built with vector_index.py
+COSMOS_pol_hybrid_VECTOR_INDEX_PATH = os.getenv("COSMOS_pol_hybrid_VECTOR_INDEX_PATH")
 
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
 AZURE_OPENAI_KEY = os.getenv("AZURE_OPENAI_KEY")
@@ -29,16 +46,27 @@ class PolicyRetriever:
         print("Initializing policy retrieval client with HYBRID SEARCH...")
 
         # Initialize Cosmos DB COSMOS_pol_hybrid_ENDPOINT
-        self.cosmos_client = CosmosClient(COSMOS_pol_hybrid_ENDPOINT, COSMOS_pol_hybrid_KEY)
+        self.cosmos_client = get_cosmos_client(COSMOS_pol_hybrid_ENDPOINT, COSMOS_pol_hybrid_KEY)
         self.database = self.cosmos_client.get_database_client(COSMOS_pol_hybrid_DATABASE_NAME)
         self.container = self.database.get_container_client(COSMOS_pol_hybrid_CONTAINER_NAME)
+        self.lookup = PartitionKeyLookup(self.container, POLICY_FIELDS)
+        self.index = load_vector_index(COSMOS_pol_hybrid_VECTOR_INDEX_PATH)
+        if self.index is not None:
+            # Keep the index current with inserts and updates from the change feed
+            start_change_feed_sync("COSMOS_pol_hybrid", self.container, self.index)
+        # Start building the corpus-wide keyword index in the background
+        self.get_keyword_index()
 
         # Initialize Azure OpenAI client for vector search
-        self.openai_client = AzureOpenAI(
-            azure_endpoint=AZURE_OPENAI_ENDPOINT,
-            api_key=AZURE_OPENAI_KEY,
-            api_version=AZURE_OPENAI_API_VERSION
+        self.openai_client = get_openai_client(
+            AZURE_OPENAI_ENDPOINT,
+            AZURE_OPENAI_KEY,
+            AZURE_OPENAI_API_VERSION
         )
+        self.embedder = get_embedding_batcher(self.openai_client, AZURE_OPENAI_DEPLOYMENT, AZURE_OPENAI_ENDPOINT)
+
+        # Fusion of vector and keyword rankings: 'rrf', 'weighted' or an object with fuse()
+        self.fusion_strategy = HYBRID_FUSION_STRATEGY
 
         print("✓ Client initialized successfully")
         print("✓ Hybrid Search enabled (Vector + Keyword)\n")
@@ -47,19 +75,9 @@ class PolicyRetriever:
         """Retrieve all policies for a specific customer by customer_id"""
 
         try:
-            query = "SELECT * FROM c WHERE c.customer_id = @customer_id"
-            parameters = [{"name": "@customer_id", "value": customer_id}]
-
-            items = list(self.container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
-
-            # Remove embedding from response (too large and not needed for display)
-            for item in items:
-                if 'embedding' in item:
-                    del item['embedding']
+            # Single-partition query when customer_id is the partition key;
+            # the projection keeps the embedding on the server
+            items = self.lookup.get_all('customer_id', customer_id)
 
             return items
 
@@ -71,20 +89,10 @@ class PolicyRetriever:
         """Retrieve complete policy details by policy_id"""
 
         try:
-            query = "SELECT * FROM c WHERE c.policy_id = @policy_id"
-            parameters = [{"name": "@policy_id", "value": policy_id}]
+            # Single-partition projected query when policy_id is the partition key
+            policy = self.lookup.get_one('policy_id', policy_id)
 
-            items = list(self.container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
-
-            if items:
-                policy = items[0]
-                # Remove embedding from response
-                if 'embedding' in policy:
-                    del policy['embedding']
+            if policy:
                 return policy
             else:
                 return None
@@ -96,16 +104,29 @@ class PolicyRetriever:
     def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding vector for search query"""
 
+        # Cached queries return immediately; concurrent calls share one request
         try:
-            response = self.openai_client.embeddings.create(
-                input=text,
-                model=AZURE_OPENAI_DEPLOYMENT
-            )
-            return response.data[0].embedding
+            return self.embedder.embed(text)
         except Exception as e:
             print(f"Error generating embedding: {e}")
             raise
 
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embedding vectors for many texts in as few requests as possible"""
+
+        try:
+            return self.embedder.embed_many(texts)
+        except Exception as e:
+            print(f"Error generating embeddings: {e}")
+            raise
+
+    def get_keyword_index(self):
+        """Corpus-wide BM25 index over the policy container (None until its background build is done)"""
+        return get_keyword_index(
+            "COSMOS_pol_hybrid", self.container, 'policy_id',
+            policy_keyword_text, POLICY_KEYWORD_FIELDS
+        )
+
     def hybrid_search(
         self, 
         query_text: str, 
@@ -119,7 +140,7 @@ class PolicyRetriever:
         Implementation: Uses post-processing approach for maximum compatibility
         1. Performs vector search to get candidates
         2. Calculates keyword match scores
-        3. Combines scores with weights
+        3. Fuses the vector and keyword rankings (RRF or weighted sum, see fusion.py)
         
         Args:
             query_text: Search query
@@ -135,81 +156,75 @@ class PolicyRetriever:
             print(f"🔍 Running HYBRID SEARCH (Vector: {vector_weight:.0%}, Keyword: {fulltext_weight:.0%})")
             
             # Step 1: Get more candidates using vector search
-            # We fetch 3x the requested results to have a good pool for re-ranking
-            candidate_count = min(top_k * 3, 50)
+            # Rank fusion needs only a small pool per source (HYBRID_CANDIDATE_MULTIPLIER x top_k)
+            candidate_count = min(top_k * HYBRID_CANDIDATE_MULTIPLIER, HYBRID_MAX_CANDIDATES)
             
             # Generate embedding for query
             query_embedding = self.generate_embedding(query_text)
 
-            # Vector search query
-            query = """
-            SELECT TOP @top_k 
-                c.policy_id,
-                c.customer_id,
-                c.policy_number,
-                c.policy_type,
-                c.status,
-                c.annual_premium,
-                c.coverage_amount,
-                c.deductible,
-                c.payment_frequency,
-                c.start_date,
-                c.end_date,
-                c.term_months,
-                c.auto_renew,
-                c.agent_id,
-                c.metadata,
-                VectorDistance(c.embedding, @embedding) AS vector_score
-            FROM c
-            ORDER BY VectorDistance(c.embedding, @embedding)
-            """
-
-            parameters = [
-                {"name": "@top_k", "value": candidate_count},
-                {"name": "@embedding", "value": query_embedding}
-            ]
-
-            results = list(self.container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
+            # Rank candidates with the local index when one is loaded; only
+            # those documents are then read from Cosmos DB
+            if self.index is not None:
+                results = self.index.search_documents(
+                    self.container, query_embedding, candidate_count,
+                    POLICY_SEARCH_FIELDS, 'vector_score'
+                )
+            else:
+                # Vector search query
+                query = """
+                SELECT TOP @top_k 
+                    c.policy_id,
+                    c.customer_id,
+                    c.policy_number,
+                    c.policy_type,
+                    c.status,
+                    c.annual_premium,
+                    c.coverage_amount,
+                    c.deductible,
+                    c.payment_frequency,
+                    c.start_date,
+                    c.end_date,
+                    c.term_months,
+                    c.auto_renew,
+                    c.agent_id,
+                    c.metadata,
+                    VectorDistance(c.embedding, @embedding) AS vector_score
+                FROM c
+                ORDER BY VectorDistance(c.embedding, @embedding)
+                """
+
+                parameters = [
+                    {"name": "@top_k", "value": candidate_count},
+                    {"name": "@embedding", "value": query_embedding}
+                ]
+
+                results = list(self.container.query_items(
+                    query=query,
+                    parameters=parameters,
+                    enable_cross_partition_query=True
+                ))
+
+            # Add the best keyword matches from the whole container, not just the
+            # vector candidates
+            keyword_index = self.get_keyword_index()
+            candidates = add_keyword_candidates(
+                results, keyword_index, query_text, self.container,
+                POLICY_SEARCH_FIELDS, query_embedding, candidate_count
+            )
 
-            if not results:
+            if not candidates:
                 return []
             
-            # Step 2: Calculate keyword match scores for each result
-            query_terms = query_text.lower().split()
-            
-            for result in results:
-                # Create searchable text from policy fields
-                searchable_text = " ".join([
-                    str(result.get('policy_type', '')),
-                    str(result.get('policy_number', '')),
-                    str(result.get('status', '')),
-                    str(result.get('payment_frequency', '')),
-                    str(result.get('customer_id', '')),
-                    "auto" if result.get('auto_renew') else "",
-                    "renew" if result.get('auto_renew') else ""
-                ]).lower()
-                
-                # Calculate keyword match score (0-1)
-                matches = sum(1 for term in query_terms if term in searchable_text)
-                keyword_score = matches / len(query_terms) if query_terms else 0
-                
-                # Normalize vector score to 0-1 range (vector_score is already 0-1)
-                vector_score_normalized = result['vector_score']
-                
-                # Calculate hybrid score
-                hybrid_score = (vector_weight * vector_score_normalized) + (fulltext_weight * keyword_score)
-                
-                # Add scores to result
-                result['fulltext_score'] = keyword_score
-                result['hybrid_score'] = hybrid_score
+            # Step 2: BM25 keyword scores over whole tokens (IDF from the whole container when indexed)
+            query_scores = keyword_scores(query_text, candidates, 'policy_id', policy_keyword_text, keyword_index)
             
-            # Step 3: Re-rank by hybrid score and return top_k
-            results.sort(key=lambda x: x['hybrid_score'], reverse=False)  # Lower is better for distance
-            results = results[:top_k]
+            # Step 3: Fuse the vector and keyword rankings and keep the top_k
+            fusion = get_fusion_strategy(self.fusion_strategy, vector_weight, fulltext_weight)
+            keyword_ranked, keyword_ranked_scores = rank_by_scores(candidates, query_scores)
+            results = fusion.fuse(
+                results, keyword_ranked, 'policy_id', top_k,
+                keyword_field='fulltext_score', keyword_scores=keyword_ranked_scores
+            )
             
             print(f"✓ Found {len(results)} results using hybrid search")
             return results
@@ -292,39 +307,9 @@ class PolicyRetriever:
         """Search policies by various criteria"""
 
         try:
-            conditions = []
-            parameters = []
-
-            if policy_type:
-                conditions.append("c.policy_type = @policy_type")
-                parameters.append({"name": "@policy_type", "value": policy_type})
-
-            if status:
-                conditions.append("c.status = @status")
-                parameters.append({"name": "@status", "value": status})
-
-            if min_premium is not None:
-                conditions.append("c.annual_premium >= @min_premium")
-                parameters.append({"name": "@min_premium", "value": min_premium})
-
-            if max_premium is not None:
-                conditions.append("c.annual_premium <= @max_premium")
-                parameters.append({"name": "@max_premium", "value": max_premium})
-
-            if min_coverage is not None:
-                conditions.append("c.coverage_amount >= @min_coverage")
-                parameters.append({"name": "@min_coverage", "value": min_coverage})
-
-            if payment_frequency:
-                conditions.append("c.payment_frequency = @payment_frequency")
-                parameters.append({"name": "@payment_frequency", "value": payment_frequency})
-
-            if auto_renew is not None:
-                conditions.append("c.auto_renew = @auto_renew")
-                parameters.append({"name": "@auto_renew", "value": auto_renew})
-
-            where_clause = " AND ".join(conditions) if conditions else "1=1"
-            query = f"SELECT * FROM c WHERE {where_clause}"
+            query, parameters = self._criteria_query(
+                policy_type, status, min_premium, max_premium, min_coverage, payment_frequency, auto_renew
+            )
 
             results = list(self.container.query_items(
                 query=query,
@@ -332,17 +317,45 @@ class PolicyRetriever:
                 enable_cross_partition_query=True
             ))
 
-            # Remove embeddings from results
-            for result in results:
-                if 'embedding' in result:
-                    del result['embedding']
-
             return results
 
         except Exception as e:
             print(f"Error searching by criteria: {e}")
             return []
 
+    def search_by_criteria_pages(
+            self,
+            policy_type: Optional[str] = None,
+            status: Optional[str] = None,
+            min_premium: Optional[float] = None,
+            max_premium: Optional[float] = None,
+            min_coverage: Optional[int] = None,
+            payment_frequency: Optional[str] = None,
+            auto_renew: Optional[bool] = None,
+            page_size: int = QUERY_PAGE_SIZE,
+            continuation_token: Optional[str] = None
+    ) -> Iterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """
+        search_by_criteria one page at a time, so broad filters stream with
+        bounded memory
+
+        Args:
+            (criteria): Same filters as search_by_criteria
+            page_size: Policies per page (max_item_count)
+            continuation_token: Token yielded with an earlier page, to resume after it
+
+        Yields:
+            (policies, continuation token after them); query errors are
+            raised so the caller can resume from the last token
+        """
+        query, parameters = self._criteria_query(
+            policy_type, status, min_premium, max_premium, min_coverage, payment_frequency, auto_renew
+        )
+        yield from iter_query_pages(self.container, query, parameters, page_size, continuation_token)
+
+    # Same filters and projection as the vector-only retriever
+    _criteria_query = staticmethod(policy_retrieval.PolicyRetriever._criteria_query)
+
     def hybrid_search_with_filters(
         self,
         query_text: str,
@@ -448,38 +461,29 @@ class PolicyRetriever:
                 enable_cross_partition_query=True
             ))
             
-            if not results:
+            # Add the best keyword matches from the whole container, not just the
+            # vector candidates
+            keyword_index = self.get_keyword_index()
+            candidates = add_keyword_candidates(
+                results, keyword_index, query_text, self.container,
+                POLICY_SEARCH_FIELDS, query_embedding, candidate_count,
+                where_clause=where_clause, parameters=parameters
+            )
+
+            if not candidates:
                 print(f"✓ No results found matching the filters")
                 return []
             
-            # Post-process: Add keyword matching scores
-            query_terms = query_text.lower().split()
-            
-            for result in results:
-                # Create searchable text
-                searchable_text = " ".join([
-                    str(result.get('policy_type', '')),
-                    str(result.get('policy_number', '')),
-                    str(result.get('status', '')),
-                    str(result.get('payment_frequency', '')),
-                    str(result.get('customer_id', ''))
-                ]).lower()
-                
-                # Calculate keyword match score
-                matches = sum(1 for term in query_terms if term in searchable_text)
-                keyword_score = matches / len(query_terms) if query_terms else 0
-                
-                # Calculate hybrid score
-                vector_score_normalized = result['vector_score']
-                hybrid_score = (vector_weight * vector_score_normalized) + (fulltext_weight * keyword_score)
-                
-                # Add scores
-                result['fulltext_score'] = keyword_score
-                result['hybrid_score'] = hybrid_score
+            # Post-process: BM25 keyword scores over whole tokens
+            query_scores = keyword_scores(query_text, candidates, 'policy_id', policy_keyword_text, keyword_index)
             
-            # Re-rank by hybrid score
-            results.sort(key=lambda x: x['hybrid_score'], reverse=False)
-            results = results[:top_k]
+            # Fuse the vector and keyword rankings and keep the top_k
+            fusion = get_fusion_strategy(self.fusion_strategy, vector_weight, fulltext_weight)
+            keyword_ranked, keyword_ranked_scores = rank_by_scores(candidates, query_scores)
+            results = fusion.fuse(
+                results, keyword_ranked, 'policy_id', top_k,
+                keyword_field='fulltext_score', keyword_scores=keyword_ranked_scores
+            )
             
             print(f"✓ Found {len(results)} filtered hybrid search results")
             return results
@@ -498,55 +502,11 @@ class PolicyRetriever:
             )
 
     def get_policy_statistics(self) -> Dict[str, Any]:
-        """Get basic statistics about policies in the database"""
+        """Get basic statistics about policies in the database (plus percentiles and histograms)"""
 
         try:
-            stats = {}
-
-            # Total count
-            count_query = "SELECT VALUE COUNT(1) FROM c"
-            stats['total_policies'] = list(self.container.query_items(
-                query=count_query,
-                enable_cross_partition_query=True
-            ))[0]
-
-            # Average premium
-            avg_premium_query = "SELECT VALUE AVG(c.annual_premium) FROM c"
-            stats['average_premium'] = round(list(self.container.query_items(
-                query=avg_premium_query,
-                enable_cross_partition_query=True
-            ))[0], 2)
-
-            # Average coverage
-            avg_coverage_query = "SELECT VALUE AVG(c.coverage_amount) FROM c"
-            stats['average_coverage'] = round(list(self.container.query_items(
-                query=avg_coverage_query,
-                enable_cross_partition_query=True
-            ))[0], 2)
-
-            # Policy type distribution
-            type_query = """
-            SELECT c.policy_type AS type, COUNT(1) AS count 
-            FROM c 
-            GROUP BY c.policy_type
-            """
-            stats['type_distribution'] = list(self.container.query_items(
-                query=type_query,
-                enable_cross_partition_query=True
-            ))
-
-            # Status distribution
-            status_query = """
-            SELECT c.status AS status, COUNT(1) AS count 
-            FROM c 
-            GROUP BY c.status
-            """
-            stats['status_distribution'] = list(self.container.query_items(
-                query=status_query,
-                enable_cross_partition_query=True
-            ))
-
-            return stats
+            # One shared snapshot from a single scan, kept current by the change feed
+            return get_statistics_engine("COSMOS_pol_hybrid", self.container, POLICY_STATISTICS).statistics()
 
         except Exception as e:
             print(f"Error fetching statistics: {e}")
@@ -869,7 +829,9 @@ def main():
                     auto_renew = False
 
                 print("\nSearching...")
-                results = retriever.search_by_criteria(
+                # Stream the matches page by page; only the ones shown are kept
+                results, total = [], 0
+                for page, _ in retriever.search_by_criteria_pages(
                     policy_type=policy_type,
                     status=status,
                     min_premium=min_premium,
@@ -877,23 +839,27 @@ def main():
                     min_coverage=min_coverage,
                     payment_frequency=payment_freq,
                     auto_renew=auto_renew
-                )
+                ):
+                    total += len(page)
+                    results.extend(page[:10 - len(results)])
 
                 if results:
-                    print(f"\n✓ Found {len(results)} policies matching criteria:\n")
-                    for i, policy in enumerate(results[:10], 1):
+                    print(f"\n✓ Found {total} policies matching criteria:\n")
+                    for i, policy in enumerate(results, 1):
                         print(f"{i}. {policy['policy_type']} - {policy['policy_number']} ({policy['status']})")
                         print(f"   Customer: {policy['customer_id']}")
                         print(f"   Premium: ${policy['annual_premium']:,.2f} | Coverage: ${policy['coverage_amount']:,}")
                         print()
 
-                    if len(results) > 10:
-                        print(f"... and {len(results) - 10} more results")
+                    if total > 10:
+                        print(f"... and {total - 10} more results")
                 else:
                     print("❌ No policies match the criteria")
 
             except ValueError:
                 print("❌ Invalid input for numeric fields")
+            except Exception as e:
+                print(f"❌ Error searching by criteria: {e}")
 
         elif choice == "7":
             # Statistics
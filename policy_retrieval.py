@@ -4,9 +4,13 @@ policy_retrieval.py - Retrieve policy data from Azure Cosmos DB
 
 import os
 import json
-from azure.cosmos import CosmosClient
-from openai import AzureOpenAI
-from typing import List, Dict, Any, Optional
+from client_registry import get_cosmos_client, get_openai_client
+from embedding_batcher import get_embedding_batcher
+from cosmos_lookup import PartitionKeyLookup
+from projections import POLICY_FIELDS, select_fields
+from query_pages import iter_query_pages, QUERY_PAGE_SIZE
+from statistics_engine import get_statistics_engine, POLICY_STATISTICS
+from typing import Iterator, List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
 import os
 
@@ -29,16 +33,18 @@ class PolicyRetriever:
         print("Initializing policy retrieval client...")
 
         # Initialize Cosmos DB client
-        self.cosmos_client = CosmosClient(COSMOS_pol_ENDPOINT, COSMOS_pol_KEY)
+        self.cosmos_client = get_cosmos_client(COSMOS_pol_ENDPOINT, COSMOS_pol_KEY)
         self.database = self.cosmos_client.get_database_client(COSMOS_pol_DATABASE_NAME)
         self.container = self.database.get_container_client(COSMOS_pol_CONTAINER_NAME)
+        self.lookup = PartitionKeyLookup(self.container, POLICY_FIELDS)
 
         # Initialize Azure OpenAI client for vector search
-        self.openai_client = AzureOpenAI(
-            azure_endpoint=AZURE_OPENAI_ENDPOINT,
-            api_key=AZURE_OPENAI_KEY,
-            api_version=AZURE_OPENAI_API_VERSION
+        self.openai_client = get_openai_client(
+            AZURE_OPENAI_ENDPOINT,
+            AZURE_OPENAI_KEY,
+            AZURE_OPENAI_API_VERSION
         )
+        self.embedder = get_embedding_batcher(self.openai_client, AZURE_OPENAI_DEPLOYMENT, AZURE_OPENAI_ENDPOINT)
 
         print("✓ Client initialized successfully\n")
 
@@ -46,19 +52,9 @@ class PolicyRetriever:
         """Retrieve all policies for a specific customer by customer_id"""
 
         try:
-            query = "SELECT * FROM c WHERE c.customer_id = @customer_id"
-            parameters = [{"name": "@customer_id", "value": customer_id}]
-
-            items = list(self.container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
-
-            # Remove embedding from response (too large and not needed for display)
-            for item in items:
-                if 'embedding' in item:
-                    del item['embedding']
+            # Single-partition query when customer_id is the partition key;
+            # the projection keeps the embedding on the server
+            items = self.lookup.get_all('customer_id', customer_id)
 
             return items
 
@@ -70,20 +66,10 @@ class PolicyRetriever:
         """Retrieve complete policy details by policy_id"""
 
         try:
-            query = "SELECT * FROM c WHERE c.policy_id = @policy_id"
-            parameters = [{"name": "@policy_id", "value": policy_id}]
-
-            items = list(self.container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
+            # Single-partition projected query when policy_id is the partition key
+            policy = self.lookup.get_one('policy_id', policy_id)
 
-            if items:
-                policy = items[0]
-                # Remove embedding from response
-                if 'embedding' in policy:
-                    del policy['embedding']
+            if policy:
                 return policy
             else:
                 return None
@@ -95,16 +81,22 @@ class PolicyRetriever:
     def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding vector for search query"""
 
+        # Cached queries return immediately; concurrent calls share one request
         try:
-            response = self.openai_client.embeddings.create(
-                input=text,
-                model=AZURE_OPENAI_DEPLOYMENT
-            )
-            return response.data[0].embedding
+            return self.embedder.embed(text)
         except Exception as e:
             print(f"Error generating embedding: {e}")
             raise
 
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embedding vectors for many texts in as few requests as possible"""
+
+        try:
+            return self.embedder.embed_many(texts)
+        except Exception as e:
+            print(f"Error generating embeddings: {e}")
+            raise
+
     def vector_search(self, query_text: str, top_k: int = 5) -> List[Dict[str, Any]]:
         """Search for similar policies using vector search"""
 
@@ -165,39 +157,9 @@ class PolicyRetriever:
         """Search policies by various criteria"""
 
         try:
-            conditions = []
-            parameters = []
-
-            if policy_type:
-                conditions.append("c.policy_type = @policy_type")
-                parameters.append({"name": "@policy_type", "value": policy_type})
-
-            if status:
-                conditions.append("c.status = @status")
-                parameters.append({"name": "@status", "value": status})
-
-            if min_premium is not None:
-                conditions.append("c.annual_premium >= @min_premium")
-                parameters.append({"name": "@min_premium", "value": min_premium})
-
-            if max_premium is not None:
-                conditions.append("c.annual_premium <= @max_premium")
-                parameters.append({"name": "@max_premium", "value": max_premium})
-
-            if min_coverage is not None:
-                conditions.append("c.coverage_amount >= @min_coverage")
-                parameters.append({"name": "@min_coverage", "value": min_coverage})
-
-            if payment_frequency:
-                conditions.append("c.payment_frequency = @payment_frequency")
-                parameters.append({"name": "@payment_frequency", "value": payment_frequency})
-
-            if auto_renew is not None:
-                conditions.append("c.auto_renew = @auto_renew")
-                parameters.append({"name": "@auto_renew", "value": auto_renew})
-
-            where_clause = " AND ".join(conditions) if conditions else "1=1"
-            query = f"SELECT * FROM c WHERE {where_clause}"
+            query, parameters = self._criteria_query(
+                policy_type, status, min_premium, max_premium, min_coverage, payment_frequency, auto_renew
+            )
 
             results = list(self.container.query_items(
                 query=query,
@@ -205,67 +167,96 @@ class PolicyRetriever:
                 enable_cross_partition_query=True
             ))
 
-            # Remove embeddings from results
-            for result in results:
-                if 'embedding' in result:
-                    del result['embedding']
-
             return results
 
         except Exception as e:
             print(f"Error searching by criteria: {e}")
             return []
 
-    def get_policy_statistics(self) -> Dict[str, Any]:
-        """Get basic statistics about policies in the database"""
+    def search_by_criteria_pages(
+            self,
+            policy_type: Optional[str] = None,
+            status: Optional[str] = None,
+            min_premium: Optional[float] = None,
+            max_premium: Optional[float] = None,
+            min_coverage: Optional[int] = None,
+            payment_frequency: Optional[str] = None,
+            auto_renew: Optional[bool] = None,
+            page_size: int = QUERY_PAGE_SIZE,
+            continuation_token: Optional[str] = None
+    ) -> Iterator[Tuple[List[Dict[str, Any]], Optional[str]]]:
+        """
+        search_by_criteria one page at a time, so broad filters stream with
+        bounded memory
+
+        Args:
+            (criteria): Same filters as search_by_criteria
+            page_size: Policies per page (max_item_count)
+            continuation_token: Token yielded with an earlier page, to resume after it
+
+        Yields:
+            (policies, continuation token after them); query errors are
+            raised so the caller can resume from the last token
+        """
+        query, parameters = self._criteria_query(
+            policy_type, status, min_premium, max_premium, min_coverage, payment_frequency, auto_renew
+        )
+        yield from iter_query_pages(self.container, query, parameters, page_size, continuation_token)
 
-        try:
-            stats = {}
+    @staticmethod
+    def _criteria_query(
+            policy_type: Optional[str] = None,
+            status: Optional[str] = None,
+            min_premium: Optional[float] = None,
+            max_premium: Optional[float] = None,
+            min_coverage: Optional[int] = None,
+            payment_frequency: Optional[str] = None,
+            auto_renew: Optional[bool] = None
+    ):
+        """Build the search_by_criteria query and parameters"""
 
-            # Total count
-            count_query = "SELECT VALUE COUNT(1) FROM c"
-            stats['total_policies'] = list(self.container.query_items(
-                query=count_query,
-                enable_cross_partition_query=True
-            ))[0]
+        conditions = []
+        parameters = []
 
-            # Average premium
-            avg_premium_query = "SELECT VALUE AVG(c.annual_premium) FROM c"
-            stats['average_premium'] = round(list(self.container.query_items(
-                query=avg_premium_query,
-                enable_cross_partition_query=True
-            ))[0], 2)
+        if policy_type:
+            conditions.append("c.policy_type = @policy_type")
+            parameters.append({"name": "@policy_type", "value": policy_type})
 
-            # Average coverage
-            avg_coverage_query = "SELECT VALUE AVG(c.coverage_amount) FROM c"
-            stats['average_coverage'] = round(list(self.container.query_items(
-                query=avg_coverage_query,
-                enable_cross_partition_query=True
-            ))[0], 2)
+        if status:
+            conditions.append("c.status = @status")
+            parameters.append({"name": "@status", "value": status})
 
-            # Policy type distribution
-            type_query = """
-                SELECT c.policy_type as type, COUNT(1) as count
-                FROM c
-                GROUP BY c.policy_type
-            """
-            stats['type_distribution'] = list(self.container.query_items(
-                query=type_query,
-                enable_cross_partition_query=True
-            ))
+        if min_premium is not None:
+            conditions.append("c.annual_premium >= @min_premium")
+            parameters.append({"name": "@min_premium", "value": min_premium})
 
-            # Status distribution
-            status_query = """
-                SELECT c.status as status, COUNT(1) as count
-                FROM c
-                GROUP BY c.status
-            """
-            stats['status_distribution'] = list(self.container.query_items(
-                query=status_query,
-                enable_cross_partition_query=True
-            ))
+        if max_premium is not None:
+            conditions.append("c.annual_premium <= @max_premium")
+            parameters.append({"name": "@max_premium", "value": max_premium})
 
-            return stats
+        if min_coverage is not None:
+            conditions.append("c.coverage_amount >= @min_coverage")
+            parameters.append({"name": "@min_coverage", "value": min_coverage})
+
+        if payment_frequency:
+            conditions.append("c.payment_frequency = @payment_frequency")
+            parameters.append({"name": "@payment_frequency", "value": payment_frequency})
+
+        if auto_renew is not None:
+            conditions.append("c.auto_renew = @auto_renew")
+            parameters.append({"name": "@auto_renew", "value": auto_renew})
+
+        where_clause = " AND ".join(conditions) if conditions else "1=1"
+        # Project every field except the embedding so vectors never leave Cosmos
+        query = f"SELECT {select_fields(POLICY_FIELDS)} FROM c WHERE {where_clause}"
+        return query, parameters
+
+    def get_policy_statistics(self) -> Dict[str, Any]:
+        """Get basic statistics about policies in the database (plus percentiles and histograms)"""
+
+        try:
+            # One shared snapshot from a single scan, kept current by the change feed
+            return get_statistics_engine("COSMOS_pol", self.container, POLICY_STATISTICS).statistics()
 
         except Exception as e:
             print(f"Error getting statistics: {e}")
@@ -529,7 +520,9 @@ def main():
                     auto_renew = False
 
                 print("\nSearching...")
-                results = retriever.search_by_criteria(
+                # Stream the matches page by page; only the ones shown are kept
+                results, total = [], 0
+                for page, _ in retriever.search_by_criteria_pages(
                     policy_type=policy_type,
                     status=status,
                     min_premium=min_premium,
@@ -537,23 +530,27 @@ def main():
                     min_coverage=min_coverage,
                     payment_frequency=payment_freq,
                     auto_renew=auto_renew
-                )
+                ):
+                    total += len(page)
+                    results.extend(page[:10 - len(results)])
 
                 if results:
-                    print(f"\n✓ Found {len(results)} policies matching criteria:\n")
-                    for i, policy in enumerate(results[:10], 1):
+                    print(f"\n✓ Found {total} policies matching criteria:\n")
+                    for i, policy in enumerate(results, 1):
                         print(f"{i}. {policy['policy_type']} - {policy['policy_number']} ({policy['status']})")
                         print(f"   Customer: {policy['customer_id']}")
                         print(f"   Premium: ${policy['annual_premium']:,.2f} | Coverage: ${policy['coverage_amount']:,}")
                         print()
 
-                    if len(results) > 10:
-                        print(f"... and {len(results) - 10} more results")
+                    if total > 10:
+                        print(f"... and {total - 10} more results")
                 else:
                     print("❌ No policies match the criteria")
 
             except ValueError:
                 print("❌ Invalid input for numeric fields")
+            except Exception as e:
+                print(f"❌ Error searching by criteria: {e}")
 
         elif choice == "5":
             # Statistics
@@ -567,6 +564,8 @@ def main():
                 print(f"\nTotal Policies: {stats.get('total_policies', 0):,}")
                 print(f"Average Premium: ${stats.get('average_premium', 0):,.2f}")
                 print(f"Average Coverage: ${stats.get('average_coverage', 0):,.2f}")
+                print(f"Median Premium: ${stats.get('premium_percentiles', {}).get('p50', 0):,.2f}")
+                print(f"Median Coverage: ${stats.get('coverage_percentiles', {}).get('p50', 0):,.2f}")
 
                 print("\nPolicy Type Distribution:")
                 for ptype in stats.get('type_distribution', []):
@@ -0,0 +1,112 @@
+"""
+projections.py - Server-side field projections for customer and policy documents
+Lists every document field except the embedding, so queries never transfer
+the 3072-float vector only for the client to throw it away
+"""
+
+import os
+from typing import List
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _extra_fields(env_var: str) -> List[str]:
+    """Comma-separated extra fields from the environment (for schema additions)"""
+    return [field.strip() for field in os.getenv(env_var, "").split(",") if field.strip()]
+
+
+# Cosmos DB system properties kept for display/debugging (see print_policy_details)
+SYSTEM_FIELDS = ["_rid", "_self", "_etag", "_attachments", "_ts"]
+
+CUSTOMER_FIELDS = [
+    "id",
+    "customer_id",
+    "first_name",
+    "last_name",
+    "email",
+    "phone",
+    "date_of_birth",
+    "ssn",
+    "marital_status",
+    "address",
+    "occupation",
+    "annual_income",
+    "credit_score",
+    "metadata",
+    "created_date",
+    "created_timestamp"
+] + SYSTEM_FIELDS + _extra_fields("CUSTOMER_PROJECTION_EXTRA_FIELDS")
+
+POLICY_FIELDS = [
+    "id",
+    "policy_id",
+    "customer_id",
+    "policy_number",
+    "policy_type",
+    "status",
+    "annual_premium",
+    "coverage_amount",
+    "deductible",
+    "discount_applied",
+    "payment_frequency",
+    "auto_renew",
+    "start_date",
+    "end_date",
+    "term_months",
+    "agent_id",
+    "metadata",
+    "created_date",
+    "created_timestamp"
+] + SYSTEM_FIELDS + _extra_fields("POLICY_PROJECTION_EXTRA_FIELDS")
+
+
+# Fields returned by semantic/hybrid search results (same list as the
+# VectorDistance queries, so local search backends return identical shapes)
+CUSTOMER_SEARCH_FIELDS = [
+    "customer_id",
+    "first_name",
+    "last_name",
+    "email",
+    "phone",
+    "occupation",
+    "annual_income",
+    "credit_score",
+    "marital_status",
+    "address",
+    "metadata"
+]
+
+POLICY_SEARCH_FIELDS = [
+    "policy_id",
+    "customer_id",
+    "policy_number",
+    "policy_type",
+    "status",
+    "annual_premium",
+    "coverage_amount",
+    "deductible",
+    "payment_frequency",
+    "start_date",
+    "end_date",
+    "term_months",
+    "auto_renew",
+    "agent_id",
+    "metadata"
+]
+
+
+def select_fields(fields: List[str], alias: str = "c") -> str:
+    """
+    Build the SELECT list for a projection
+
+    Args:
+        fields: Top-level document fields to return
+        alias: Container alias used in the query
+
+    Returns:
+        e.g. "c.customer_id, c.first_name, ..." (fields missing from a
+        document are simply omitted from that result, as with SELECT *)
+    """
+    return ", ".join(f"{alias}.{field}" for field in fields)
@@ -0,0 +1,342 @@
+"""
+prompt_builder.py - Token-budgeted churn analysis prompts and per-call token usage
+Builds analyze_churn_node's prompts as compact one-line records and a policy
+type table instead of prose, counts their tokens (tiktoken when installed,
+else ~4 characters per token) and keeps them within PROMPT_TOKEN_BUDGET by
+folding the smallest policy types of a large portfolio into an "other" row.
+Prompt and completion tokens of every LLM call are recorded to a JSONL log
+"""
+
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+load_dotenv()
+
+# Configuration
+# Maximum tokens of the system and analysis prompts together
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "600"))
+# Set LLM_USAGE_LOG_PATH to an empty string to keep usage totals in memory only
+LLM_USAGE_LOG_PATH = os.getenv(
+    "LLM_USAGE_LOG_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "llm_usage.jsonl")
+)
+
+# Tokens the chat format adds per message
+MESSAGE_OVERHEAD_TOKENS = 4
+# Bump when build_churn_prompt's record layout changes, so cached narratives are regenerated
+PROMPT_FORMAT_VERSION = 1
+
+SYSTEM_PROMPT = (
+    "You are an expert insurance retention analyst. Predict the customer's churn risk from the data "
+    "and give specific, actionable recommendations in a professional, conversational tone for an "
+    "insurance manager. If the customer profile is limited, focus on policy behavior patterns."
+)
+
+INSTRUCTIONS = (
+    "Provide: 1) overall churn risk (Low/Medium/High/Critical) with confidence; 2) key risk factors; "
+    "3) protective factors; 4) specific actionable recommendations; 5) next steps for customer outreach."
+)
+
+
+# ============================================================================
+# TOKEN COUNTING
+# ============================================================================
+
+@lru_cache(maxsize=16)
+def _encoding(model: str):
+    """tiktoken encoding of a model, or None when it cannot be loaded (cached, so a failed download is not retried)"""
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"⚠️  tiktoken encoding for {model} unavailable, estimating tokens from length: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """Tokens of text for a chat model (estimated from its length without a tiktoken encoding)"""
+    if not text:
+        return 0
+    encoding = _encoding(model) if tiktoken is not None else None
+    if encoding is not None:
+        try:
+            return len(encoding.encode(text))
+        except Exception:
+            pass
+    return max(1, round(len(text) / 4))
+
+
+def count_message_tokens(messages: List[Any], model: str = "gpt-4o-mini") -> int:
+    """Tokens of a chat message list (LangChain messages or strings)"""
+    return sum(
+        count_tokens(str(getattr(message, "content", message)), model) + MESSAGE_OVERHEAD_TOKENS
+        for message in messages
+    )
+
+
+# ============================================================================
+# CHURN PROMPT
+# ============================================================================
+
+def _policy_type_rows(policy_data: List[Dict[str, Any]]) -> List[Tuple[str, Dict[str, int]]]:
+    """Per policy type status counts, largest types first"""
+    policy_types: Dict[str, Dict[str, int]] = {}
+    for policy in policy_data:
+        counts = policy_types.setdefault(policy.get('policy_type') or 'Unknown', {'active': 0, 'cancelled': 0, 'expired': 0})
+        status = str(policy.get('status') or 'Unknown').lower()
+        counts[status] = counts.get(status, 0) + 1
+    return sorted(policy_types.items(), key=lambda item: -sum(item[1].values()))
+
+
+def _type_table(rows: List[Tuple[str, Dict[str, int]]], keep: int) -> str:
+    """Table of the first `keep` policy types, the rest folded into one 'other' row"""
+    lines = ["BY TYPE (active/cancelled/expired):"]
+    for ptype, counts in rows[:keep]:
+        lines.append(f"{ptype} {counts.get('active', 0)}/{counts.get('cancelled', 0)}/{counts.get('expired', 0)}")
+    rest = rows[keep:]
+    if rest:
+        totals = [sum(counts.get(status, 0) for _, counts in rest) for status in ('active', 'cancelled', 'expired')]
+        lines.append(f"other ({len(rest)} types) {totals[0]}/{totals[1]}/{totals[2]}")
+    return "\n".join(lines)
+
+
+def _whole_months(months: Any) -> int:
+    """Months rounded down, so a time-derived value only changes once a month"""
+    return int(float(months or 0))
+
+
+def narrative_inputs(
+    customer_data: Dict[str, Any],
+    policy_data: List[Dict[str, Any]],
+    analysis: Dict[str, Any],
+    age: int,
+    has_customer_profile: bool = True,
+    budget: int = PROMPT_TOKEN_BUDGET
+) -> Dict[str, Any]:
+    """
+    Everything a churn prompt is rendered from, at the precision it is shown
+
+    Tenure and average policy duration grow with the clock, so they are kept
+    in whole months: the result only changes when the customer does (or a
+    month boundary passes), which makes it the narrative cache key's input
+    (narrative_cache.fingerprint) as well as build_churn_prompt's.
+
+    Args:
+        customer_data: Customer profile document
+        policy_data: The customer's policies
+        analysis: Output of ChurnPredictionAgent._calculate_churn_factors
+        age: Customer age in years
+        has_customer_profile: False when only policy data is available
+        budget: Maximum prompt tokens (system and analysis prompts together)
+    """
+    metadata = customer_data.get('metadata') or {}
+    if has_customer_profile:
+        profile = {
+            'first_name': customer_data.get('first_name', 'Unknown'),
+            'last_name': customer_data.get('last_name', 'Customer'),
+            'age': age,
+            'occupation': customer_data.get('occupation', 'Not specified'),
+            'annual_income': customer_data.get('annual_income', 0) or 0,
+            'credit_score': customer_data.get('credit_score', 0),
+            'segment': metadata.get('customer_segment', 'Not classified')
+        }
+    else:
+        profile = {'customer_id': customer_data.get('customer_id', 'Unknown')}
+
+    factors = {
+        'total_policies': analysis['total_policies'],
+        'active_policies': analysis['active_policies'],
+        'cancelled_policies': analysis['cancelled_policies'],
+        'expired_policies': analysis['expired_policies'],
+        'total_premium': round(float(analysis['total_premium']), 2),
+        'avg_policy_duration_months': _whole_months(analysis['avg_policy_duration']),
+        'cancellation_rate': round(float(analysis['cancellation_rate']), 3),
+        'recent_cancellations': analysis['recent_cancellations'],
+        'payment_issues': analysis['payment_issues'],
+        'policy_diversity': analysis['policy_diversity'],
+        'tenure_months': _whole_months(analysis['customer_tenure_months'])
+    }
+
+    return {
+        'format': PROMPT_FORMAT_VERSION,
+        'system': SYSTEM_PROMPT,
+        'instructions': INSTRUCTIONS,
+        'budget': budget,
+        'has_customer_profile': has_customer_profile,
+        'profile': profile,
+        'factors': factors,
+        'policy_types': _policy_type_rows(policy_data)
+    }
+
+
+def build_churn_prompt(inputs: Dict[str, Any], model: str = "gpt-4o-mini") -> Tuple[str, str, int]:
+    """
+    Build the churn analysis prompts within a token budget
+
+    Args:
+        inputs: Output of narrative_inputs
+        model: Chat model, for token counting
+
+    Returns:
+        (system prompt, analysis prompt, prompt tokens)
+    """
+    profile, factors = inputs['profile'], inputs['factors']
+    if inputs['has_customer_profile']:
+        customer = (
+            f"CUSTOMER: {profile['first_name']} {profile['last_name']}"
+            f" | age {profile['age']} | {profile['occupation']}"
+            f" | income ${profile['annual_income']:,} | credit {profile['credit_score']}"
+            f" | segment {profile['segment']}"
+        )
+    else:
+        customer = (
+            f"CUSTOMER: ID {profile['customer_id']}"
+            f" (profile unavailable; base the analysis on policy behavior)"
+        )
+
+    summary = (
+        f"POLICIES: total {factors['total_policies']} | active {factors['active_policies']}"
+        f" | cancelled {factors['cancelled_policies']} | expired {factors['expired_policies']}"
+        f" | active annual premium ${factors['total_premium']:,.2f}"
+        f" | avg duration {factors['avg_policy_duration_months']} mo\n"
+        f"INDICATORS: cancellation rate {factors['cancellation_rate']:.1%}"
+        f" | cancellations last 12 mo {factors['recent_cancellations']}"
+        f" | no auto-renew {factors['payment_issues']} | policy types {factors['policy_diversity']}"
+        f" | tenure {factors['tenure_months']} mo"
+    )
+
+    def render(table: Optional[str]) -> Tuple[str, int]:
+        prompt = "\n".join(part for part in [customer, summary, table, INSTRUCTIONS] if part)
+        return prompt, count_message_tokens([SYSTEM_PROMPT, prompt], model)
+
+    # Fold the smallest policy types into 'other' until the prompt fits
+    rows = inputs['policy_types']
+    for keep in range(len(rows), -1, -1):
+        prompt, tokens = render(_type_table(rows, keep) if rows else None)
+        if tokens <= inputs['budget']:
+            return SYSTEM_PROMPT, prompt, tokens
+
+    # Even the one-row table does not fit: leave the breakdown out
+    prompt, tokens = render(None)
+    return SYSTEM_PROMPT, prompt, tokens
+
+
+# ============================================================================
+# USAGE RECORDING
+# ============================================================================
+
+class UsageRecorder:
+    """Per-call prompt and completion token usage, totalled in memory and appended to a JSONL log"""
+
+    def __init__(self, path: Optional[str] = LLM_USAGE_LOG_PATH):
+        """
+        Args:
+            path: JSONL log file (None or "" for in-memory totals only)
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+    def record(
+        self,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        seconds: float,
+        customer_id: Optional[str] = None,
+        streamed: bool = False
+    ):
+        """Record one LLM call"""
+        entry = {
+            'timestamp': datetime.now().isoformat(),
+            'customer_id': customer_id,
+            'model': model,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'seconds': round(seconds, 3),
+            'streamed': streamed
+        }
+
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+            if self.path:
+                try:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(entry) + "\n")
+                except OSError as e:
+                    print(f"⚠️  LLM usage log write failed: {e}")
+
+    def record_response(
+        self,
+        model: str,
+        prompt_tokens: int,
+        completion: str,
+        started: float,
+        usage: Optional[Dict[str, Any]] = None,
+        customer_id: Optional[str] = None,
+        streamed: bool = False
+    ):
+        """
+        Record a call from its reported usage (LangChain usage_metadata), else
+        from the counted prompt tokens and the completion text
+
+        Args:
+            started: time.monotonic() when the call was made
+        """
+        usage = usage or {}
+        self.record(
+            model,
+            usage.get('input_tokens') or prompt_tokens,
+            usage.get('output_tokens') or count_tokens(completion, model),
+            time.monotonic() - started,
+            customer_id,
+            streamed
+        )
+
+    def totals(self) -> Dict[str, Any]:
+        """Token totals for monitoring"""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'prompt_tokens': self.prompt_tokens,
+                'completion_tokens': self.completion_tokens,
+                'average_prompt_tokens': round(self.prompt_tokens / self.calls, 1) if self.calls else 0.0
+            }
+
+
+_shared_recorder: Optional[UsageRecorder] = None
+_shared_recorder_lock = threading.Lock()
+
+
+def get_usage_recorder() -> UsageRecorder:
+    """Return the process-wide usage recorder, creating it on first use"""
+    global _shared_recorder
+    if _shared_recorder is None:
+        with _shared_recorder_lock:
+            if _shared_recorder is None:
+                _shared_recorder = UsageRecorder()
+    return _shared_recorder
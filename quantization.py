@@ -0,0 +1,408 @@
+"""
+quantization.py - Compressed embeddings (int8 scalar / product quantization) for local search
+Scores queries against compact codes held in memory, then re-ranks the best
+candidates with the exact float vectors of the memory-mapped store, so only
+those rows are read from disk. 3072-dim float32 vectors are 12 KB each; int8
+codes are 4x smaller and PQ codes 32x smaller with the default settings
+
+Enable for an exact store with VECTOR_QUANTIZATION=int8 or pq, then check
+recall@5 against the exact store (and optionally Cosmos DB):
+    python quantization.py .cache/customers.exact.json --kind pq
+    python quantization.py .cache/customers.exact.json --kind pq --cosmos COSMOS_ret
+"""
+
+import os
+import argparse
+from typing import List, Dict, Any
+
+import numpy as np
+from dotenv import load_dotenv
+
+from exact_vector_store import ExactVectorStore, EXACT_SEARCH_BLOCK_ROWS
+
+load_dotenv()
+
+# Configuration
+# none, int8 (scalar, 4x smaller) or pq (product quantization, 16-128x smaller);
+# applies to exact (.json) stores, IVF indexes keep full-precision vectors
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none").lower()
+# Candidates re-scored with the float vectors (0 = return the approximate ranking)
+QUANTIZED_RERANK_CANDIDATES = int(os.getenv("QUANTIZED_RERANK_CANDIDATES", "100"))
+# PQ subspaces (0 = dimension / 8, i.e. one byte per 8 floats)
+PQ_SUBSPACES = int(os.getenv("PQ_SUBSPACES", "0"))
+PQ_KMEANS_ITERATIONS = int(os.getenv("PQ_KMEANS_ITERATIONS", "15"))
+# Vectors sampled to train the quantizer
+QUANTIZATION_TRAINING_SAMPLE = int(os.getenv("QUANTIZATION_TRAINING_SAMPLE", "20000"))
+# Largest acceptable drop in recall@5 versus the reference ranking
+QUANTIZED_RECALL_TOLERANCE = float(os.getenv("QUANTIZED_RECALL_TOLERANCE", "0.02"))
+
+
+# ============================================================================
+# QUANTIZERS
+# ============================================================================
+
+class ScalarQuantizer:
+    """
+    8-bit scalar quantization: each dimension mapped linearly onto 0-255
+
+    A vector is decoded as offset + codes * scale, so a query's inner product
+    with every code row is codes @ (scale * query) + offset @ query.
+    """
+
+    kind = "int8"
+
+    def __init__(self, offset: np.ndarray, scale: np.ndarray):
+        self.offset = offset.astype(np.float32)
+        self.scale = scale.astype(np.float32)
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, **kwargs) -> "ScalarQuantizer":
+        """Per-dimension range of the training vectors"""
+        low = vectors.min(axis=0)
+        high = vectors.max(axis=0)
+        scale = (high - low) / 255.0
+        scale[scale == 0] = 1.0
+        return cls(low, scale)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((np.asarray(vectors, dtype=np.float32) - self.offset) / self.scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def scores(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Approximate inner product of the query with every code row"""
+        weights = self.scale * query
+        bias = float(self.offset @ query)
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), EXACT_SEARCH_BLOCK_ROWS):
+            block = codes[start:start + EXACT_SEARCH_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ weights + bias
+        return scores
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {"offset": self.offset, "scale": self.scale}
+
+    @classmethod
+    def from_arrays(cls, arrays) -> "ScalarQuantizer":
+        return cls(arrays["offset"], arrays["scale"])
+
+
+class ProductQuantizer:
+    """
+    Product quantization: the vector is split into m subvectors, each
+    replaced by the index of its nearest of 256 k-means centroids (one byte)
+
+    A query is scored with a lookup table of its inner product with every
+    centroid of every subspace, summed over the m codes of each row.
+    """
+
+    kind = "pq"
+
+    def __init__(self, centroids: np.ndarray):
+        """
+        Args:
+            centroids: (m, 256, dimension / m) subspace centroids
+        """
+        self.centroids = centroids.astype(np.float32)
+
+    @property
+    def subspaces(self) -> int:
+        return self.centroids.shape[0]
+
+    @classmethod
+    def train(
+        cls,
+        vectors: np.ndarray,
+        subspaces: int = PQ_SUBSPACES,
+        iterations: int = PQ_KMEANS_ITERATIONS,
+        seed: int = 0
+    ) -> "ProductQuantizer":
+        """
+        Train 256 centroids per subspace with k-means
+
+        Args:
+            vectors: Training vectors (n, dimension)
+            subspaces: Number of subvectors (0 = dimension / 8); must divide the dimension
+            iterations: k-means iterations per subspace
+            seed: Random seed for initialization
+        """
+        count, dimension = vectors.shape
+        if subspaces <= 0:
+            subspaces = max(1, dimension // 8)
+        if dimension % subspaces:
+            raise ValueError(f"PQ subspaces ({subspaces}) must divide the embedding dimension ({dimension})")
+
+        rng = np.random.default_rng(seed)
+        clusters = min(256, count)
+        sub_dimension = dimension // subspaces
+        centroids = np.zeros((subspaces, 256, sub_dimension), dtype=np.float32)
+
+        for subspace in range(subspaces):
+            data = vectors[:, subspace * sub_dimension:(subspace + 1) * sub_dimension]
+            book = data[rng.choice(count, clusters, replace=False)].copy()
+            for _ in range(iterations):
+                labels = _nearest(data, book)
+                for cluster in range(clusters):
+                    members = data[labels == cluster]
+                    if len(members):
+                        book[cluster] = members.mean(axis=0)
+            centroids[subspace, :clusters] = book
+            # Unused slots (tiny corpora) repeat the first centroid and are never chosen first
+            centroids[subspace, clusters:] = book[0]
+
+        return cls(centroids)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        sub_dimension = self.centroids.shape[2]
+        codes = np.empty((len(vectors), self.subspaces), dtype=np.uint8)
+        for subspace in range(self.subspaces):
+            data = vectors[:, subspace * sub_dimension:(subspace + 1) * sub_dimension]
+            codes[:, subspace] = _nearest(data, self.centroids[subspace])
+        return codes
+
+    def scores(self, query: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Approximate inner product of the query with every code row"""
+        table = np.einsum("mkd,md->mk", self.centroids, query.reshape(self.subspaces, -1))
+        columns = np.arange(self.subspaces)
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), EXACT_SEARCH_BLOCK_ROWS):
+            block = codes[start:start + EXACT_SEARCH_BLOCK_ROWS]
+            scores[start:start + len(block)] = table[columns, block].sum(axis=1)
+        return scores
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {"centroids": self.centroids}
+
+    @classmethod
+    def from_arrays(cls, arrays) -> "ProductQuantizer":
+        return cls(arrays["centroids"])
+
+
+QUANTIZERS = {ScalarQuantizer.kind: ScalarQuantizer, ProductQuantizer.kind: ProductQuantizer}
+
+
+def _nearest(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid (Euclidean) for every row"""
+    distances = (centroids ** 2).sum(axis=1) - 2 * data @ centroids.T
+    return np.argmin(distances, axis=1)
+
+
+# ============================================================================
+# QUANTIZED STORE
+# ============================================================================
+
+class QuantizedVectorStore(ExactVectorStore):
+    """
+    ExactVectorStore that ranks with in-memory codes and re-ranks with floats
+
+    The float matrix stays memory-mapped: only the rows of the re-ranked
+    candidates are read, so the resident set is the codes plus those pages.
+    Codes are cached next to the manifest (<stem>.<kind>.npz) and re-encoded
+    with the same quantizer when a new generation of the store is written.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        kind: str = VECTOR_QUANTIZATION,
+        rerank: int = QUANTIZED_RERANK_CANDIDATES
+    ):
+        """
+        Args:
+            path: Manifest of the exact store
+            kind: 'int8' or 'pq'
+            rerank: Candidates re-scored exactly (0 = approximate ranking only)
+        """
+        if kind not in QUANTIZERS:
+            raise ValueError(f"Unknown quantization '{kind}' (use {' or '.join(QUANTIZERS)})")
+        self.kind = kind
+        self.rerank = rerank
+        self.quantizer = None
+        self.codes = np.empty((0, 0), dtype=np.uint8)
+        super().__init__(path)
+
+    @property
+    def codes_path(self) -> str:
+        stem = os.path.splitext(self.path)[0]
+        return f"{stem}.{self.kind}.npz"
+
+    @property
+    def nbytes(self) -> int:
+        """Resident size of the codes (the float matrix is only paged in for re-ranking)"""
+        return int(self.codes.nbytes)
+
+    def _open(self):
+        super()._open()
+        self._load_codes()
+
+    def _load_codes(self):
+        """Load cached codes for this generation, or encode (and train if needed)"""
+        generation = os.path.basename(self.vectors.filename)
+        cached_generation = None
+        try:
+            with np.load(self.codes_path, allow_pickle=False) as data:
+                self.quantizer = QUANTIZERS[self.kind].from_arrays(data)
+                cached_generation = str(data["generation"])
+                if cached_generation == generation:
+                    self.codes = data["codes"]
+                    return
+        except (OSError, KeyError, ValueError):
+            pass
+
+        if self.quantizer is None or cached_generation is None:
+            rng = np.random.default_rng(0)
+            sample_size = min(len(self.vectors), QUANTIZATION_TRAINING_SAMPLE)
+            rows = np.sort(rng.choice(len(self.vectors), sample_size, replace=False))
+            print(f"Training {self.kind} quantizer on {sample_size} vectors...")
+            self.quantizer = QUANTIZERS[self.kind].train(self.vectors[rows].astype(np.float32))
+
+        codes = [
+            self.quantizer.encode(self.vectors[start:start + EXACT_SEARCH_BLOCK_ROWS])
+            for start in range(0, len(self.vectors), EXACT_SEARCH_BLOCK_ROWS)
+        ]
+        self.codes = np.concatenate(codes) if codes else np.empty((0, 0), dtype=np.uint8)
+
+        tmp_path = self.codes_path + ".tmp.npz"
+        np.savez(tmp_path, codes=self.codes, generation=np.array(generation), **self.quantizer.to_arrays())
+        os.replace(tmp_path, self.codes_path)
+
+    def _matrix_scores(self, query: np.ndarray) -> np.ndarray:
+        """Approximate scores for every row, exact for the re-ranked candidates"""
+        scores = self.quantizer.scores(query, self.codes)
+        if self.rerank <= 0:
+            return scores
+
+        scores[~self.alive] = -np.inf
+        k = min(self.rerank, len(scores))
+        if k == 0:
+            return scores
+        # Sorted rows keep the memory-mapped reads sequential
+        candidates = np.sort(np.argpartition(-scores, k - 1)[:k])
+        exact = np.full(len(scores), -np.inf, dtype=np.float32)
+        exact[candidates] = self.vectors[candidates].astype(np.float32) @ query
+        return exact
+
+
+# ============================================================================
+# RECALL MEASUREMENT
+# ============================================================================
+
+def _sample_queries(store: ExactVectorStore, count: int, seed: int = 0) -> np.ndarray:
+    """Synthetic queries: normalized midpoints of random pairs of stored vectors"""
+    rng = np.random.default_rng(seed)
+    rows = np.nonzero(store.alive)[0]
+    pairs = rng.choice(rows, (count, 2))
+    queries = (store.vectors[pairs[:, 0]].astype(np.float32) + store.vectors[pairs[:, 1]].astype(np.float32)) / 2
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def _cosmos_top_ids(container, id_field: str, query: np.ndarray, top_k: int) -> List[str]:
+    """Ids of the top_k documents by VectorDistance (the current Cosmos DB ranking)"""
+    sql = f"""
+    SELECT TOP @top_k c.{id_field}
+    FROM c
+    ORDER BY VectorDistance(c.embedding, @embedding)
+    """
+    parameters = [
+        {"name": "@top_k", "value": top_k},
+        {"name": "@embedding", "value": query.tolist()}
+    ]
+    items = container.query_items(query=sql, parameters=parameters, enable_cross_partition_query=True)
+    return [str(item[id_field]) for item in items]
+
+
+def measure_recall(
+    path: str,
+    kind: str,
+    queries: int = 50,
+    top_k: int = 5,
+    rerank: int = QUANTIZED_RERANK_CANDIDATES,
+    container=None
+) -> Dict[str, Any]:
+    """
+    Recall@k of a quantized store against exact search (and Cosmos DB)
+
+    Args:
+        path: Manifest of the exact store
+        kind: 'int8' or 'pq'
+        queries: Number of synthetic queries
+        top_k: k of recall@k
+        rerank: Candidates re-scored exactly
+        container: Optional Cosmos DB container to compare with VectorDistance
+
+    Returns:
+        Memory figures and recall values
+    """
+    exact = ExactVectorStore(path)
+    quantized = QuantizedVectorStore(path, kind, rerank)
+    sample = _sample_queries(exact, queries)
+
+    report = {
+        "kind": kind,
+        "vectors": len(exact),
+        "float_bytes": len(exact) * exact.dimension * 4,
+        "code_bytes": quantized.nbytes,
+        "recall_vs_exact": 0.0,
+        "recall_vs_cosmos": None,
+        "exact_vs_cosmos": None
+    }
+    report["compression"] = report["float_bytes"] / max(1, report["code_bytes"])
+
+    hits_exact = hits_cosmos = baseline_cosmos = 0
+    for query in sample:
+        truth = {doc_id for doc_id, _ in exact.search(query, top_k)}
+        found = {doc_id for doc_id, _ in quantized.search(query, top_k)}
+        hits_exact += len(truth & found)
+        if container is not None:
+            cosmos = set(_cosmos_top_ids(container, exact.id_field, query, top_k))
+            hits_cosmos += len(cosmos & found)
+            baseline_cosmos += len(cosmos & truth)
+
+    total = max(1, len(sample) * top_k)
+    report["recall_vs_exact"] = hits_exact / total
+    if container is not None:
+        report["recall_vs_cosmos"] = hits_cosmos / total
+        report["exact_vs_cosmos"] = baseline_cosmos / total
+    return report
+
+
+def main():
+    """Print memory and recall@k for a quantized store"""
+    parser = argparse.ArgumentParser(description="Measure memory and recall of quantized local vector search")
+    parser.add_argument("path", help="Manifest of an exact store built with exact_vector_store.py")
+    parser.add_argument("--kind", choices=list(QUANTIZERS), default="int8")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--rerank", type=int, default=QUANTIZED_RERANK_CANDIDATES)
+    parser.add_argument("--cosmos", metavar="PREFIX", help="Also compare with Cosmos DB VectorDistance, e.g. COSMOS_ret")
+    args = parser.parse_args()
+
+    container = None
+    if args.cosmos:
+        from client_registry import get_container
+        container = get_container(args.cosmos)
+
+    report = measure_recall(args.path, args.kind, args.queries, args.top_k, args.rerank, container)
+
+    print(f"\n{report['kind']} quantization of {report['vectors']} vectors")
+    print(f"   Memory: {report['float_bytes'] / 1e6:.1f} MB float32 -> {report['code_bytes'] / 1e6:.1f} MB codes "
+          f"({report['compression']:.1f}x smaller)")
+    print(f"   Recall@{args.top_k} vs exact search: {report['recall_vs_exact']:.3f}")
+
+    reference = report["recall_vs_exact"]
+    baseline = 1.0
+    if report["recall_vs_cosmos"] is not None:
+        print(f"   Recall@{args.top_k} vs Cosmos DB:    {report['recall_vs_cosmos']:.3f} "
+              f"(exact search vs Cosmos DB: {report['exact_vs_cosmos']:.3f})")
+        reference = report["recall_vs_cosmos"]
+        baseline = report["exact_vs_cosmos"]
+
+    if baseline - reference <= QUANTIZED_RECALL_TOLERANCE:
+        print(f"✓ Within tolerance ({QUANTIZED_RECALL_TOLERANCE:.3f})")
+    else:
+        print(f"⚠️  Recall drop {baseline - reference:.3f} exceeds tolerance ({QUANTIZED_RECALL_TOLERANCE:.3f}); "
+              f"raise --rerank or PQ_SUBSPACES")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+query_pages.py - Page-at-a-time Cosmos DB queries with resumable continuation tokens
+Large result sets (broad search_by_criteria filters, exports, batch scoring)
+are read max_item_count documents at a time instead of materialized with
+list(query_items(...)). Each page comes with the continuation token that
+resumes the scan right after it
+
+Export every customer or policy matching search_by_criteria filters to JSONL,
+resuming where an interrupted run stopped:
+    python query_pages.py customers customers.jsonl --criteria '{"min_credit_score": 300}'
+    python query_pages.py policies active.jsonl --criteria '{"status": "ACTIVE"}' --page-size 1000
+"""
+
+import os
+import json
+import argparse
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from change_feed_sync import load_checkpoint, save_checkpoint
+
+load_dotenv()
+
+# Configuration
+# Documents per page (the query's max_item_count)
+QUERY_PAGE_SIZE = int(os.getenv("QUERY_PAGE_SIZE", "500"))
+QUERY_EXPORT_CHECKPOINT_PATH = os.getenv(
+    "QUERY_EXPORT_CHECKPOINT_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "query_export_checkpoints.json")
+)
+
+Page = Tuple[List[Dict[str, Any]], Optional[str]]
+
+
+def iter_query_pages(
+    container,
+    query: str,
+    parameters: Optional[List[Dict[str, Any]]] = None,
+    page_size: int = QUERY_PAGE_SIZE,
+    continuation_token: Optional[str] = None,
+    partition_key: Any = None
+) -> Iterator[Page]:
+    """
+    Run a query one page at a time
+
+    Args:
+        container: Cosmos DB container client
+        query: SQL query
+        parameters: Query parameters
+        page_size: Documents per page (max_item_count)
+        continuation_token: Token yielded with an earlier page, to resume after it
+        partition_key: Scope the query to one partition (cross-partition when None)
+
+    Yields:
+        (documents of the page, continuation token after it; None after the last page)
+    """
+    kwargs = {"partition_key": partition_key} if partition_key is not None else {"enable_cross_partition_query": True}
+    pager = container.query_items(
+        query=query,
+        parameters=parameters,
+        max_item_count=page_size,
+        **kwargs
+    ).by_page(continuation_token)
+
+    for page in pager:
+        yield list(page), pager.continuation_token
+
+
+def iter_query_items(
+    container,
+    query: str,
+    parameters: Optional[List[Dict[str, Any]]] = None,
+    page_size: int = QUERY_PAGE_SIZE
+) -> Iterator[Dict[str, Any]]:
+    """Every document of a query, holding at most one page in memory"""
+    for documents, _ in iter_query_pages(container, query, parameters, page_size):
+        yield from documents
+
+
+async def aiter_query_pages(
+    container,
+    query: str,
+    parameters: Optional[List[Dict[str, Any]]] = None,
+    page_size: int = QUERY_PAGE_SIZE,
+    continuation_token: Optional[str] = None,
+    partition_key: Any = None
+) -> AsyncIterator[Page]:
+    """iter_query_pages for azure.cosmos.aio containers"""
+    kwargs = {"partition_key": partition_key} if partition_key is not None else {}
+    pager = container.query_items(
+        query=query,
+        parameters=parameters,
+        max_item_count=page_size,
+        **kwargs
+    ).by_page(continuation_token)
+
+    async for page in pager:
+        yield [document async for document in page], pager.continuation_token
+
+
+# ============================================================================
+# RESUMABLE EXPORT
+# ============================================================================
+
+def export_jsonl(
+    pages,
+    output_path: str,
+    checkpoint_name: str,
+    checkpoint_path: str = QUERY_EXPORT_CHECKPOINT_PATH,
+    overwrite: bool = False
+) -> int:
+    """
+    Append query pages to a JSONL file, checkpointing after every page
+
+    The checkpoint holds the continuation token and the file size after the
+    page, so a rerun of an interrupted export truncates any partly written
+    page and continues from the token: no document is lost or written twice.
+    A fresh export (nothing to resume) refuses to replace an existing,
+    non-empty output unless overwrite is set.
+
+    Args:
+        pages: Function(continuation_token) returning an iterator of pages,
+            e.g. lambda token: retriever.search_by_criteria_pages(continuation_token=token)
+        output_path: JSONL file to append to
+        checkpoint_name: Name of this export's resume position
+        checkpoint_path: JSON file holding resume positions
+        overwrite: Allow a fresh export to replace an existing output file
+
+    Returns:
+        Number of documents written by this run
+
+    Raises:
+        FileExistsError: output_path exists, there is nothing to resume and
+            overwrite is False
+    """
+    checkpoint = load_checkpoint(checkpoint_name, checkpoint_path) or {}
+    token, offset = checkpoint.get("token"), checkpoint.get("offset", 0)
+    size = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+    if token is None or offset > size:
+        # Nothing to resume (or the output was truncated since): a fresh export
+        if size and not overwrite:
+            raise FileExistsError(f"{output_path} already exists and there is no export to resume")
+        token, offset = None, 0
+
+    written = 0
+    with open(output_path, "a+", encoding="utf-8") as f:
+        f.truncate(offset)
+        f.seek(offset)
+        for documents, token in pages(token):
+            for document in documents:
+                f.write(json.dumps(document, default=str) + "\n")
+            f.flush()
+            written += len(documents)
+            save_checkpoint(checkpoint_name, {"token": token, "offset": f.tell()}, checkpoint_path)
+            print(f"   {written} documents exported...")
+
+    # Finished: the next run is a fresh export
+    save_checkpoint(checkpoint_name, None, checkpoint_path)
+    return written
+
+
+def main():
+    """Export customers or policies matching search_by_criteria filters to JSONL"""
+    from client_registry import get_container
+    from cust_ret import CustomerRetriever
+    from policy_retrieval import PolicyRetriever
+
+    parser = argparse.ArgumentParser(description="Resumable page-at-a-time export of search_by_criteria matches")
+    parser.add_argument("kind", choices=["customers", "policies"])
+    parser.add_argument("output", help="JSONL file to write")
+    parser.add_argument("--criteria", default="{}", help="search_by_criteria keyword arguments as JSON")
+    parser.add_argument("--page-size", type=int, default=QUERY_PAGE_SIZE)
+    parser.add_argument(
+        "--fresh", action="store_true",
+        help="Discard an interrupted export and start over, replacing an existing output file"
+    )
+    args = parser.parse_args()
+
+    criteria = json.loads(args.criteria)
+    if args.kind == "customers":
+        prefix, query, parameters = "COSMOS_ret", *CustomerRetriever._criteria_query(**criteria)
+    else:
+        prefix, query, parameters = "COSMOS_pol", *PolicyRetriever._criteria_query(**criteria)
+
+    # A token only resumes the query it came from
+    checkpoint_name = f"{args.kind}:{os.path.abspath(args.output)}:{json.dumps(criteria, sort_keys=True)}"
+    if args.fresh:
+        save_checkpoint(checkpoint_name, None, QUERY_EXPORT_CHECKPOINT_PATH)
+
+    container = get_container(prefix)
+    try:
+        written = export_jsonl(
+            lambda token: iter_query_pages(container, query, parameters, args.page_size, token),
+            args.output,
+            checkpoint_name,
+            overwrite=args.fresh
+        )
+    except FileExistsError as e:
+        parser.error(f"{e} (pass --fresh to replace it)")
+    print(f"✓ Exported {written} {args.kind} to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+statistics_engine.py - Materialized customer and policy statistics from one streaming scan
+Replaces the separate COUNT / AVG / GROUP BY queries of get_customer_statistics
+and get_policy_statistics (each a full cross-partition scan) with a single
+projected, page-at-a-time scan that computes every aggregate plus percentiles
+and histograms. The result is kept as a snapshot: inserts and updates from the
+change feed are applied incrementally, and the container is only rescanned,
+in the background while the old snapshot keeps being served, when it is older
+than STATISTICS_TTL_SECONDS (which also picks up deletes, since the change
+feed does not report them)
+
+    python statistics_engine.py customers
+    python statistics_engine.py policies --prefix COSMOS_pol_hybrid
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from projections import select_fields
+from query_pages import iter_query_items
+from change_feed_sync import start_change_feed_sync
+
+load_dotenv()
+
+# Configuration
+# Full rescan interval; between rescans the snapshot follows the change feed
+STATISTICS_TTL_SECONDS = float(os.getenv("STATISTICS_TTL_SECONDS", "3600"))
+STATISTICS_HISTOGRAM_BINS = int(os.getenv("STATISTICS_HISTOGRAM_BINS", "10"))
+STATISTICS_PERCENTILES = [
+    float(value) for value in os.getenv("STATISTICS_PERCENTILES", "25,50,75,90,99").split(",") if value.strip()
+]
+
+
+class StatisticsSpec:
+    """What to aggregate for one kind of document"""
+
+    def __init__(
+        self,
+        id_field: str,
+        count_key: str,
+        numeric_fields: List[Tuple[str, str]],
+        distributions: List[Tuple[str, str, str]]
+    ):
+        """
+        Args:
+            id_field: Document key field (e.g. 'customer_id')
+            count_key: Stats key of the document count (e.g. 'total_customers')
+            numeric_fields: (document field, stats name) pairs; each produces
+                average_<name>, <name>_percentiles and <name>_histogram
+            distributions: (stats key, label key, dotted document path)
+                triples, e.g. ('segment_distribution', 'segment', 'metadata.customer_segment')
+        """
+        self.id_field = id_field
+        self.count_key = count_key
+        self.numeric_fields = numeric_fields
+        self.distributions = distributions
+
+    def scan_fields(self) -> List[str]:
+        """Top-level fields the scan has to read"""
+        fields = ["id", self.id_field] + [field for field, _ in self.numeric_fields]
+        fields += [path.split(".")[0] for _, _, path in self.distributions]
+        return list(dict.fromkeys(fields))
+
+
+# Same keys as the original get_*_statistics queries, plus percentiles and histograms
+CUSTOMER_STATISTICS = StatisticsSpec(
+    id_field="customer_id",
+    count_key="total_customers",
+    numeric_fields=[("annual_income", "income"), ("credit_score", "credit_score")],
+    distributions=[("segment_distribution", "segment", "metadata.customer_segment")]
+)
+
+POLICY_STATISTICS = StatisticsSpec(
+    id_field="policy_id",
+    count_key="total_policies",
+    numeric_fields=[("annual_premium", "premium"), ("coverage_amount", "coverage")],
+    distributions=[("type_distribution", "type", "policy_type"), ("status_distribution", "status", "status")]
+)
+
+
+def _lookup(document: Dict[str, Any], path: str) -> Any:
+    """Value at a dotted path (None when any level is missing)"""
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _number(value: Any) -> float:
+    """Numeric value, or NaN when missing or not a number (like AVG ignoring it)"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return np.nan
+    return float(value)
+
+
+class _Aggregates:
+    """Per-document values and label counts of one scan plus the changes applied since"""
+
+    def __init__(self, spec: StatisticsSpec):
+        self.spec = spec
+        self.rows: Dict[str, int] = {}
+        self.values = np.full((1024, len(spec.numeric_fields)), np.nan)
+        self.labels: List[List[Any]] = [[] for _ in spec.distributions]
+        self.counts: List[Counter] = [Counter() for _ in spec.distributions]
+
+    def upsert(self, document: Dict[str, Any]):
+        doc_id = document.get(self.spec.id_field, document.get("id"))
+        if doc_id is None:
+            return
+        doc_id = str(doc_id)
+
+        row = self.rows.get(doc_id)
+        if row is None:
+            row = len(self.rows)
+            if row == len(self.values):
+                grown = np.full((2 * len(self.values), self.values.shape[1]), np.nan)
+                grown[:row] = self.values
+                self.values = grown
+            self.rows[doc_id] = row
+            for labels in self.labels:
+                labels.append(None)
+        else:
+            # Take the document's previous labels out of the counts
+            for labels, counts in zip(self.labels, self.counts):
+                counts[labels[row]] -= 1
+                if counts[labels[row]] <= 0:
+                    del counts[labels[row]]
+
+        self.values[row] = [_number(document.get(field)) for field, _ in self.spec.numeric_fields]
+        for (_, _, path), labels, counts in zip(self.spec.distributions, self.labels, self.counts):
+            label = _lookup(document, path)
+            labels[row] = label
+            counts[label] += 1
+
+    def materialize(self) -> Dict[str, Any]:
+        values = self.values[:len(self.rows)]
+        stats: Dict[str, Any] = {self.spec.count_key: len(self.rows)}
+
+        for column, (_, name) in enumerate(self.spec.numeric_fields):
+            present = values[:, column]
+            present = present[~np.isnan(present)]
+            stats[f"average_{name}"] = round(float(present.mean()), 2) if len(present) else 0.0
+            stats[f"{name}_percentiles"] = self._percentiles(present)
+            stats[f"{name}_histogram"] = self._histogram(present)
+
+        for (key, label_key, _), counts in zip(self.spec.distributions, self.counts):
+            stats[key] = [{label_key: label, "count": count} for label, count in counts.most_common()]
+
+        stats["as_of"] = datetime.now().isoformat()
+        return stats
+
+    @staticmethod
+    def _percentiles(values: np.ndarray) -> Dict[str, float]:
+        if not len(values):
+            return {}
+        points = np.percentile(values, STATISTICS_PERCENTILES)
+        return {f"p{percentile:g}": round(float(point), 2) for percentile, point in zip(STATISTICS_PERCENTILES, points)}
+
+    @staticmethod
+    def _histogram(values: np.ndarray) -> List[Dict[str, float]]:
+        if not len(values):
+            return []
+        counts, edges = np.histogram(values, bins=STATISTICS_HISTOGRAM_BINS)
+        return [
+            {"start": round(float(start), 2), "end": round(float(end), 2), "count": int(count)}
+            for start, end, count in zip(edges[:-1], edges[1:], counts)
+        ]
+
+
+class StatisticsEngine:
+    """
+    Statistics of one container, kept current without rescanning it
+
+    Every document's contribution is remembered by id, so an update replaces
+    the old values (change feed batches can be replayed safely). Averages,
+    percentiles and histograms are computed with NumPy only when the snapshot
+    is read after a change. A rescan builds new aggregates outside the lock
+    while the old ones keep serving reads and changes; changes that arrive
+    during the scan are replayed onto the new aggregates before they are
+    swapped in.
+    """
+
+    def __init__(self, container, spec: StatisticsSpec, ttl_seconds: float = STATISTICS_TTL_SECONDS):
+        """
+        Args:
+            container: Cosmos DB container client
+            spec: What to aggregate
+            ttl_seconds: Age after which statistics() starts a background rescan
+        """
+        self.container = container
+        self.spec = spec
+        self.ttl_seconds = ttl_seconds
+
+        self._lock = threading.Lock()
+        # Serializes scans; never held together with _lock while scanning
+        self._scan_lock = threading.Lock()
+        self._aggregates: Optional[_Aggregates] = None
+        self._scanned_at: Optional[float] = None
+        self._snapshot: Optional[Dict[str, Any]] = None
+        # Change batches received while a scan runs (None when no scan runs)
+        self._replay: Optional[List[List[Dict[str, Any]]]] = None
+        self._rescanning = False
+
+    def __len__(self) -> int:
+        aggregates = self._aggregates
+        return len(aggregates.rows) if aggregates is not None else 0
+
+    # ------------------------------------------------------------------------
+    # Loading and changes
+    # ------------------------------------------------------------------------
+
+    def rescan(self):
+        """Rebuild from one projected, page-at-a-time scan of the container"""
+        with self._scan_lock:
+            self._scan()
+
+    def _scan(self):
+        query = f"SELECT {select_fields(self.spec.scan_fields())} FROM c"
+        started = time.monotonic()
+        fresh = _Aggregates(self.spec)
+
+        with self._lock:
+            if self._replay is None:
+                self._replay = []
+        try:
+            for document in iter_query_items(self.container, query):
+                fresh.upsert(document)
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+
+        with self._lock:
+            for documents in self._replay:
+                for document in documents:
+                    fresh.upsert(document)
+            self._replay = None
+            self._aggregates = fresh
+            self._snapshot = None
+            self._scanned_at = time.monotonic()
+        print(f"✓ Statistics scanned {len(fresh.rows)} documents in {time.monotonic() - started:.1f}s")
+
+    def _background_rescan(self):
+        try:
+            self.rescan()
+        except Exception as e:
+            print(f"⚠️  Statistics rescan failed, serving the previous snapshot: {e}")
+        finally:
+            with self._lock:
+                self._rescanning = False
+
+    def apply_changes(self, documents: List[Dict[str, Any]]):
+        """Apply inserted or updated documents (change feed consumer)"""
+        with self._lock:
+            if self._replay is not None:
+                # A scan is running; its result gets these changes too
+                self._replay.append(list(documents))
+            if self._aggregates is None:
+                # Not loaded yet; the first statistics() call scans everything
+                return
+            for document in documents:
+                self._aggregates.upsert(document)
+            self._snapshot = None
+
+    # ------------------------------------------------------------------------
+    # Snapshot
+    # ------------------------------------------------------------------------
+
+    def statistics(self) -> Dict[str, Any]:
+        """
+        Current statistics
+
+        The first call scans the container. After that, statistics older than
+        the TTL are still returned at once while a rescan runs in the
+        background.
+
+        Returns:
+            {count_key, average_<name>, <name>_percentiles, <name>_histogram,
+            <distribution keys>, 'as_of'}: the distributions are lists of
+            {label: value, 'count': n}, largest first
+        """
+        if self._aggregates is None:
+            with self._scan_lock:
+                if self._aggregates is None:
+                    self._scan()
+
+        with self._lock:
+            if time.monotonic() - self._scanned_at > self.ttl_seconds and not self._rescanning:
+                self._rescanning = True
+                # Record changes from now on, before the thread gets to start its scan
+                self._replay = []
+                threading.Thread(
+                    target=self._background_rescan, name="statistics-rescan", daemon=True
+                ).start()
+            if self._snapshot is None:
+                self._snapshot = self._aggregates.materialize()
+            return dict(self._snapshot)
+
+
+_engines: Dict[str, StatisticsEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_statistics_engine(name: str, container, spec: StatisticsSpec) -> StatisticsEngine:
+    """
+    Return the process-wide statistics engine for a container
+
+    Every retriever and RAG system reading the same container shares one
+    snapshot, and the engine follows the container's change feed.
+
+    Args:
+        name: Container's environment prefix (e.g. 'COSMOS_ret')
+        container: Cosmos DB container client
+        spec: CUSTOMER_STATISTICS or POLICY_STATISTICS
+    """
+    with _engines_lock:
+        engine = _engines.get(name)
+        if engine is None:
+            engine = StatisticsEngine(container, spec)
+            _engines[name] = engine
+            start_change_feed_sync(name, container, engine)
+        return engine
+
+
+def main():
+    """Print customer or policy statistics from one scan"""
+    from client_registry import get_container
+
+    parser = argparse.ArgumentParser(description="Customer and policy statistics from one streaming scan")
+    parser.add_argument("kind", choices=["customers", "policies"])
+    parser.add_argument("--prefix", help="Environment prefix of the container (default COSMOS_ret / COSMOS_pol)")
+    args = parser.parse_args()
+
+    spec = CUSTOMER_STATISTICS if args.kind == "customers" else POLICY_STATISTICS
+    prefix = args.prefix or ("COSMOS_ret" if args.kind == "customers" else "COSMOS_pol")
+
+    engine = StatisticsEngine(get_container(prefix), spec)
+    print(json.dumps(engine.statistics(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -768,7 +768,7 @@ Updated with ChatAgent Tab for Semantic and Hybrid Search
 import streamlit as st
 import json
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import sys
 import os
 
@@ -951,8 +951,8 @@ def get_risk_emoji(risk_level: str) -> str:
     }
     return emojis.get(risk_level.upper(), "⚪")
 
-def analyze_customer(customer_id: str) -> Dict[str, Any]:
-    """Analyze a customer and return results"""
+def analyze_customer(customer_id: str, force_llm: bool = False) -> Dict[str, Any]:
+    """Analyze a customer and return results (force_llm: AI narrative whatever the risk)"""
     agent = st.session_state.agent
     
     # Create initial state
@@ -962,6 +962,8 @@ def analyze_customer(customer_id: str) -> Dict[str, Any]:
         "customer_data": None,
         "policy_data": None,
         "churn_analysis": None,
+        "force_llm": force_llm,
+        "stream_analysis": True,
         "stage": "retrieve"
     }
     
@@ -975,7 +977,7 @@ def analyze_customer(customer_id: str) -> Dict[str, Any]:
             "error": "No data found for this customer ID"
         }
     
-    # Analyze
+    # Analyze (deterministic part only; an LLM narrative is streamed by display_ai_analysis)
     state = agent.analyze_churn_node(state)
     
     # Calculate risk score
@@ -991,6 +993,7 @@ def analyze_customer(customer_id: str) -> Dict[str, Any]:
         "analysis": analysis,
         "risk_score": risk_score,
         "risk_level": risk_level,
+        "narrative_state": state if state.get("pending_narrative") else None,
         "timestamp": datetime.now().isoformat()
     }
 
@@ -1139,10 +1142,20 @@ def display_risk_assessment(risk_score: float, risk_level: str, analysis: Dict[s
             help="Cancellations in the last 12 months"
         )
 
-def display_ai_analysis(llm_analysis: str):
-    """Display AI-generated analysis"""
+def display_ai_analysis(llm_analysis: str, narrative_source: Optional[str] = None, narrative_stream=None):
+    """Display AI-generated analysis (narrative_stream: text chunks to render as they arrive)"""
     st.markdown("### 🤖 AI-Powered Analysis")
     
+    if narrative_stream is not None:
+        st.write_stream(narrative_stream)
+        return
+    
+    if narrative_source == 'template':
+        st.caption("Rule-based summary: risk is below the AI analysis threshold. "
+                   "Tick \"Always use AI analysis\" and re-analyze for a detailed narrative.")
+    elif narrative_source == 'cache':
+        st.caption("Cached AI analysis: this customer's data is unchanged since it was generated.")
+    
     st.markdown(f"""
     <div class="info-box">
         {llm_analysis}
@@ -1246,6 +1259,12 @@ def main():
                 st.success("✅ Azure Cosmos DB connection Successful")
         else:
             st.success("✅ Agent Ready")
+            usage = st.session_state.agent.llm_usage()
+            st.caption(
+                f"🤖 AI narratives: {usage['llm_calls']} generated, {usage['cache_hits']} cached, "
+                f"{usage['llm_calls_skipped']} LLM calls skipped; "
+                f"{usage['prompt_tokens']:,} prompt / {usage['completion_tokens']:,} completion tokens"
+            )
         
         st.markdown("---")
         
@@ -1303,10 +1322,15 @@ def main():
                 st.markdown("<br>", unsafe_allow_html=True)
                 analyze_button = st.button("🔬 Analyze Customer", type="primary", use_container_width=True)
             
+            force_llm = st.checkbox(
+                "Always use AI analysis",
+                help="Low-risk customers get a rule-based summary by default; tick to generate an AI narrative anyway"
+            )
+            
             # Analyze customer
             if analyze_button and customer_id:
                 with st.spinner("🧠 Analyzing customer data..."):
-                    result = analyze_customer(customer_id)
+                    result = analyze_customer(customer_id, force_llm)
                     
                     if result.get('success'):
                         st.session_state.current_analysis = result
@@ -1347,8 +1371,16 @@ def main():
                 
                 with tab4:
                     analysis = result.get('analysis', {})
-                    llm_analysis = analysis.get('llm_analysis', 'No analysis available')
-                    display_ai_analysis(llm_analysis)
+                    if result.get('narrative_state') is not None:
+                        # Rendered after the other tabs, so they show while the narrative streams in
+                        display_ai_analysis(
+                            None,
+                            narrative_stream=st.session_state.agent.stream_churn_analysis(result['narrative_state'])
+                        )
+                        result['narrative_state'] = None
+                    else:
+                        llm_analysis = analysis.get('llm_analysis', 'No analysis available')
+                        display_ai_analysis(llm_analysis, analysis.get('narrative_source'))
                 
                 with tab5:
                     if st.button("Generate Email"):
@@ -0,0 +1,25 @@
+"""
+throttling.py - Recognizing 429 responses and choosing how long to back off
+Shared by the ingestion pipeline (embeddings, Cosmos DB writes) and the LLM
+executor (chat completions)
+"""
+
+import random
+
+
+def is_throttled(error: Exception) -> bool:
+    """True for 429 responses from Azure OpenAI or Cosmos DB"""
+    return getattr(error, "status_code", None) == 429
+
+
+def retry_delay(error: Exception, attempt: int, base: float = 1.0) -> float:
+    """Seconds to wait: the service's Retry-After hint, else jittered exponential backoff"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or getattr(error, "headers", None) or {}
+    try:
+        if headers.get("x-ms-retry-after-ms"):
+            return float(headers["x-ms-retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return base * (2 ** attempt) * random.uniform(0.5, 1.5)
@@ -0,0 +1,151 @@
+"""
+two_level_cache.py - Bounded in-memory LRU in front of a local SQLite store
+Shared layer of the embedding and narrative caches: the LRU, the SQLite
+connection (WAL, so several processes on one machine share the file), hit
+and miss counters and clearing. Subclasses define the table and how an
+entry is read from and written to it
+"""
+
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class TwoLevelCache:
+    """
+    Level 1 is a bounded LRU held in process memory. Level 2 is a SQLite file
+    on local disk, so entries survive restarts and are shared between
+    processes (e.g. several Streamlit workers) on the same machine.
+
+    Subclasses set `table` and `columns` (the column definitions after the
+    key) and implement _read and _write; every hook runs with the lock held.
+    """
+
+    table = ""
+    columns = ""
+    # Used in warnings, e.g. "Embedding cache read failed"
+    label = "Cache"
+
+    def __init__(self, path: Optional[str], max_memory_items: int):
+        """
+        Args:
+            path: SQLite file for the on-disk store (None or "" for memory only)
+            max_memory_items: Number of entries kept in the in-memory LRU
+        """
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self._memory: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if path:
+            try:
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, {self.columns})")
+                self._create_indexes()
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️  {self.label} disk store unavailable ({e}), using memory only")
+                self._conn = None
+
+    # ------------------------------------------------------------------------
+    # Subclass hooks (lock held)
+    # ------------------------------------------------------------------------
+
+    def _create_indexes(self):
+        """Create extra indexes on the table"""
+
+    def _read(self, key: str) -> Optional[Any]:
+        """Entry stored on disk for key, or None"""
+        raise NotImplementedError
+
+    def _write(self, key: str, entry: Any):
+        """Store an entry on disk (committed by the caller)"""
+        raise NotImplementedError
+
+    def _fresh(self, entry: Any) -> bool:
+        """Whether an entry held in memory may still be served"""
+        return True
+
+    def _on_memory_hit(self, key: str):
+        """Called for every memory hit; must not touch the disk"""
+
+    # ------------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------------
+
+    def _get(self, key: str) -> Optional[Any]:
+        """Return the cached entry for key from memory, else disk, or None on a miss"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self._fresh(entry):
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    self._on_memory_hit(key)
+                    return entry
+                del self._memory[key]
+
+            if self._conn is not None:
+                try:
+                    entry = self._read(key)
+                except sqlite3.Error as e:
+                    print(f"⚠️  {self.label} read failed: {e}")
+                    entry = None
+
+                if entry is not None:
+                    self._remember(key, entry)
+                    self.disk_hits += 1
+                    return entry
+
+            self.misses += 1
+            return None
+
+    def _put(self, key: str, entry: Any):
+        """Store an entry in memory and on disk"""
+        with self._lock:
+            self._remember(key, entry)
+
+            if self._conn is not None:
+                try:
+                    self._write(key, entry)
+                    self._conn.commit()
+                except sqlite3.Error as e:
+                    print(f"⚠️  {self.label} write failed: {e}")
+
+    def _remember(self, key: str, entry: Any):
+        """Insert into the LRU, evicting the least recently used entries (lock held)"""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        """Drop every cached entry from memory and disk"""
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute(f"DELETE FROM {self.table}")
+                self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_items': len(self._memory),
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+            }
@@ -923,9 +923,21 @@ Combines customer and policy retrieval using hybrid search (semantic + keyword)
 
 import os
 import json
-from azure.cosmos import CosmosClient
-from openai import AzureOpenAI
-from typing import List, Dict, Any, Optional, Tuple
+from client_registry import get_cosmos_client, get_openai_client
+from embedding_batcher import get_embedding_batcher
+from parallel_search import run_parallel_searches
+from projections import CUSTOMER_SEARCH_FIELDS, POLICY_SEARCH_FIELDS
+from vector_index import load_vector_index
+from keyword_index import (
+    get_keyword_index, keyword_scores, add_keyword_candidates,
+    customer_keyword_text, policy_keyword_text, CUSTOMER_KEYWORD_FIELDS, POLICY_KEYWORD_FIELDS
+)
+from change_feed_sync import start_change_feed_sync
+from fusion import (
+    get_fusion_strategy, rank_by, rank_by_scores,
+    HYBRID_CANDIDATE_MULTIPLIER, HYBRID_MAX_CANDIDATES, HYBRID_FUSION_STRATEGY
+)
+from typing import List, Dict, Any, Optional
 from datetime import datetime
 from dotenv import load_dotenv
 import os
@@ -937,12 +949,15 @@ COSMOS_hybrid_ENDPOINT = os.getenv("COSMOS_hybrid_ENDPOINT")
 COSMOS_hybrid_KEY = os.getenv("COSMOS_hybrid_KEY")
 COSMOS_hybrid_DATABASE_NAME = os.getenv("COSMOS_hybrid_DATABASE_NAME")
 COSMOS_hybrid_CONTAINER_NAME = os.getenv("COSMOS_hybrid_CONTAINER_NAME")
+# Optional local ANN index built with vector_index.py
+COSMOS_hybrid_VECTOR_INDEX_PATH = os.getenv("COSMOS_hybrid_VECTOR_INDEX_PATH")
 
 # Configuration
 COSMOS_pol_hybrid_ENDPOINT = os.getenv("COSMOS_pol_hybrid_ENDPOINT")
 COSMOS_pol_hybrid_KEY = os.getenv("COSMOS_pol_hybrid_KEY")
 COSMOS_pol_hybrid_DATABASE_NAME = os.getenv("COSMOS_pol_hybrid_DATABASE_NAME")
 COSMOS_pol_hybrid_CONTAINER_NAME = os.getenv("COSMOS_pol_hybrid_CONTAINER_NAME")
+COSMOS_pol_hybrid_VECTOR_INDEX_PATH = os.getenv("COSMOS_pol_hybrid_VECTOR_INDEX_PATH")
 
 
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
@@ -1924,6 +1939,13 @@ AZURE_OPENAI_API_VERSION = "2024-02-01"
 #     main()
 
 
+def _result_key(result: Dict[str, Any]):
+    """Identity of a customer or policy result when both are ranked together"""
+    if 'policy_id' in result:
+        return ('policy', result['policy_id'])
+    return ('customer', result.get('customer_id'))
+
+
 class UnifiedRAGHybridSystem:
     """
     Unified RAG System that combines customer and policy retrieval
@@ -1938,25 +1960,40 @@ class UnifiedRAGHybridSystem:
         
         # Initialize Azure OpenAI client for embeddings
         print("\n📊 Connecting to Azure OpenAI...")
-        self.openai_client = AzureOpenAI(
-            azure_endpoint=AZURE_OPENAI_ENDPOINT,
-            api_key=AZURE_OPENAI_KEY,
-            api_version=AZURE_OPENAI_API_VERSION
+        self.openai_client = get_openai_client(
+            AZURE_OPENAI_ENDPOINT,
+            AZURE_OPENAI_KEY,
+            AZURE_OPENAI_API_VERSION
         )
+        self.embedder = get_embedding_batcher(self.openai_client, AZURE_OPENAI_DEPLOYMENT, AZURE_OPENAI_ENDPOINT)
         print("✓ Azure OpenAI client initialized")
         
+        # Fusion of vector and keyword rankings: 'rrf', 'weighted' or an object with fuse()
+        self.fusion_strategy = HYBRID_FUSION_STRATEGY
+        
         # Initialize Customer Database
         print("\n👥 Connecting to Customer Database...")
-        self.customer_cosmos_client = CosmosClient(COSMOS_hybrid_ENDPOINT, COSMOS_hybrid_KEY)
+        self.customer_cosmos_client = get_cosmos_client(COSMOS_hybrid_ENDPOINT, COSMOS_hybrid_KEY)
         self.customer_database = self.customer_cosmos_client.get_database_client(COSMOS_hybrid_DATABASE_NAME)
         self.customer_container = self.customer_database.get_container_client(COSMOS_hybrid_CONTAINER_NAME)
+        self.customer_index = load_vector_index(COSMOS_hybrid_VECTOR_INDEX_PATH)
+        if self.customer_index is not None:
+            # Keep the index current with inserts and updates from the change feed
+            start_change_feed_sync("COSMOS_hybrid", self.customer_container, self.customer_index)
+        # Start building the corpus-wide keyword index in the background
+        self.get_customer_keyword_index()
         print("✓ Customer database connected")
         
         # Initialize Policy Database
         print("\n📋 Connecting to Policy Database...")
-        self.policy_cosmos_client = CosmosClient(COSMOS_pol_hybrid_ENDPOINT, COSMOS_pol_hybrid_KEY)
+        self.policy_cosmos_client = get_cosmos_client(COSMOS_pol_hybrid_ENDPOINT, COSMOS_pol_hybrid_KEY)
         self.policy_database = self.policy_cosmos_client.get_database_client(COSMOS_pol_hybrid_DATABASE_NAME)
         self.policy_container = self.policy_database.get_container_client(COSMOS_pol_hybrid_CONTAINER_NAME)
+        self.policy_index = load_vector_index(COSMOS_pol_hybrid_VECTOR_INDEX_PATH)
+        if self.policy_index is not None:
+            # Keep the index current with inserts and updates from the change feed
+            start_change_feed_sync("COSMOS_pol_hybrid", self.policy_container, self.policy_index)
+        self.get_policy_keyword_index()
         print("✓ Policy database connected")
         
         print("\n" + "=" * 80)
@@ -1977,16 +2014,94 @@ class UnifiedRAGHybridSystem:
         Returns:
             List of floats representing the embedding vector
         """
+        # Cached queries return immediately; concurrent calls share one request
         try:
-            response = self.openai_client.embeddings.create(
-                input=text,
-                model=AZURE_OPENAI_DEPLOYMENT
-            )
-            return response.data[0].embedding
+            return self.embedder.embed(text)
         except Exception as e:
             print(f"❌ Error generating embedding: {e}")
             raise
     
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Generate embedding vectors for many texts in as few requests as possible
+        
+        Args:
+            texts: Input texts to embed
+            
+        Returns:
+            List of embedding vectors in the same order as texts
+        """
+        try:
+            return self.embedder.embed_many(texts)
+        except Exception as e:
+            print(f"❌ Error generating embeddings: {e}")
+            raise
+    
+    # ========================================================================
+    # KEYWORD INDEXES
+    # ========================================================================
+    
+    def get_customer_keyword_index(self):
+        """Corpus-wide BM25 index over the customer container (None until its background build is done)"""
+        return get_keyword_index(
+            "COSMOS_hybrid", self.customer_container, 'customer_id',
+            customer_keyword_text, CUSTOMER_KEYWORD_FIELDS
+        )
+    
+    def get_policy_keyword_index(self):
+        """Corpus-wide BM25 index over the policy container (None until its background build is done)"""
+        return get_keyword_index(
+            "COSMOS_pol_hybrid", self.policy_container, 'policy_id',
+            policy_keyword_text, POLICY_KEYWORD_FIELDS
+        )
+    
+    # ========================================================================
+    # FUSION
+    # ========================================================================
+    
+    def _fuse_candidates(
+        self,
+        query: str,
+        results: List[Dict[str, Any]],
+        candidates: List[Dict[str, Any]],
+        id_field: str,
+        keyword_text,
+        keyword_index,
+        top_k: int,
+        vector_weight: float,
+        keyword_weight: float
+    ) -> List[Dict[str, Any]]:
+        """
+        Score candidates by keywords and fuse them with the vector ranking
+        
+        Args:
+            query: Natural language query
+            results: Vector search results, best first
+            candidates: results plus the container-wide keyword matches
+            id_field: Document id field (e.g. 'customer_id')
+            keyword_text: Function returning a document's searchable text
+            keyword_index: Corpus-wide BM25 index, or None
+            top_k: Number of results to return
+            vector_weight: Weight for semantic similarity
+            keyword_weight: Weight for keyword matching
+            
+        Returns:
+            Top_k documents with hybrid, keyword and similarity scores
+        """
+        # Step 2: BM25 keyword scores over whole tokens (IDF from the whole container when indexed)
+        query_scores = keyword_scores(query, candidates, id_field, keyword_text, keyword_index)
+        
+        # Step 3: Fuse the vector and keyword rankings and keep the top_k
+        # (scores stay in arrays; only the winners get keyword_score written)
+        fusion = get_fusion_strategy(self.fusion_strategy, vector_weight, keyword_weight)
+        keyword_ranked, keyword_ranked_scores = rank_by_scores(candidates, query_scores)
+        results = fusion.fuse(results, keyword_ranked, id_field, top_k, keyword_scores=keyword_ranked_scores)
+        
+        for result in results:
+            result['similarity_score'] = result['vector_score']  # For backward compatibility
+        
+        return results
+    
     # ========================================================================
     # CUSTOMER HYBRID SEARCH
     # ========================================================================
@@ -1996,7 +2111,8 @@ class UnifiedRAGHybridSystem:
         query: str, 
         top_k: int = 5,
         vector_weight: float = 0.6,
-        keyword_weight: float = 0.4
+        keyword_weight: float = 0.4,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict[str, Any]]:
         """
         HYBRID SEARCH over customer data (semantic + keyword matching)
@@ -2006,6 +2122,7 @@ class UnifiedRAGHybridSystem:
             top_k: Number of results to return
             vector_weight: Weight for semantic similarity (default 0.6)
             keyword_weight: Weight for keyword matching (default 0.4)
+            query_embedding: Precomputed embedding of query (generated if None)
             
         Returns:
             List of similar customers with hybrid scores
@@ -2014,85 +2131,67 @@ class UnifiedRAGHybridSystem:
             print(f"\n🔍 Hybrid searching customers for: '{query}'")
             print(f"   Weights: Vector={vector_weight:.0%}, Keyword={keyword_weight:.0%}")
             
-            # Step 1: Get more candidates using vector search
-            candidate_count = min(top_k * 3, 50)
-            
-            # Generate query embedding
-            query_embedding = self.generate_embedding(query)
-            
-            # Vector search query
-            sql_query = """
-            SELECT TOP @top_k 
-                c.customer_id, 
-                c.first_name, 
-                c.last_name, 
-                c.email, 
-                c.phone,
-                c.occupation, 
-                c.annual_income, 
-                c.credit_score,
-                c.marital_status,
-                c.address,
-                c.metadata,
-                VectorDistance(c.embedding, @embedding) AS vector_score
-            FROM c
-            ORDER BY VectorDistance(c.embedding, @embedding)
-            """
-            
-            parameters = [
-                {"name": "@top_k", "value": candidate_count},
-                {"name": "@embedding", "value": query_embedding}
-            ]
-            
-            results = list(self.customer_container.query_items(
-                query=sql_query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
-            
-            if not results:
+            # Step 1: Get a small candidate pool per source using vector search
+            candidate_count = min(top_k * HYBRID_CANDIDATE_MULTIPLIER, HYBRID_MAX_CANDIDATES)
+            
+            # Generate query embedding unless the caller already has it
+            if query_embedding is None:
+                query_embedding = self.generate_embedding(query)
+            
+            # Rank candidates with the local index when one is loaded; only
+            # those documents are then read from Cosmos DB
+            if self.customer_index is not None:
+                results = self.customer_index.search_documents(
+                    self.customer_container, query_embedding, candidate_count,
+                    CUSTOMER_SEARCH_FIELDS, 'vector_score'
+                )
+            else:
+                # Vector search query
+                sql_query = """
+                SELECT TOP @top_k 
+                    c.customer_id, 
+                    c.first_name, 
+                    c.last_name, 
+                    c.email, 
+                    c.phone,
+                    c.occupation, 
+                    c.annual_income, 
+                    c.credit_score,
+                    c.marital_status,
+                    c.address,
+                    c.metadata,
+                    VectorDistance(c.embedding, @embedding) AS vector_score
+                FROM c
+                ORDER BY VectorDistance(c.embedding, @embedding)
+                """
+            
+                parameters = [
+                    {"name": "@top_k", "value": candidate_count},
+                    {"name": "@embedding", "value": query_embedding}
+                ]
+            
+                results = list(self.customer_container.query_items(
+                    query=sql_query,
+                    parameters=parameters,
+                    enable_cross_partition_query=True
+                ))
+            
+            # Add the best keyword matches from the whole container, not just the
+            # vector candidates
+            keyword_index = self.get_customer_keyword_index()
+            candidates = add_keyword_candidates(
+                results, keyword_index, query, self.customer_container,
+                CUSTOMER_SEARCH_FIELDS, query_embedding, candidate_count
+            )
+
+            if not candidates:
                 return []
             
-            # Step 2: Calculate keyword match scores
-            query_terms = query.lower().split()
-            
-            for result in results:
-                # Create searchable text from customer fields
-                searchable_text = " ".join([
-                    str(result.get('first_name', '')),
-                    str(result.get('last_name', '')),
-                    str(result.get('occupation', '')),
-                    str(result.get('email', '')),
-                    str(result.get('address', {}).get('city', '')),
-                    str(result.get('address', {}).get('state', ''))
-                ]).lower()
-                
-                # Calculate keyword match score (0-1)
-                matches = sum(1 for term in query_terms if term in searchable_text)
-                keyword_score = matches / len(query_terms) if query_terms else 0
-                
-                # Store raw scores (will be normalized later in unified_search)
-                result['keyword_score'] = keyword_score
-                result['raw_vector_score'] = result['vector_score']
-                result['similarity_score'] = result['vector_score']  # For backward compatibility
-            
-            # For single-source search, calculate hybrid score directly
-            # Normalize vector scores within this result set
-            vector_scores = [r['vector_score'] for r in results]
-            min_vec = min(vector_scores)
-            max_vec = max(vector_scores)
-            vec_range = max_vec - min_vec if max_vec > min_vec else 1
-            
-            for result in results:
-                # Normalize vector score to 0-1 (0 is best)
-                normalized_vec = (result['vector_score'] - min_vec) / vec_range
-                # Calculate hybrid score
-                hybrid_score = (vector_weight * normalized_vec) + (keyword_weight * result['keyword_score'])
-                result['hybrid_score'] = hybrid_score
-            
-            # Step 3: Re-rank by hybrid score and return top_k
-            results.sort(key=lambda x: x['hybrid_score'])
-            results = results[:top_k]
+            # Steps 2-3: BM25 keyword scores, fusion, top_k
+            results = self._fuse_candidates(
+                query, results, candidates, 'customer_id', customer_keyword_text, keyword_index,
+                top_k, vector_weight, keyword_weight
+            )
             
             print(f"✓ Found {len(results)} customers")
             return results
@@ -2110,7 +2209,8 @@ class UnifiedRAGHybridSystem:
         query: str, 
         top_k: int = 5,
         vector_weight: float = 0.6,
-        keyword_weight: float = 0.4
+        keyword_weight: float = 0.4,
+        query_embedding: Optional[List[float]] = None
     ) -> List[Dict[str, Any]]:
         """
         HYBRID SEARCH over policy data (semantic + keyword matching)
@@ -2120,6 +2220,7 @@ class UnifiedRAGHybridSystem:
             top_k: Number of results to return
             vector_weight: Weight for semantic similarity (default 0.6)
             keyword_weight: Weight for keyword matching (default 0.4)
+            query_embedding: Precomputed embedding of query (generated if None)
             
         Returns:
             List of similar policies with hybrid scores
@@ -2128,90 +2229,71 @@ class UnifiedRAGHybridSystem:
             print(f"\n🔍 Hybrid searching policies for: '{query}'")
             print(f"   Weights: Vector={vector_weight:.0%}, Keyword={keyword_weight:.0%}")
             
-            # Step 1: Get more candidates using vector search
-            candidate_count = min(top_k * 3, 50)
-            
-            # Generate query embedding
-            query_embedding = self.generate_embedding(query)
-            
-            # Vector search query
-            sql_query = """
-            SELECT TOP @top_k 
-                c.policy_id,
-                c.customer_id,
-                c.policy_number,
-                c.policy_type,
-                c.status,
-                c.annual_premium,
-                c.coverage_amount,
-                c.deductible,
-                c.payment_frequency,
-                c.start_date,
-                c.end_date,
-                c.term_months,
-                c.auto_renew,
-                c.agent_id,
-                c.metadata,
-                VectorDistance(c.embedding, @embedding) AS vector_score
-            FROM c
-            ORDER BY VectorDistance(c.embedding, @embedding)
-            """
-            
-            parameters = [
-                {"name": "@top_k", "value": candidate_count},
-                {"name": "@embedding", "value": query_embedding}
-            ]
-            
-            results = list(self.policy_container.query_items(
-                query=sql_query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
-            
-            if not results:
+            # Step 1: Get a small candidate pool per source using vector search
+            candidate_count = min(top_k * HYBRID_CANDIDATE_MULTIPLIER, HYBRID_MAX_CANDIDATES)
+            
+            # Generate query embedding unless the caller already has it
+            if query_embedding is None:
+                query_embedding = self.generate_embedding(query)
+            
+            # Rank candidates with the local index when one is loaded; only
+            # those documents are then read from Cosmos DB
+            if self.policy_index is not None:
+                results = self.policy_index.search_documents(
+                    self.policy_container, query_embedding, candidate_count,
+                    POLICY_SEARCH_FIELDS, 'vector_score'
+                )
+            else:
+                # Vector search query
+                sql_query = """
+                SELECT TOP @top_k 
+                    c.policy_id,
+                    c.customer_id,
+                    c.policy_number,
+                    c.policy_type,
+                    c.status,
+                    c.annual_premium,
+                    c.coverage_amount,
+                    c.deductible,
+                    c.payment_frequency,
+                    c.start_date,
+                    c.end_date,
+                    c.term_months,
+                    c.auto_renew,
+                    c.agent_id,
+                    c.metadata,
+                    VectorDistance(c.embedding, @embedding) AS vector_score
+                FROM c
+                ORDER BY VectorDistance(c.embedding, @embedding)
+                """
+            
+                parameters = [
+                    {"name": "@top_k", "value": candidate_count},
+                    {"name": "@embedding", "value": query_embedding}
+                ]
+            
+                results = list(self.policy_container.query_items(
+                    query=sql_query,
+                    parameters=parameters,
+                    enable_cross_partition_query=True
+                ))
+            
+            # Add the best keyword matches from the whole container, not just the
+            # vector candidates
+            keyword_index = self.get_policy_keyword_index()
+            candidates = add_keyword_candidates(
+                results, keyword_index, query, self.policy_container,
+                POLICY_SEARCH_FIELDS, query_embedding, candidate_count
+            )
+
+            if not candidates:
                 return []
             
-            # Step 2: Calculate keyword match scores
-            query_terms = query.lower().split()
-            
-            for result in results:
-                # Create searchable text from policy fields
-                searchable_text = " ".join([
-                    str(result.get('policy_type', '')),
-                    str(result.get('policy_number', '')),
-                    str(result.get('status', '')),
-                    str(result.get('payment_frequency', '')),
-                    str(result.get('customer_id', '')),
-                    "auto" if result.get('auto_renew') else "",
-                    "renew" if result.get('auto_renew') else ""
-                ]).lower()
-                
-                # Calculate keyword match score (0-1)
-                matches = sum(1 for term in query_terms if term in searchable_text)
-                keyword_score = matches / len(query_terms) if query_terms else 0
-                
-                # Store raw scores (will be normalized later in unified_search)
-                result['keyword_score'] = keyword_score
-                result['raw_vector_score'] = result['vector_score']
-                result['similarity_score'] = result['vector_score']  # For backward compatibility
-            
-            # For single-source search, calculate hybrid score directly
-            # Normalize vector scores within this result set
-            vector_scores = [r['vector_score'] for r in results]
-            min_vec = min(vector_scores)
-            max_vec = max(vector_scores)
-            vec_range = max_vec - min_vec if max_vec > min_vec else 1
-            
-            for result in results:
-                # Normalize vector score to 0-1 (0 is best)
-                normalized_vec = (result['vector_score'] - min_vec) / vec_range
-                # Calculate hybrid score
-                hybrid_score = (vector_weight * normalized_vec) + (keyword_weight * result['keyword_score'])
-                result['hybrid_score'] = hybrid_score
-            
-            # Step 3: Re-rank by hybrid score and return top_k
-            results.sort(key=lambda x: x['hybrid_score'])
-            results = results[:top_k]
+            # Steps 2-3: BM25 keyword scores, fusion, top_k
+            results = self._fuse_candidates(
+                query, results, candidates, 'policy_id', policy_keyword_text, keyword_index,
+                top_k, vector_weight, keyword_weight
+            )
             
             print(f"✓ Found {len(results)} policies")
             return results
@@ -2229,19 +2311,21 @@ class UnifiedRAGHybridSystem:
         query: str, 
         top_k: int = 5,
         vector_weight: float = 0.6,
-        keyword_weight: float = 0.4
+        keyword_weight: float = 0.4,
+        query_embedding: Optional[List[float]] = None
     ) -> Dict[str, List[Dict[str, Any]]]:
         """
         Perform INTELLIGENT hybrid search across both customers and policies
         Returns top_k results from whichever source(s) have the best matches
         
-        CRITICAL: Normalizes scores ACROSS both sources for fair comparison
+        CRITICAL: Fuses rankings ACROSS both sources for fair comparison
         
         Args:
             query: Natural language query
             top_k: Total number of results to return
             vector_weight: Weight for semantic similarity
             keyword_weight: Weight for keyword matching
+            query_embedding: Precomputed embedding of query (generated if None)
             
         Returns:
             Dictionary with 'customers' and 'policies' keys containing results
@@ -2252,13 +2336,48 @@ class UnifiedRAGHybridSystem:
         print(f"   Searching all sources to find top {top_k} most relevant results")
         print("-" * 80)
         
+        # Embed once and reuse the vector for both containers
+        if query_embedding is None:
+            try:
+                query_embedding = self.generate_embedding(query)
+            except Exception:
+                return {'customers': [], 'policies': []}
+        
         # Get candidates from BOTH sources
         candidate_multiplier = 2
-        customer_results = self.search_customers(query, top_k * candidate_multiplier, vector_weight, keyword_weight)
+        # Query both containers concurrently; a slow source degrades to no results
+        source_results = run_parallel_searches({
+            'customers': lambda: self.search_customers(query, top_k * candidate_multiplier, vector_weight, keyword_weight, query_embedding),
+            'policies': lambda: self.search_policies(query, top_k * candidate_multiplier, vector_weight, keyword_weight, query_embedding)
+        })
+        customer_results = source_results['customers']
         print("CUSTOMER RESULTS IN UNIFIED SEARCH--------------------------------------", customer_results)
-        policy_results = self.search_policies(query, top_k * candidate_multiplier, vector_weight, keyword_weight)
+        policy_results = source_results['policies']
         print("POLICY RESULTS IN UNIFIED SEARCH--------------------------------------", policy_results)
         
+        return self._fuse_sources(customer_results, policy_results, top_k, vector_weight, keyword_weight)
+    
+    def _fuse_sources(
+        self,
+        customer_results: List[Dict[str, Any]],
+        policy_results: List[Dict[str, Any]],
+        top_k: int,
+        vector_weight: float,
+        keyword_weight: float
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Rank customer and policy hybrid results together and keep the top_k
+        
+        Args:
+            customer_results: Customer hybrid search results
+            policy_results: Policy hybrid search results
+            top_k: Total number of results to return
+            vector_weight: Weight for semantic similarity
+            keyword_weight: Weight for keyword matching
+            
+        Returns:
+            Dictionary with 'customers' and 'policies' keys containing results
+        """
         # If one source has no results, return from the other
         if not customer_results and not policy_results:
             print("✓ No results found in either source")
@@ -2272,76 +2391,23 @@ class UnifiedRAGHybridSystem:
             print(f"✓ All results from CUSTOMERS ({len(customer_results[:top_k])} customers)")
             return {'customers': customer_results[:top_k], 'policies': []}
         
-        # CRITICAL FIX: Normalize scores ACROSS both sources
-        print(f"   Normalizing scores across both sources for fair comparison...")
-        
-        # Collect all raw vector scores from BOTH sources
-        all_vector_scores = []
-        all_vector_scores.extend([c.get('raw_vector_score', c.get('vector_score', 0)) for c in customer_results])
-        all_vector_scores.extend([p.get('raw_vector_score', p.get('vector_score', 0)) for p in policy_results])
-        
-        # Find global min/max for vector scores
-        global_min_vec = min(all_vector_scores)
-        global_max_vec = max(all_vector_scores)
-        global_vec_range = global_max_vec - global_min_vec if global_max_vec > global_min_vec else 1
-        
-        print(f"   Vector score range: {global_min_vec:.4f} to {global_max_vec:.4f}")
-        
-        # Re-calculate hybrid scores using GLOBAL normalization
-        for customer in customer_results:
-            raw_vec_score = customer.get('raw_vector_score', customer.get('vector_score', 0))
-            normalized_vec = (raw_vec_score - global_min_vec) / global_vec_range
-            keyword_score = customer.get('keyword_score', 0)
-            
-            # Re-calculate hybrid score with global normalization
-            hybrid_score = (vector_weight * normalized_vec) + (keyword_weight * keyword_score)
-            print("HYBRID SCORE CUSTOMER IN UNIFIED customer SEARCH--------------------------------------", hybrid_score)
-            
-            
-            customer['normalized_vector_score'] = normalized_vec
-            customer['global_hybrid_score'] = hybrid_score
-            customer['result_type'] = 'customer'
-        
-        for policy in policy_results:
-            raw_vec_score = policy.get('raw_vector_score', policy.get('vector_score', 0))
-            normalized_vec = (raw_vec_score - global_min_vec) / global_vec_range
-            keyword_score = policy.get('keyword_score', 0)
-            
-            # Re-calculate hybrid score with global normalization
-            hybrid_score = (vector_weight * normalized_vec) + (keyword_weight * keyword_score)
-            print("HYBRID SCORE POLICY IN UNIFIED policy SEARCH--------------------------------------", hybrid_score)
-            
-            policy['normalized_vector_score'] = normalized_vec
-            policy['global_hybrid_score'] = hybrid_score
-            policy['result_type'] = 'policy'
+        # CRITICAL FIX: Rank ACROSS both sources
+        print(f"   Fusing rankings across both sources for fair comparison...")
         
         # Combine all results
         all_results = customer_results + policy_results
         
-        # Sort by global_hybrid_score (lower is better)
-        # all_results.sort(key=lambda x: x.get('global_hybrid_score', float('inf')))
-        
-        # Take top_k best overall results
-        top_results = all_results[:top_k]
-        
-        # Separate back into customers and policies
-        final_customers = [r for r in top_results if r['result_type'] == 'customer']
-        final_policies = [r for r in top_results if r['result_type'] == 'policy']
-        
-        # Clean up temporary fields and update hybrid_score for display
-        for customer in final_customers:
-            customer.pop('result_type', None)
-            customer.pop('normalized_vector_score', None)
-            customer.pop('raw_vector_score', None)
-            # Use global score as the display score
-            customer['hybrid_score'] = customer.pop('global_hybrid_score')
-        
-        for policy in final_policies:
-            policy.pop('result_type', None)
-            policy.pop('normalized_vector_score', None)
-            policy.pop('raw_vector_score', None)
-            # Use global score as the display score
-            policy['hybrid_score'] = policy.pop('global_hybrid_score')
+        # One vector ranking over both sources (same embedding model, so the
+        # similarities are comparable; VectorDistance is cosine similarity,
+        # higher is better) and one keyword ranking
+        vector_ranked = rank_by(all_results, 'vector_score', positive_only=False)
+        keyword_ranked = rank_by(all_results, 'keyword_score')
+        fusion = get_fusion_strategy(self.fusion_strategy, vector_weight, keyword_weight)
+        top_results = fusion.fuse(vector_ranked, keyword_ranked, _result_key, top_k)
+        
+        # Separate back into customers and policies (each still best first)
+        final_customers = [r for r in top_results if 'policy_id' not in r]
+        final_policies = [r for r in top_results if 'policy_id' in r]
         
         # Log the distribution with score info
         if final_customers and final_policies:
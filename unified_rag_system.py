@@ -743,8 +743,13 @@ Combines customer and policy retrieval using semantic search over Cosmos DB
 
 import os
 import json
-from azure.cosmos import CosmosClient
-from openai import AzureOpenAI
+from client_registry import get_cosmos_client, get_openai_client
+from embedding_batcher import get_embedding_batcher
+from parallel_search import run_parallel_searches
+from cosmos_lookup import PartitionKeyLookup
+from projections import CUSTOMER_FIELDS, POLICY_FIELDS, CUSTOMER_SEARCH_FIELDS, POLICY_SEARCH_FIELDS
+from vector_index import load_vector_index
+from change_feed_sync import start_change_feed_sync
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 from dotenv import load_dotenv
@@ -758,12 +763,15 @@ COSMOS_ret_ENDPOINT = os.getenv("COSMOS_ret_ENDPOINT")
 COSMOS_ret_KEY = os.getenv("COSMOS_ret_KEY")
 COSMOS_ret_DATABASE_NAME = os.getenv("COSMOS_ret_DATABASE_NAME")
 COSMOS_ret_CONTAINER_NAME = os.getenv("COSMOS_ret_CONTAINER_NAME")
+# Optional local ANN index built with vector_index.py
+COSMOS_ret_VECTOR_INDEX_PATH = os.getenv("COSMOS_ret_VECTOR_INDEX_PATH")
 
 # Configuration
 COSMOS_pol_ENDPOINT = os.getenv("COSMOS_pol_ENDPOINT")
 COSMOS_pol_KEY = os.getenv("COSMOS_pol_KEY")
 COSMOS_pol_DATABASE_NAME = os.getenv("COSMOS_pol_DATABASE_NAME")
 COSMOS_pol_CONTAINER_NAME = os.getenv("COSMOS_pol_CONTAINER_NAME")
+COSMOS_pol_VECTOR_INDEX_PATH = os.getenv("COSMOS_pol_VECTOR_INDEX_PATH")
 
 
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
@@ -786,25 +794,36 @@ class UnifiedRAGSystem:
         
         # Initialize Azure OpenAI client for embeddings
         print("\n📊 Connecting to Azure OpenAI...")
-        self.openai_client = AzureOpenAI(
-            azure_endpoint=AZURE_OPENAI_ENDPOINT,
-            api_key=AZURE_OPENAI_KEY,
-            api_version=AZURE_OPENAI_API_VERSION
+        self.openai_client = get_openai_client(
+            AZURE_OPENAI_ENDPOINT,
+            AZURE_OPENAI_KEY,
+            AZURE_OPENAI_API_VERSION
         )
+        self.embedder = get_embedding_batcher(self.openai_client, AZURE_OPENAI_DEPLOYMENT, AZURE_OPENAI_ENDPOINT)
         print("✓ Azure OpenAI client initialized")
         
         # Initialize Customer Database
         print("\n👥 Connecting to Customer Database...")
-        self.customer_cosmos_client = CosmosClient(COSMOS_ret_ENDPOINT, COSMOS_ret_KEY)
+        self.customer_cosmos_client = get_cosmos_client(COSMOS_ret_ENDPOINT, COSMOS_ret_KEY)
         self.customer_database = self.customer_cosmos_client.get_database_client(COSMOS_ret_DATABASE_NAME)
         self.customer_container = self.customer_database.get_container_client(COSMOS_ret_CONTAINER_NAME)
+        self.customer_lookup = PartitionKeyLookup(self.customer_container, CUSTOMER_FIELDS)
+        self.customer_index = load_vector_index(COSMOS_ret_VECTOR_INDEX_PATH)
+        if self.customer_index is not None:
+            # Keep the index current with inserts and updates from the change feed
+            start_change_feed_sync("COSMOS_ret", self.customer_container, self.customer_index)
         print("✓ Customer database connected")
         
         # Initialize Policy Database
         print("\n📋 Connecting to Policy Database...")
-        self.policy_cosmos_client = CosmosClient(COSMOS_pol_ENDPOINT, COSMOS_pol_KEY)
+        self.policy_cosmos_client = get_cosmos_client(COSMOS_pol_ENDPOINT, COSMOS_pol_KEY)
         self.policy_database = self.policy_cosmos_client.get_database_client(COSMOS_pol_DATABASE_NAME)
         self.policy_container = self.policy_database.get_container_client(COSMOS_pol_CONTAINER_NAME)
+        self.policy_lookup = PartitionKeyLookup(self.policy_container, POLICY_FIELDS)
+        self.policy_index = load_vector_index(COSMOS_pol_VECTOR_INDEX_PATH)
+        if self.policy_index is not None:
+            # Keep the index current with inserts and updates from the change feed
+            start_change_feed_sync("COSMOS_pol", self.policy_container, self.policy_index)
         print("✓ Policy database connected")
         
         print("\n" + "=" * 80)
@@ -825,27 +844,46 @@ class UnifiedRAGSystem:
         Returns:
             List of floats representing the embedding vector
         """
+        # Cached queries return immediately; concurrent calls share one request
         try:
-            response = self.openai_client.embeddings.create(
-                input=text,
-                model=AZURE_OPENAI_DEPLOYMENT
-            )
-            return response.data[0].embedding
+            return self.embedder.embed(text)
         except Exception as e:
             print(f"❌ Error generating embedding: {e}")
             raise
     
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Generate embedding vectors for many texts in as few requests as possible
+        
+        Args:
+            texts: Input texts to embed
+            
+        Returns:
+            List of embedding vectors in the same order as texts
+        """
+        try:
+            return self.embedder.embed_many(texts)
+        except Exception as e:
+            print(f"❌ Error generating embeddings: {e}")
+            raise
+    
     # ========================================================================
     # CUSTOMER VECTOR SEARCH
     # ========================================================================
     
-    def search_customers(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    def search_customers(
+        self,
+        query: str,
+        top_k: int = 5,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[Dict[str, Any]]:
         """
         Semantic search over customer data using vector embeddings
         
         Args:
             query: Natural language query (e.g., "high income engineers in California")
             top_k: Number of results to return
+            query_embedding: Precomputed embedding of query (generated if None)
             
         Returns:
             List of similar customers with similarity scores
@@ -853,8 +891,19 @@ class UnifiedRAGSystem:
         try:
             print(f"\n🔍 Searching customers for: '{query}'")
             
-            # Generate query embedding
-            query_embedding = self.generate_embedding(query)
+            # Generate query embedding unless the caller already has it
+            if query_embedding is None:
+                query_embedding = self.generate_embedding(query)
+            
+            # Rank with the local index when one is loaded; only the top_k
+            # documents are then read from Cosmos DB
+            if self.customer_index is not None:
+                results = self.customer_index.search_documents(
+                    self.customer_container, query_embedding, top_k,
+                    CUSTOMER_SEARCH_FIELDS, 'similarity_score'
+                )
+                print(f"✓ Found {len(results)} customers (local index)")
+                return results
             
             # Vector search query
             sql_query = """
@@ -897,13 +946,19 @@ class UnifiedRAGSystem:
     # POLICY VECTOR SEARCH
     # ========================================================================
     
-    def search_policies(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+    def search_policies(
+        self,
+        query: str,
+        top_k: int = 5,
+        query_embedding: Optional[List[float]] = None
+    ) -> List[Dict[str, Any]]:
         """
         Semantic search over policy data using vector embeddings
         
         Args:
             query: Natural language query (e.g., "active auto insurance policies")
             top_k: Number of results to return
+            query_embedding: Precomputed embedding of query (generated if None)
             
         Returns:
             List of similar policies with similarity scores
@@ -911,8 +966,19 @@ class UnifiedRAGSystem:
         try:
             print(f"\n🔍 Searching policies for: '{query}'")
             
-            # Generate query embedding
-            query_embedding = self.generate_embedding(query)
+            # Generate query embedding unless the caller already has it
+            if query_embedding is None:
+                query_embedding = self.generate_embedding(query)
+            
+            # Rank with the local index when one is loaded; only the top_k
+            # documents are then read from Cosmos DB
+            if self.policy_index is not None:
+                results = self.policy_index.search_documents(
+                    self.policy_container, query_embedding, top_k,
+                    POLICY_SEARCH_FIELDS, 'similarity_score'
+                )
+                print(f"✓ Found {len(results)} policies (local index)")
+                return results
             
             # Vector search query
             sql_query = """
@@ -959,7 +1025,12 @@ class UnifiedRAGSystem:
     # UNIFIED SEARCH - Searches both customers and policies
     # ========================================================================
     
-    def unified_search(self, query: str, top_k: int = 5) -> Dict[str, List[Dict[str, Any]]]:
+    def unified_search(
+        self,
+        query: str,
+        top_k: int = 5,
+        query_embedding: Optional[List[float]] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
         """
         Perform semantic search across both customers and policies
         Returns COMBINED top_k results based on normalized similarity scores
@@ -967,6 +1038,7 @@ class UnifiedRAGSystem:
         Args:
             query: Natural language query
             top_k: Total number of results to return (combined)
+            query_embedding: Precomputed embedding of query (generated if None)
             
         Returns:
             Dictionary with 'customers' and 'policies' keys containing combined top_k results
@@ -975,11 +1047,46 @@ class UnifiedRAGSystem:
         print(f"   Retrieving combined top {top_k} results")
         print("-" * 80)
         
+        # Embed once and reuse the vector for both containers
+        if query_embedding is None:
+            try:
+                query_embedding = self.generate_embedding(query)
+            except Exception:
+                return {'customers': [], 'policies': []}
+        
         # Get more candidates from each to ensure we have enough for selection
         candidate_multiplier = 3
-        customer_results = self.search_customers(query, top_k * candidate_multiplier)
-        policy_results = self.search_policies(query, top_k * candidate_multiplier)
+        # Query both containers concurrently; a slow source degrades to no results
+        source_results = run_parallel_searches({
+            'customers': lambda: self.search_customers(query, top_k * candidate_multiplier, query_embedding),
+            'policies': lambda: self.search_policies(query, top_k * candidate_multiplier, query_embedding)
+        })
+        customer_results = source_results['customers']
+        policy_results = source_results['policies']
+        
+        results = self._merge_results(customer_results, policy_results, top_k)
+        print(f"✓ Combined results: {len(results['customers'])} customers + {len(results['policies'])} policies = "
+              f"{len(results['customers']) + len(results['policies'])} total")
+        
+        return results
+    
+    @staticmethod
+    def _merge_results(
+        customer_results: List[Dict[str, Any]],
+        policy_results: List[Dict[str, Any]],
+        top_k: int
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Combine per-source results into the top_k by normalized similarity score
         
+        Args:
+            customer_results: Customer search results
+            policy_results: Policy search results
+            top_k: Total number of results to keep
+            
+        Returns:
+            Dictionary with 'customers' and 'policies' keys
+        """
         # Normalize scores within each category to make them comparable
         # For distance metrics, lower is better, so we normalize to 0-1 range
         
@@ -1029,8 +1136,6 @@ class UnifiedRAGSystem:
             policy.pop('result_type', None)
             policy.pop('normalized_score', None)
         
-        print(f"✓ Combined results: {len(final_customers)} customers + {len(final_policies)} policies = {len(top_results)} total")
-        
         results = {
             'customers': final_customers,
             'policies': final_policies
@@ -1042,17 +1147,55 @@ class UnifiedRAGSystem:
     # INTELLIGENT QUERY ROUTING
     # ========================================================================
     
-    def intelligent_search(self, query: str, top_k: int = 5) -> Dict[str, Any]:
+    def intelligent_search(
+        self,
+        query: str,
+        top_k: int = 5,
+        query_embedding: Optional[List[float]] = None
+    ) -> Dict[str, Any]:
         """
         Intelligently route query to appropriate search based on keywords
         
         Args:
             query: Natural language query
             top_k: Number of results to return
+            query_embedding: Precomputed embedding of query (generated if None)
             
         Returns:
             Dictionary with search results and metadata
         """
+        result = {
+            'query': query,
+            'search_type': None,
+            'customers': [],
+            'policies': []
+        }
+        
+        # Route based on keywords
+        result['search_type'] = self._route_query(query)
+        if result['search_type'] == 'customer':
+            result['customers'] = self.search_customers(query, top_k, query_embedding)
+        elif result['search_type'] == 'policy':
+            result['policies'] = self.search_policies(query, top_k, query_embedding)
+        else:
+            # Search both if ambiguous or contains both types
+            unified_results = self.unified_search(query, top_k, query_embedding)
+            result['customers'] = unified_results['customers']
+            result['policies'] = unified_results['policies']
+        
+        return result
+    
+    @staticmethod
+    def _route_query(query: str) -> str:
+        """
+        Pick the source(s) a query is about from its keywords
+        
+        Args:
+            query: Natural language query
+            
+        Returns:
+            'customer', 'policy', or 'unified' when ambiguous or both
+        """
         query_lower = query.lower()
         
         # Customer-related keywords
@@ -1069,28 +1212,11 @@ class UnifiedRAGSystem:
         has_customer_keywords = any(keyword in query_lower for keyword in customer_keywords)
         has_policy_keywords = any(keyword in query_lower for keyword in policy_keywords)
         
-        result = {
-            'query': query,
-            'search_type': None,
-            'customers': [],
-            'policies': []
-        }
-        
-        # Route based on keywords
         if has_customer_keywords and not has_policy_keywords:
-            result['search_type'] = 'customer'
-            result['customers'] = self.search_customers(query, top_k)
-        elif has_policy_keywords and not has_customer_keywords:
-            result['search_type'] = 'policy'
-            result['policies'] = self.search_policies(query, top_k)
-        else:
-            # Search both if ambiguous or contains both types
-            result['search_type'] = 'unified'
-            unified_results = self.unified_search(query, top_k)
-            result['customers'] = unified_results['customers']
-            result['policies'] = unified_results['policies']
-        
-        return result
+            return 'customer'
+        if has_policy_keywords and not has_customer_keywords:
+            return 'policy'
+        return 'unified'
     
     # ========================================================================
     # CUSTOMER + POLICY COMBINED SEARCH
@@ -1109,38 +1235,16 @@ class UnifiedRAGSystem:
         try:
             print(f"\n🔍 Retrieving customer and policies for: {customer_id}")
             
-            # Get customer details
-            customer_query = "SELECT * FROM c WHERE c.customer_id = @customer_id"
-            customer_params = [{"name": "@customer_id", "value": customer_id}]
+            # Get customer details (single partition when keyed by customer_id)
+            customer = self.customer_lookup.get_one('customer_id', customer_id)
             
-            customers = list(self.customer_container.query_items(
-                query=customer_query,
-                parameters=customer_params,
-                enable_cross_partition_query=True
-            ))
-            
-            if not customers:
+            if not customer:
                 print(f"❌ Customer {customer_id} not found")
                 return None
             
-            customer = customers[0]
-            if 'embedding' in customer:
-                del customer['embedding']
-            
-            # Get all policies for this customer
-            policy_query = "SELECT * FROM c WHERE c.customer_id = @customer_id"
-            policy_params = [{"name": "@customer_id", "value": customer_id}]
-            
-            policies = list(self.policy_container.query_items(
-                query=policy_query,
-                parameters=policy_params,
-                enable_cross_partition_query=True
-            ))
-            
-            # Remove embeddings from policies
-            for policy in policies:
-                if 'embedding' in policy:
-                    del policy['embedding']
+            # Get all policies for this customer (single partition when keyed by customer_id).
+            # Both lookups project away the embedding, so vectors never leave Cosmos.
+            policies = self.policy_lookup.get_all('customer_id', customer_id)
             
             result = {
                 'customer': customer,
@@ -1176,8 +1280,12 @@ class UnifiedRAGSystem:
         print(f"Query: {query}")
         print("-" * 80)
         
-        # Step 1: Intelligent routing and retrieval
-        results = self.intelligent_search(query, max_results)
+        # Step 1: Embed the query once, then route and retrieve with that vector
+        try:
+            query_embedding = self.generate_embedding(query)
+        except Exception:
+            query_embedding = None
+        results = self.intelligent_search(query, max_results, query_embedding)
         
         # Step 2: Format context
         context = self._format_context(results)
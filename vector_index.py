@@ -0,0 +1,479 @@
+"""
+vector_index.py - Local in-process ANN index over customer/policy embeddings
+IVF (inverted file) index built from a container's embedding field, persisted
+to disk so searches rank locally and only fetch the final top_k documents
+
+Build an index (reads <PREFIX>_ENDPOINT/_KEY/_DATABASE_NAME/_CONTAINER_NAME):
+    python vector_index.py COSMOS_ret customer_id .cache/customers.ivf.npz
+    python vector_index.py COSMOS_pol policy_id .cache/policies.ivf.npz
+"""
+
+import os
+import argparse
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from projections import select_fields
+from change_feed_sync import index_checkpoint_path
+
+load_dotenv()
+
+# Configuration
+# Number of IVF lists probed per query (higher = better recall, slower)
+VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "16"))
+# Number of IVF lists (0 = sqrt of the corpus size)
+VECTOR_INDEX_NLIST = int(os.getenv("VECTOR_INDEX_NLIST", "0"))
+VECTOR_INDEX_KMEANS_ITERATIONS = int(os.getenv("VECTOR_INDEX_KMEANS_ITERATIONS", "10"))
+# Vectors sampled to train the centroids
+VECTOR_INDEX_TRAINING_SAMPLE = int(os.getenv("VECTOR_INDEX_TRAINING_SAMPLE", "50000"))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows so inner product equals cosine similarity"""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class IVFIndex:
+    """
+    Inverted-file ANN index with cosine similarity
+
+    Vectors are clustered around `nlist` k-means centroids; a query scores only
+    the vectors in its `nprobe` nearest lists. Scores are cosine similarities
+    (higher is more similar), the same values VectorDistance returns for the
+    containers' cosine vector policy, so callers see unchanged score semantics.
+    """
+
+    def __init__(
+        self,
+        id_field: str,
+        ids: np.ndarray,
+        vectors: np.ndarray,
+        centroids: np.ndarray,
+        assignments: np.ndarray,
+        alive: Optional[np.ndarray] = None,
+        nprobe: int = VECTOR_INDEX_NPROBE
+    ):
+        """
+        Args:
+            id_field: Document field the ids refer to (e.g. 'customer_id')
+            ids: Document ids, one per row of vectors
+            vectors: Normalized float32 embeddings
+            centroids: Normalized IVF centroids
+            assignments: List number of each row
+            alive: Rows still present (removed rows are masked, not compacted)
+            nprobe: Lists probed per query
+        """
+        self.id_field = id_field
+        self.ids = ids.astype(str)
+        self.vectors = vectors.astype(np.float32, copy=False)
+        self.centroids = centroids.astype(np.float32, copy=False)
+        self.assignments = assignments.astype(np.int32, copy=False)
+        self.alive = alive if alive is not None else np.ones(len(self.ids), dtype=bool)
+        self.nprobe = max(1, nprobe)
+        self.id_to_row = {str(doc_id): row for row, doc_id in enumerate(self.ids) if self.alive[row]}
+        # File the index was loaded from; flush() writes changes back to it
+        self.path: Optional[str] = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.id_to_row)
+
+    @property
+    def dimension(self) -> int:
+        return self.vectors.shape[1]
+
+    @property
+    def checkpoint_path(self) -> Optional[str]:
+        """Change feed checkpoint of the index file (None until loaded)"""
+        return index_checkpoint_path(self.path) if self.path else None
+
+    # ========================================================================
+    # BUILD
+    # ========================================================================
+
+    @classmethod
+    def build(
+        cls,
+        id_field: str,
+        ids: List[str],
+        vectors: List[List[float]],
+        nlist: int = VECTOR_INDEX_NLIST,
+        nprobe: int = VECTOR_INDEX_NPROBE,
+        iterations: int = VECTOR_INDEX_KMEANS_ITERATIONS,
+        seed: int = 0
+    ) -> "IVFIndex":
+        """
+        Train centroids with spherical k-means and assign every vector
+
+        Args:
+            id_field: Document field the ids refer to
+            ids: Document ids
+            vectors: Embeddings in the same order as ids
+            nlist: Number of lists (0 = sqrt of the corpus size)
+            nprobe: Lists probed per query
+            iterations: k-means iterations
+            seed: Random seed for sampling and initialization
+
+        Returns:
+            The built index
+        """
+        matrix = _normalize(np.asarray(vectors, dtype=np.float32))
+        count = len(matrix)
+        if count == 0:
+            raise ValueError("Cannot build a vector index from an empty corpus")
+
+        if nlist <= 0:
+            nlist = int(np.sqrt(count))
+        nlist = max(1, min(nlist, count))
+
+        rng = np.random.default_rng(seed)
+        sample_size = min(count, max(nlist, VECTOR_INDEX_TRAINING_SAMPLE))
+        sample = matrix[rng.choice(count, sample_size, replace=False)]
+
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for list_no in range(nlist):
+                members = sample[labels == list_no]
+                if len(members):
+                    centroids[list_no] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+
+        assignments = np.argmax(matrix @ centroids.T, axis=1)
+        return cls(id_field, np.asarray(ids), matrix, centroids, assignments, nprobe=nprobe)
+
+    # ========================================================================
+    # SEARCH
+    # ========================================================================
+
+    def search(self, query_embedding: List[float], top_k: int = 5) -> List[Tuple[str, float]]:
+        """
+        Approximate nearest neighbours of a query embedding
+
+        Args:
+            query_embedding: Query vector (same model/dimension as the index)
+            top_k: Number of hits to return
+
+        Returns:
+            (id, cosine similarity) pairs, most similar first
+        """
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+
+        with self._lock:
+            nprobe = min(self.nprobe, len(self.centroids))
+            probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+            rows = np.nonzero(np.isin(self.assignments, probe) & self.alive)[0]
+            if len(rows) == 0:
+                return []
+
+            scores = self.vectors[rows] @ query
+            k = min(top_k, len(rows))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            return [(str(self.ids[rows[i]]), float(scores[i])) for i in best]
+
+    def search_documents(
+        self,
+        container,
+        query_embedding: List[float],
+        top_k: int,
+        fields: List[str],
+        score_field: str
+    ) -> List[Dict[str, Any]]:
+        """
+        Rank locally, then fetch only the top_k documents from Cosmos DB
+
+        Args:
+            container: Container the index was built from
+            query_embedding: Query vector
+            top_k: Number of documents to return
+            fields: Fields to project (embedding excluded)
+            score_field: Result key for the similarity (e.g. 'similarity_score')
+
+        Returns:
+            Documents in rank order with score_field set, like the
+            VectorDistance query results they replace
+        """
+        hits = self.search(query_embedding, top_k)
+        return fetch_ranked_documents(container, self.id_field, hits, fields, score_field)
+
+    # ========================================================================
+    # UPDATES
+    # ========================================================================
+
+    def add(self, doc_id: str, embedding: List[float]):
+        """Insert or replace one document's vector, assigned to its nearest list"""
+        self.add_many([doc_id], [embedding])
+
+    def add_many(self, doc_ids: List[str], embeddings: List[List[float]]):
+        """Insert or replace many vectors, growing the arrays once per call"""
+        if not doc_ids:
+            return
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        lists = np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+        with self._lock:
+            new_ids, new_rows, pending = [], [], {}
+            for doc_id, vector, list_no in zip(map(str, doc_ids), vectors, lists):
+                old_row = self.id_to_row.get(doc_id)
+                if old_row is not None:
+                    self.vectors[old_row] = vector
+                    self.assignments[old_row] = list_no
+                elif doc_id in pending:
+                    new_rows[pending[doc_id]] = (vector, list_no)
+                else:
+                    pending[doc_id] = len(new_ids)
+                    new_ids.append(doc_id)
+                    new_rows.append((vector, list_no))
+
+            for position, doc_id in enumerate(new_ids):
+                self.id_to_row[doc_id] = len(self.ids) + position
+
+            if new_ids:
+                self.ids = np.concatenate([self.ids, np.asarray(new_ids).astype(str)])
+                self.vectors = np.vstack([self.vectors, np.stack([v for v, _ in new_rows])])
+                self.assignments = np.concatenate([self.assignments, np.array([l for _, l in new_rows], dtype=np.int32)])
+                self.alive = np.concatenate([self.alive, np.ones(len(new_ids), dtype=bool)])
+            self._dirty = True
+
+    def remove(self, doc_id: str) -> bool:
+        """Mask a document out of the index; returns False if it was not indexed"""
+        with self._lock:
+            row = self.id_to_row.pop(doc_id, None)
+            if row is None:
+                return False
+            self.alive[row] = False
+            self._dirty = True
+            return True
+
+    def apply_changes(self, documents: List[Dict[str, Any]]):
+        """Upsert changed documents from the change feed (change_feed_sync consumer)"""
+        doc_ids, embeddings = [], []
+        for document in documents:
+            doc_id = document.get(self.id_field)
+            embedding = document.get("embedding")
+            if doc_id is None or not embedding:
+                continue
+            if len(embedding) != self.dimension:
+                print(f"⚠️  Skipping {self.id_field} {doc_id}: embedding dimension {len(embedding)} != {self.dimension}")
+                continue
+            doc_ids.append(str(doc_id))
+            embeddings.append(embedding)
+        self.add_many(doc_ids, embeddings)
+
+    def flush(self):
+        """Write pending changes back to the file the index was loaded from"""
+        if self.path and self._dirty:
+            self.save(self.path)
+
+    # ========================================================================
+    # PERSISTENCE
+    # ========================================================================
+
+    def save(self, path: str):
+        """Write the index to an .npz file"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        with self._lock:
+            # Write next to the target and swap, so readers never see a partial file
+            tmp_path = path + ".tmp.npz"
+            np.savez(
+                tmp_path,
+                id_field=np.array(self.id_field),
+                ids=self.ids,
+                vectors=self.vectors,
+                centroids=self.centroids,
+                assignments=self.assignments,
+                alive=self.alive,
+                nprobe=np.array(self.nprobe)
+            )
+            os.replace(tmp_path, path)
+            self._dirty = False
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        """Read an index written by save()"""
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(
+                str(data["id_field"]),
+                data["ids"],
+                data["vectors"],
+                data["centroids"],
+                data["assignments"],
+                alive=data["alive"].copy(),
+                nprobe=int(data["nprobe"])
+            )
+        index.path = path
+        return index
+
+
+def vector_search_query(fields: List[str], query_embedding: List[float], top_k: int, score_field: str):
+    """VectorDistance top_k query (and parameters) projecting fields, best first"""
+    query = f"""
+    SELECT TOP @top_k {select_fields(fields)},
+        VectorDistance(c.embedding, @embedding) AS {score_field}
+    FROM c
+    ORDER BY VectorDistance(c.embedding, @embedding)
+    """
+    parameters = [
+        {"name": "@top_k", "value": top_k},
+        {"name": "@embedding", "value": query_embedding}
+    ]
+    return query, parameters
+
+
+def ranked_documents_query(id_field: str, hits: List[Tuple[str, float]], fields: List[str]):
+    """Query (and parameters) reading the documents of ranked hits in one round-trip"""
+    query = f"SELECT {select_fields(fields)} FROM c WHERE ARRAY_CONTAINS(@ids, c.{id_field})"
+    parameters = [{"name": "@ids", "value": [doc_id for doc_id, _ in hits]}]
+    return query, parameters
+
+
+def order_ranked_documents(
+    items,
+    id_field: str,
+    hits: List[Tuple[str, float]],
+    score_field: str
+) -> List[Dict[str, Any]]:
+    """Put fetched documents in hit order with score_field set (missing ids are skipped)"""
+    documents = {}
+    for item in items:
+        documents.setdefault(item.get(id_field), item)
+
+    results = []
+    for doc_id, score in hits:
+        document = documents.get(doc_id)
+        if document is not None:
+            document[score_field] = score
+            results.append(document)
+    return results
+
+
+def fetch_ranked_documents(
+    container,
+    id_field: str,
+    hits: List[Tuple[str, float]],
+    fields: List[str],
+    score_field: str
+) -> List[Dict[str, Any]]:
+    """
+    Fetch the documents for ranked (id, score) hits in one query
+
+    Args:
+        container: Cosmos DB container client
+        id_field: Field the hit ids refer to
+        hits: (id, score) pairs in rank order
+        fields: Fields to project
+        score_field: Result key for the score
+
+    Returns:
+        Documents in hit order with score_field set (ids no longer in the
+        container are skipped)
+    """
+    if not hits:
+        return []
+
+    query, parameters = ranked_documents_query(id_field, hits, fields)
+    items = container.query_items(
+        query=query,
+        parameters=parameters,
+        enable_cross_partition_query=True
+    )
+    return order_ranked_documents(items, id_field, hits, score_field)
+
+
+_indexes: Dict[str, Any] = {}
+_indexes_lock = threading.Lock()
+
+
+def load_vector_index(path: Optional[str]):
+    """
+    Return the process-wide index stored at path
+
+    Loaded once per path and shared by every retriever and RAG system (and
+    Streamlit session). A .json path is an exact, memory-mapped store built
+    by exact_vector_store.py (searched through int8/PQ codes when
+    VECTOR_QUANTIZATION is set); anything else is an IVF index, which always
+    scores full-precision vectors (a warning is printed if VECTOR_QUANTIZATION
+    is set for one). Returns None when no path is configured or the file does
+    not exist, in which case callers keep using Cosmos DB vector search.
+    """
+    if not path:
+        return None
+
+    with _indexes_lock:
+        if path not in _indexes:
+            index = None
+            if os.path.exists(path):
+                try:
+                    if path.endswith(".json"):
+                        from exact_vector_store import ExactVectorStore
+                        from quantization import QuantizedVectorStore, VECTOR_QUANTIZATION
+                        if VECTOR_QUANTIZATION == "none":
+                            index = ExactVectorStore(path)
+                        else:
+                            index = QuantizedVectorStore(path, VECTOR_QUANTIZATION)
+                    else:
+                        from quantization import VECTOR_QUANTIZATION
+                        if VECTOR_QUANTIZATION != "none":
+                            print(f"⚠️  VECTOR_QUANTIZATION={VECTOR_QUANTIZATION} only applies to exact (.json) "
+                                  f"stores; IVF index {path} is searched at full precision")
+                        index = IVFIndex.load(path)
+                    print(f"✓ Loaded vector index {path} ({len(index)} vectors)")
+                except Exception as e:
+                    print(f"⚠️  Could not load vector index {path}, using Cosmos DB vector search: {e}")
+            else:
+                print(f"⚠️  Vector index {path} not found, using Cosmos DB vector search")
+            _indexes[path] = index
+        return _indexes[path]
+
+
+def build_from_container(container, id_field: str, **kwargs) -> IVFIndex:
+    """Read every (id, embedding) pair from a container and build an index"""
+    query = f"SELECT c.{id_field}, c.embedding FROM c WHERE IS_DEFINED(c.embedding)"
+
+    ids, vectors = [], []
+    for item in container.query_items(query=query, enable_cross_partition_query=True):
+        if item.get(id_field) is not None and item.get("embedding"):
+            ids.append(str(item[id_field]))
+            vectors.append(item["embedding"])
+
+    return IVFIndex.build(id_field, ids, vectors, **kwargs)
+
+
+def main():
+    """Build an index from a container and save it"""
+    from client_registry import get_container
+    from change_feed_sync import CosmosChangeFeedSource, save_checkpoint
+
+    parser = argparse.ArgumentParser(description="Build a local vector index from a Cosmos DB container")
+    parser.add_argument("prefix", help="Environment prefix of the container settings, e.g. COSMOS_ret")
+    parser.add_argument("id_field", help="Document id field, e.g. customer_id or policy_id")
+    parser.add_argument("output", help="Path of the .npz index to write")
+    parser.add_argument("--nlist", type=int, default=VECTOR_INDEX_NLIST)
+    parser.add_argument("--nprobe", type=int, default=VECTOR_INDEX_NPROBE)
+    args = parser.parse_args()
+
+    container = get_container(args.prefix)
+
+    # Record the feed position before scanning; changes made during the scan
+    # are replayed by the change feed sync (upserts, so replays are harmless)
+    token = CosmosChangeFeedSource(container).current_token()
+
+    print(f"Building vector index from {args.prefix} container...")
+    index = build_from_container(container, args.id_field, nlist=args.nlist, nprobe=args.nprobe)
+    index.save(args.output)
+    save_checkpoint(args.prefix, token, index_checkpoint_path(args.output))
+    print(f"✓ Saved {len(index)} vectors in {len(index.centroids)} lists to {args.output}")
+
+
+if __name__ == "__main__":
+    main()